@@ -1,5 +1,6 @@
 import json
 import tornado.web
+from tornado.ioloop import IOLoop
 from tools.interesting_fields_builder import InterestingFieldsBuilder
 from tools.interesting_fields_loader import InterestingFieldsLoader
 from typing import Dict
@@ -50,8 +51,8 @@ class GetInterestingFields(tornado.web.RequestHandler):
                                              default=str))
             to_time = int(to_time)
         try:
-            data = self.loader.load_data(cid, from_time, to_time)
-            interesting_fields = self.builder.get_interesting_fields(data)
+            counts = await IOLoop.current().run_in_executor(None, self.loader.load_counts, cid, from_time, to_time)
+            interesting_fields = self.builder.get_interesting_fields_from_counts(counts)
         except tornado.web.HTTPError as e:
             return self.write(json.dumps({'status': 'failed', 'error': e}, default=str))
         except Exception as e:
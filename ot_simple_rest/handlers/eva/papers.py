@@ -16,6 +16,7 @@ import tornado.web
 import tornado.httputil
 
 from handlers.eva.base import BaseHandler
+from utils.cache_manifest import get_manifest
 
 __author__ = "Fedor Metelkin"
 __copyright__ = "Copyright 2020, ISG Neuro"
@@ -295,7 +296,7 @@ class PaperHandler(BaseHandler): # метод который изменит фа
       body = []
       try:   # попробуем
         path_to_cache_dir = os.path.join(self.data_path, f'search_{cid}.cache/data') #  получить путь до файла, и если удалось
-        file_names = [file_name for file_name in os.listdir(path_to_cache_dir) if file_name[-5:] == '.json'] # то берем все файлы с разрешением json
+        file_names = [part['name'] for part in get_manifest(path_to_cache_dir)['parts']] # то берем все файлы с разрешением json из манифеста кэша
         for file_name in file_names:
             with open(os.path.join(path_to_cache_dir, file_name)) as fr: # открываем его для прочтения
                 for i, line in enumerate(fr):
@@ -2,6 +2,7 @@ import json
 from notifications.checker import NotificationChecker
 from notifications.handlers import LimitedDataNotification
 import tornado.web
+from tornado.ioloop import IOLoop
 from tools.timelines_builder import TimelinesBuilder
 from tools.timelines_loader import TimelinesLoader
 from typing import Dict
@@ -18,9 +19,9 @@ __status__ = "Dev"
 
 class GetTimelines(tornado.web.RequestHandler):
     """
-    Returns a list of 4 timelines. Every timeline has 50 objects. One object is a pair (time, value) and represents
-    a time interval.
-    :time: - unix timestamp
+    Returns a list of 4 timelines. One object of a timeline is a pair (time, value) and represents a time interval,
+    there are objects only for intervals with events.
+    :time: - unix timestamp of the beginning of the interval
     :value: - how many events happened during the time interval
 
     Timelines differ by their time interval:
@@ -28,6 +29,17 @@ class GetTimelines(tornado.web.RequestHandler):
     2nd - 1 hour
     3rd - 1 day
     4th - 1 month
+
+    With interval argument only one timeline is returned, its interval is one of TimelinesBuilder.INTERVALS:
+    minutes, 5minutes, 15minutes, hours, days, weeks or months. Timelines are made of minutes histogram
+    of cache (see TimelinesLoader.load_minutes).
+
+    With max_points argument one timeline with at most max_points objects is returned. Its interval is the finest
+    one of TimelinesBuilder.INTERVALS, not finer than interval argument (minutes by default), whose timeline fits.
+    If even the months timeline doesn't fit, adjacent months are merged into intervals of N months named
+    '<N>months' (see TimelinesBuilder.get_fitting_timeline). The response has the name of the chosen interval:
+    {"interval": "15minutes", "timeline": [{"time": ..., "value": ...}, ...]}
+    {"interval": "3months", "timeline": [{"time": ..., "value": ...}, ...]}
     """
 
     def initialize(self, mem_conf: Dict, static_conf: Dict, notification_conf: Dict):
@@ -40,21 +52,25 @@ class GetTimelines(tornado.web.RequestHandler):
         interval = params.get('interval')
         if interval:  # field is optional, by default all 4 timelines are returned
             interval = interval[0].decode()
-        is_one_timeline: bool = interval and interval in {'minutes', 'hours', 'days', 'months'}
+        is_one_timeline: bool = interval and interval in self.builder.INTERVALS
+        max_points = params.get('max_points')
+        if max_points:
+            max_points = max_points[0].decode()
+            if not max_points.isdigit() or not int(max_points):
+                return self.write(json.dumps({'status': 'failed',
+                                              'error': f'max_points: {max_points} not a positive number'}))
+            max_points = int(max_points)
 
         try:
-            data = self.loader.load_data(cid)
-            if is_one_timeline:
-                if interval == 'minutes':
-                    response = self.builder.get_minutes_timeline(data)
-                elif interval == 'hours':
-                    response = self.builder.get_hours_timeline(data)
-                elif interval == 'days':
-                    response = self.builder.get_days_timeline(data)
-                else:
-                    response = self.builder.get_months_timeline(data)
+            minutes, counts = await IOLoop.current().run_in_executor(None, self.loader.load_minutes, cid)
+            if max_points:
+                interval, timeline = self.builder.get_fitting_timeline(minutes, counts, max_points,
+                                                                       interval if is_one_timeline else 'minutes')
+                response = {'interval': interval, 'timeline': timeline}
+            elif is_one_timeline:
+                response = self.builder.get_timeline_from_minutes(minutes, counts, interval)
             else:
-                response = self.builder.get_all_timelines(data)
+                response = self.builder.get_all_timelines_from_minutes(minutes, counts)
         except tornado.web.HTTPError as e:
             return self.write(json.dumps({'status': 'failed', 'error': e}, default=str))
         except KeyError:
@@ -1,6 +1,8 @@
 import json
 import logging
 import uuid
+from types import SimpleNamespace
+
 import tornado.web
 
 from notifications.checker import NotificationChecker
@@ -26,6 +28,9 @@ class CheckJob(tornado.web.RequestHandler):
     3. Check Job's status and return it to OT.Simple OTP app if it is not still ready.
     4. Load results of Job from cache for transcending.
     5. Return Job's status or results.
+
+    Long poll: if "wait" argument is given, response is delayed till Job's status differs from "status" argument
+    (status known by client) or "wait" seconds pass.
     """
 
     def initialize(self, manager, notification_conf, db_conn_pool):
@@ -39,7 +44,8 @@ class CheckJob(tornado.web.RequestHandler):
         self.handler_id = str(uuid.uuid4())
         self.jobs_manager = manager
         self.logger = logging.getLogger('osr_hid')
-        self.notification_checker = NotificationChecker([TooManyJobsNotification(db_conn_pool, notification_conf),
+        self.notification_checker = NotificationChecker([TooManyJobsNotification(db_conn_pool, notification_conf,
+                                                                                 manager.get_running_jobs_num),
                                                          LimitedDataNotification(notification_conf)])
 
     def write_error(self, status_code: int, **kwargs) -> None:
@@ -64,7 +70,13 @@ class CheckJob(tornado.web.RequestHandler):
     async def _check_job(self):
         try:
             self.logger.debug('Started check_job...', extra={'hid': self.handler_id})
-            response = self.jobs_manager.check_job(hid=self.handler_id, request=self.request)
+            wait = self.request.arguments.get('wait')
+            if wait:
+                status = self.request.arguments.get('status', [b''])[0].decode() or None
+                response = await self.jobs_manager.watch_job(hid=self.handler_id, request=self.request,
+                                                             status=status, timeout=float(wait[0]))
+            else:
+                response = await self.jobs_manager.check_job(hid=self.handler_id, request=self.request)
             self.logger.debug(f'Success checked job with response: {response}.', extra={'hid': self.handler_id})
             self.logger.debug('Started notification_checker...', extra={'hid': self.handler_id})
             notifications = self.notification_checker.check_notifications(**response)
@@ -95,3 +107,41 @@ class CheckJob(tornado.web.RequestHandler):
         kwargs = {k: (str(v).encode(),) for k, v in kwargs.items()}
         self.request.arguments = kwargs
         await self._check_job()
+
+
+class CheckJobs(CheckJob):
+    """
+    Batch of CheckJob for dashboards with many searches. Dispatcher's heartbeat is checked once and statuses
+    of all Jobs are got by one query.
+
+    Request body: {"jobs": [{<checkjob arguments>}, ...], <checkjob arguments common for all jobs>}
+    Response: {"status": "success", "results": [<checkjob response>, ...]} in the order of jobs.
+    """
+
+    SUPPORTED_METHODS = ('POST',)
+
+    async def post(self):
+        """
+        It writes response to remote side.
+        """
+        try:
+            body = json.loads(self.request.body.decode())
+            common_arguments = {k: v for k, v in body.items() if k != 'jobs'}
+            requests = []
+            for job in body['jobs']:
+                arguments = {k: (str(v).encode(),) for k, v in {**common_arguments, **job}.items()}
+                requests.append(SimpleNamespace(arguments=arguments, body_arguments=arguments,
+                                                remote_ip=self.request.remote_ip))
+
+            results = await self.jobs_manager.check_jobs(hid=self.handler_id, requests=requests)
+            for result in results:
+                notifications = self.notification_checker.check_notifications(**result)
+                if notifications:
+                    result['notifications'] = notifications
+        except Exception as e:
+            error = {'status': 'error', 'msg': str(e)}
+            self.logger.error(f"CheckJobs RESPONSE: {error}", extra={'hid': self.handler_id})
+            return self.write(error)
+        response = {'status': 'success', 'results': results}
+        self.logger.debug(f'CheckJobs RESPONSE: {response}', extra={'hid': self.handler_id})
+        self.write(response)
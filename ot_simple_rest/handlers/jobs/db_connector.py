@@ -1,4 +1,4 @@
-from tools.pg_connector import PGConnector
+from tools.pg_connector import PGConnector, AsyncPGConnector
 from utils.hashes import hash512
 
 
@@ -6,20 +6,29 @@ __author__ = "Anton Khromov"
 __copyright__ = "Copyright 2019, Open Technologies 98"
 __credits__ = []
 __license__ = ""
-__version__ = "0.0.4"
+__version__ = "0.1.0"
 __maintainer__ = "Andrey Starchenkov"
 __email__ = "akhromov@ot.ru"
 __status__ = "Production"
 
 
+CHECK_JOBS_STATUS_QUERY = \
+    "SELECT DISTINCT ON (q.hashed_original_otl, q.tws, q.twf, q.field_extraction, q.preview) " \
+    "q.hashed_original_otl, q.tws, q.twf, q.field_extraction, q.preview, q.id, q.status, c.expiring_date, q.msg " \
+    "FROM OTLQueries q LEFT JOIN cachesdl c ON q.id = c.id " \
+    "WHERE (q.hashed_original_otl, q.tws, q.twf, q.field_extraction, q.preview) IN " \
+    "(SELECT * FROM unnest({}::VARCHAR[], {}::INTEGER[], {}::INTEGER[], {}::BOOLEAN[], {}::BOOLEAN[])) " \
+    "ORDER BY q.hashed_original_otl, q.tws, q.twf, q.field_extraction, q.preview, q.id DESC;"
+
+
 class PostgresConnector(PGConnector):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def check_cache(self, *, original_otl, tws, twf, field_extraction, preview):
         cache_id = creating_date = None
-        query_str = "SELECT id, extract(epoch from creating_date) FROM cachesdl WHERE original_otl=%s AND tws=%s AND twf=%s AND field_extraction=%s AND preview=%s;"
-        stm_tuple = (original_otl, tws, twf, field_extraction, preview)
+        query_str = "SELECT id, extract(epoch from creating_date) FROM cachesdl WHERE hashed_original_otl=%s AND tws=%s AND twf=%s AND field_extraction=%s AND preview=%s;"
+        stm_tuple = (hash512(original_otl), tws, twf, field_extraction, preview)
         self.logger.info(query_str % stm_tuple)
 
         cache_data = self.execute_query(query_str, params=stm_tuple)
@@ -30,8 +39,8 @@ class PostgresConnector(PGConnector):
     def check_running(self, *, original_otl, tws, twf, field_extraction, preview):
         job_id = creating_date = None
         query_str = "SELECT id, extract(epoch from creating_date) FROM OTLQueries WHERE status IN ('running', 'new') " \
-                    "AND original_otl=%s AND tws=%s AND twf=%s AND field_extraction=%s AND preview=%s;"
-        stm_tuple = (original_otl, tws, twf, field_extraction, preview)
+                    "AND hashed_original_otl=%s AND tws=%s AND twf=%s AND field_extraction=%s AND preview=%s;"
+        stm_tuple = (hash512(original_otl), tws, twf, field_extraction, preview)
         self.logger.info(query_str % stm_tuple)
 
         job_data = self.execute_query(query_str, params=stm_tuple)
@@ -60,8 +69,46 @@ class PostgresConnector(PGConnector):
             job_id, creating_date = job_data
         return job_id, creating_date
 
+    def register_job(self, *, search, subsearches, tws, twf, cache_ttl, username, field_extraction, preview,
+                     sid=None, remote_ip=None, original_otl=None):
+        """
+        Returns id of the same query Job with ready cache or of the running one, otherwise registers new Job
+        (and SID if it is given). All is made atomically by register_job DB function.
+        :return: Job's id, date of creating and registration kind: 'cache', 'running' or 'new'.
+        """
+        job_id = creating_date = registration = None
+        query_str = "SELECT job_id, creating_date, registration " \
+                    "FROM register_job(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s);"
+        stm_tuple = registration_params(search=search, subsearches=subsearches, tws=tws, twf=twf,
+                                        cache_ttl=cache_ttl, username=username, field_extraction=field_extraction,
+                                        preview=preview, sid=sid, remote_ip=remote_ip, original_otl=original_otl)
+        self.logger.info(query_str % stm_tuple)
+
+        job_data = self.execute_query(query_str, params=stm_tuple, with_commit=True)
+        if job_data:
+            job_id, creating_date, registration = job_data
+        return job_id, creating_date, registration
+
+    def register_jobs(self, registrations):
+        """
+        Registers Jobs as register_job does but all of them in one transaction.
+        :param registrations: list of register_job kwargs.
+        :return: list of (job_id, creating_date, registration) in the same order.
+        """
+        query_str = "SELECT job_id, creating_date, registration " \
+                    "FROM register_job(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s);"
+        results = [(None, None, None)] * len(registrations)
+        with self.transaction('register_jobs') as conn:
+            for i in registrations_order(registrations):
+                stm_tuple = registration_params(**registrations[i])
+                self.logger.info(query_str % stm_tuple)
+                job_data = self.execute_query(query_str, conn=conn, params=stm_tuple)
+                if job_data:
+                    results[i] = job_data
+        return results
+
     def add_sid(self, *, sid, remote_ip, original_otl):
-        query_str = "INSERT INTO GUISIDs (sid, src_ip, otl) VALUES (%s, %s, %s);"
+        query_str = "INSERT INTO GUISIDs (sid, src_ip, otl) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING;"
         stm_tuple = (sid, remote_ip, original_otl)
         self.logger.info(query_str % stm_tuple)
         self.execute_query(query_str, params=stm_tuple, with_commit=True, with_fetch=False)
@@ -105,9 +152,9 @@ class PostgresConnector(PGConnector):
     def check_job_status(self, *, original_otl, tws, twf, field_extraction, preview):
         query_str = "SELECT OTLQueries.id, OTLQueries.status, cachesdl.expiring_date, OTLQueries.msg " \
                     "FROM OTLQueries LEFT JOIN cachesdl ON OTLQueries.id = cachesdl.id " \
-                    "WHERE OTLQueries.original_otl=%s AND OTLQueries.tws=%s AND OTLQueries.twf=%s " \
+                    "WHERE OTLQueries.hashed_original_otl=%s AND OTLQueries.tws=%s AND OTLQueries.twf=%s " \
                     "AND OTLQueries.field_extraction=%s AND OTLQueries.preview=%s ORDER BY OTLQueries.id DESC LIMIT 1;"
-        stm_tuple = (original_otl, tws, twf, field_extraction, preview)
+        stm_tuple = (hash512(original_otl), tws, twf, field_extraction, preview)
         self.logger.info(query_str % stm_tuple)
 
         job_data = self.execute_query(query_str, params=stm_tuple)
@@ -115,6 +162,18 @@ class PostgresConnector(PGConnector):
             cid, status, expiring_date, msg = job_data
             return cid, status, expiring_date, msg
 
+    def check_jobs_status(self, *, keys):
+        """
+        Batch of check_job_status made by one query.
+        :param keys: list of Jobs' keys (see job_key).
+        :return: dict of key: (id, status, expiring_date, msg) of found Jobs.
+        """
+        stm_tuple = tuple(list(column) for column in zip(*keys))
+        self.logger.info(f'{CHECK_JOBS_STATUS_QUERY} {stm_tuple}')
+
+        jobs_data = self.execute_query(CHECK_JOBS_STATUS_QUERY.format(*['%s'] * 5), params=stm_tuple, fetchall=True)
+        return {tuple(job_data[:5]): tuple(job_data[5:]) for job_data in jobs_data or []}
+
     def clear_data_models(self):
         query_str = "DELETE FROM DataModels;"
         self.execute_query(query_str, with_commit=True, with_fetch=False)
@@ -136,3 +195,156 @@ class PostgresConnector(PGConnector):
     def get_running_jobs_num(self):
         query_str = "SELECT COUNT(*) FROM otlqueries WHERE status = 'running';"
         return self.execute_query(query_str)[0]
+
+
+def to_bool(value):
+    """
+    Converts OTL option value (e.g. field_extraction=true) to boolean. psycopg2 lets Postgres cast strings itself,
+    asyncpg requires real booleans.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ('t', 'true', 'y', 'yes', 'on', '1')
+    return bool(value)
+
+
+def job_key(original_otl, tws, twf, field_extraction, preview, hashed=False):
+    """
+    Key of the same query Jobs as it's stored in Dispatcher DB:
+    (hashed_original_otl, tws, twf, field_extraction, preview).
+    """
+    return (original_otl if hashed else hash512(original_otl), int(tws), int(twf),
+            to_bool(field_extraction), to_bool(preview))
+
+
+def registration_params(*, search, subsearches, tws, twf, cache_ttl, username, field_extraction, preview,
+                        sid=None, remote_ip=None, original_otl=None):
+    """
+    Converts register_job kwargs to params of register_job DB function.
+    """
+    return (search[0], search[1], subsearches, tws, twf, int(cache_ttl), username,
+            to_bool(field_extraction), to_bool(preview), sid, remote_ip, original_otl)
+
+
+def registrations_order(registrations):
+    """
+    Order of Jobs registration in one transaction. Advisory locks of the same Jobs are taken by concurrent
+    transactions in the same order, so they don't deadlock.
+    """
+    return sorted(range(len(registrations)), key=lambda i: (
+        hash512(registrations[i]['search'][0]), int(registrations[i]['tws']), int(registrations[i]['twf']),
+        to_bool(registrations[i]['field_extraction']), to_bool(registrations[i]['preview'])))
+
+
+class AsyncPostgresConnector(AsyncPGConnector):
+    """
+    Native async twin of PostgresConnector for the jobs pipeline. Methods have the same signatures and results
+    but have to be awaited.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    async def check_cache(self, *, original_otl, tws, twf, field_extraction, preview):
+        cache_id = creating_date = None
+        query_str = "SELECT id, extract(epoch from creating_date) FROM cachesdl WHERE hashed_original_otl=$1 AND tws=$2 " \
+                    "AND twf=$3 AND field_extraction=$4 AND preview=$5;"
+        stm_tuple = (hash512(original_otl), tws, twf, to_bool(field_extraction), to_bool(preview))
+        self.logger.info(f'{query_str} {stm_tuple}')
+
+        cache_data = await self.execute_query(query_str, params=stm_tuple)
+        if cache_data:
+            cache_id, creating_date = cache_data
+        return cache_id, creating_date
+
+    async def check_running(self, *, original_otl, tws, twf, field_extraction, preview):
+        job_id = creating_date = None
+        query_str = "SELECT id, extract(epoch from creating_date) FROM OTLQueries WHERE status IN ('running', 'new') " \
+                    "AND hashed_original_otl=$1 AND tws=$2 AND twf=$3 AND field_extraction=$4 AND preview=$5;"
+        stm_tuple = (hash512(original_otl), tws, twf, to_bool(field_extraction), to_bool(preview))
+        self.logger.info(f'{query_str} {stm_tuple}')
+
+        job_data = await self.execute_query(query_str, params=stm_tuple)
+        if job_data:
+            job_id, creating_date = job_data
+        return job_id, creating_date
+
+    async def add_job(self, *, search, subsearches, tws, twf, cache_ttl, username, field_extraction, preview):
+        job_id = creating_date = None
+        query_str = "INSERT INTO OTLQueries (original_otl, service_otl, subsearches, tws, twf, cache_ttl, username, " \
+                    "field_extraction, preview) VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9) RETURNING id, " \
+                    "extract(epoch from creating_date);"
+        stm_tuple = (search[0], search[1], subsearches, tws, twf, int(cache_ttl), username,
+                     to_bool(field_extraction), to_bool(preview))
+        self.logger.info(f'{query_str} {stm_tuple}')
+
+        job_data = await self.execute_query(query_str, params=stm_tuple)
+        if job_data:
+            job_id, creating_date = job_data
+        return job_id, creating_date
+
+    async def register_job(self, *, search, subsearches, tws, twf, cache_ttl, username, field_extraction, preview,
+                           sid=None, remote_ip=None, original_otl=None):
+        job_id = creating_date = registration = None
+        query_str = "SELECT job_id, creating_date, registration " \
+                    "FROM register_job($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,$12);"
+        stm_tuple = registration_params(search=search, subsearches=subsearches, tws=tws, twf=twf,
+                                        cache_ttl=cache_ttl, username=username, field_extraction=field_extraction,
+                                        preview=preview, sid=sid, remote_ip=remote_ip, original_otl=original_otl)
+        self.logger.info(f'{query_str} {stm_tuple}')
+
+        job_data = await self.execute_query(query_str, params=stm_tuple)
+        if job_data:
+            job_id, creating_date, registration = job_data
+        return job_id, creating_date, registration
+
+    async def register_jobs(self, registrations):
+        query_str = "SELECT job_id, creating_date, registration " \
+                    "FROM register_job($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,$12);"
+        results = [(None, None, None)] * len(registrations)
+        async with self.transaction('register_jobs') as conn:
+            for i in registrations_order(registrations):
+                stm_tuple = registration_params(**registrations[i])
+                self.logger.info(f'{query_str} {stm_tuple}')
+                job_data = await self.execute_query(query_str, conn=conn, params=stm_tuple)
+                if job_data:
+                    results[i] = job_data
+        return results
+
+    async def add_sid(self, *, sid, remote_ip, original_otl):
+        query_str = "INSERT INTO GUISIDs (sid, src_ip, otl) VALUES ($1, $2, $3) ON CONFLICT DO NOTHING;"
+        stm_tuple = (sid, remote_ip, original_otl)
+        self.logger.info(f'{query_str} {stm_tuple}')
+        await self.execute_query(query_str, params=stm_tuple, with_fetch=False)
+
+    async def check_dispatcher_status(self):
+        query_str = "SELECT (extract(epoch from CURRENT_TIMESTAMP) - extract(epoch from lastcheck)) as delta " \
+                    "from ticks ORDER BY lastcheck DESC LIMIT 1;"
+
+        time_delta = await self.execute_query(query_str)
+        if time_delta:
+            return time_delta[0]
+
+    async def check_job_status(self, *, original_otl, tws, twf, field_extraction, preview):
+        query_str = "SELECT OTLQueries.id, OTLQueries.status, cachesdl.expiring_date, OTLQueries.msg " \
+                    "FROM OTLQueries LEFT JOIN cachesdl ON OTLQueries.id = cachesdl.id " \
+                    "WHERE OTLQueries.hashed_original_otl=$1 AND OTLQueries.tws=$2 AND OTLQueries.twf=$3 " \
+                    "AND OTLQueries.field_extraction=$4 AND OTLQueries.preview=$5 ORDER BY OTLQueries.id DESC LIMIT 1;"
+        stm_tuple = (hash512(original_otl), tws, twf, to_bool(field_extraction), to_bool(preview))
+        self.logger.info(f'{query_str} {stm_tuple}')
+
+        job_data = await self.execute_query(query_str, params=stm_tuple)
+        if job_data:
+            cid, status, expiring_date, msg = job_data
+            return cid, status, expiring_date, msg
+
+    async def check_jobs_status(self, *, keys):
+        stm_tuple = tuple(list(column) for column in zip(*keys))
+        self.logger.info(f'{CHECK_JOBS_STATUS_QUERY} {stm_tuple}')
+
+        jobs_data = await self.execute_query(CHECK_JOBS_STATUS_QUERY.format('$1', '$2', '$3', '$4', '$5'),
+                                             params=stm_tuple, fetchall=True)
+        return {tuple(job_data[:5]): tuple(job_data[5:]) for job_data in jobs_data or []}
+
+    async def get_running_jobs_num(self):
+        query_str = "SELECT COUNT(*) FROM otlqueries WHERE status = 'running';"
+        return (await self.execute_query(query_str))[0]
@@ -1,8 +1,16 @@
 import os
-import logging
 import json
+import logging
 
 import tornado.web
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+
+from utils.cache_compression import EXTENSIONS, parse_encodings, choose_encoding, get_encoded_manifest, \
+    request_compression, DEFAULT_WORKERS as COMPRESSION_WORKERS
+from utils.cache_manifest import get_manifest, read_lines
+from utils.cache_stream import stream_cache, stream_chunks, send_raw_cache, iter_filtered_cache_chunks, \
+    make_event_filter, project_schema, DEFAULT_CHUNK_SIZE
 
 __author__ = "Anton Khromov"
 __copyright__ = "Copyright 2019, Open Technologies 98"
@@ -21,15 +29,35 @@ class GetResult(tornado.web.RequestHandler):
     1-st use-case: get result directly from disk with Tornado tools;
     2-nd use-case: get list of data urls for download (with nginx or something else);
 
+    Without nginx result is sent as JSON with escaped parts or with format=raw as NDJSON: manifest of parts
+    and then raw parts (see utils.cache_stream.send_raw_cache).
+
+    With offset or limit only the page of cache lines is returned (in both use-cases):
+    {"status": "success", "schema": <_SCHEMA>, "total": <lines of cache>, "offset": ..., "limit": ...,
+     "events": [<line>, ...]}
+
+    With fields (comma separated) and from/to (_time bounds, inclusive) result is filtered and projected
+    while it's streamed as JSON (in both use-cases), _SCHEMA has only the fields. Pages are projected to fields,
+    but they aren't filtered by time: offset or limit with from or to is answered with 400.
+
+    Compressed copies of cache (see utils.cache_compression) are made in background on the first request
+    accepting one of precompressed_encodings, then data urls and raw result use them.
+
     :method generate_data_links
     """
 
+    DEFAULT_PAGE_LIMIT = 100
+    MAX_PAGE_LIMIT = 10000
+
     def initialize(self, mem_conf, static_conf):
         self.mem_conf = mem_conf
         self.static_conf = static_conf
         self.data_path = self.mem_conf['path']
         self.base_url = self.static_conf['base_url']
         self.with_nginx = False if static_conf['use_nginx'] == 'False' else True
+        self.chunk_size = int(self.mem_conf.get('stream_chunk_size', DEFAULT_CHUNK_SIZE))
+        self.encodings = parse_encodings(self.mem_conf.get('precompressed_encodings', ''))
+        self.compression_workers = int(self.mem_conf.get('compression_workers', COMPRESSION_WORKERS))
 
         self.logger = logging.getLogger('osr')
         self._cache_name_template = 'search_{}.cache/data'
@@ -42,14 +70,29 @@ class GetResult(tornado.web.RequestHandler):
         """
         params = self.request.query_arguments
         cid = params.get('cid')[0].decode()
-        if self.with_nginx:
-            self.generate_data_links(cid)
+        response_format = params.get('format', [b'json'])[0].decode()
+        fields = params.get('fields', [b''])[0].decode()
+        fields = [field.strip() for field in fields.split(',') if field.strip()] or None
+        try:
+            from_time, to_time = (float(params[name][0]) if name in params else None for name in ('from', 'to'))
+        except ValueError:
+            return self.write({'status': 'failed', 'error': 'From and to must be numbers'})
+        if ('offset' in params or 'limit' in params) and (from_time is not None or to_time is not None):
+            self.set_status(400)
+            return self.write({'status': 'failed', 'error': 'Offset and limit can not be used with from and to'})
+        if 'offset' in params or 'limit' in params:
+            await self.send_page(cid, params.get('offset', [b'0'])[0].decode(),
+                                 params.get('limit', [str(self.DEFAULT_PAGE_LIMIT).encode()])[0].decode(), fields)
+        elif fields is not None or from_time is not None or to_time is not None:
+            await self.send_filtered(cid, fields, from_time, to_time)
+        elif self.with_nginx:
+            await self.generate_data_links(cid)
         else:
-            self.load_and_send_from_memcache(cid)
+            await self.load_and_send_from_memcache(cid, raw=response_format == 'raw')
 
-    def generate_data_links(self, cid):
+    async def generate_data_links(self, cid):
         """
-        Makes listing of directory with cache data and generate links
+        Takes listing of directory with cache data from its manifest and generate links
         for that data with url pattern.
 
         :param cid:         OT_Dispatcher's job cid
@@ -64,37 +107,118 @@ class GetResult(tornado.web.RequestHandler):
             # raise tornado.web.HTTPError(405, f'No cache with id={cid}')
 
         self.logger.debug('Cache with id={} exists'.format(cid))
-        listing = os.listdir(cache_full_path)
-        cache_list = [f for f in listing if f.endswith('.json') or 'SCHEMA' in f]
-        cache_list = [os.path.join(cache_dir, f) for f in cache_list]
+        encoding, manifest = await self.get_encoded_manifest(cache_full_path)
+        if manifest is None:
+            manifest = await IOLoop.current().run_in_executor(None, get_manifest, cache_full_path)
+        cache_list = [part['name'] for part in manifest['parts']]
+        if manifest['schema'] is not None:
+            cache_list.append('_SCHEMA')
+        extension = EXTENSIONS[encoding] if encoding else ''
+        cache_list = [os.path.join(cache_dir, f + extension) for f in cache_list]
         urls_list = [self.base_url.format(f) for f in cache_list]
         response = {"status": "success", "data_urls": urls_list}
+        if encoding:
+            response['content_encoding'] = encoding
         self.logger.debug(response)
         self.write(response)
 
-    def load_and_send_from_memcache(self, cid):
+    async def send_page(self, cid, offset, limit, fields=None):
+        """
+        Writes lines of cache from offset. Lines are found by sparse index of manifest, so only needed blocks
+        of parts are read.
+
+        :param cid:         OT_Dispatcher's job cid
+        :param offset:      number of the first line
+        :param limit:       max number of lines, it's limited by MAX_PAGE_LIMIT
+        :param fields:      list of fields of lines or None for all fields
+        :return:
+        """
+        cache_full_path = os.path.join(self.data_path, self._cache_name_template.format(cid))
+        if not os.path.exists(cache_full_path):
+            self.logger.error('No cache with id={}'.format(cid))
+            return self.write({'status': 'failed', 'error': 'No cache with id={}'.format(cid)})
+        try:
+            offset, limit = int(offset), min(int(limit), self.MAX_PAGE_LIMIT)
+            if offset < 0 or limit < 0:
+                raise ValueError
+        except ValueError:
+            return self.write({'status': 'failed', 'error': 'Offset and limit must be non-negative integers'})
+
+        loop = IOLoop.current()
+        manifest = await loop.run_in_executor(None, get_manifest, cache_full_path)
+        lines = await loop.run_in_executor(None, read_lines, cache_full_path, manifest, offset, limit)
+        self.logger.debug(f'Cache {cid} lines from {offset}: {len(lines)} of {manifest["lines"]}.')
+        if fields is not None:
+            event_filter = make_event_filter(fields)
+            lines = [event_filter(line).rstrip(b'\n') for line in lines if line.strip()]
+        response = {'status': 'success', 'schema': project_schema(manifest['schema'], fields),
+                    'total': manifest['lines'], 'offset': offset, 'limit': limit}
+        # Lines are JSON objects already, they are put into response as is.
+        events = b', '.join(line for line in lines if line.strip())
+        self.set_header('Content-Type', 'application/json; charset=UTF-8')
+        self.write(json.dumps(response)[:-1].encode() + b', "events": [' + events + b']}')
+
+    async def send_filtered(self, cid, fields, from_time, to_time):
+        """
+        Streams cache as JSON with events filtered by _time and projected to fields
+        (see utils.cache_stream.iter_filtered_cache_chunks).
+
+        :param cid:         OT_Dispatcher's job cid
+        :param fields:      list of fields or None for all fields
+        :param from_time:   min _time or None
+        :param to_time:     max _time or None
+        :return:
+        """
+        path_to_cache_dir = os.path.join(self.data_path, self._cache_name_template.format(cid))
+        if not os.path.exists(path_to_cache_dir):
+            self.logger.error('No cache with id={}'.format(cid))
+            return self.write({'status': 'failed', 'error': 'No cache with id={}'.format(cid)})
+        self.logger.debug(f'Started loading cache {cid} with fields {fields} from {from_time} to {to_time}.')
+        chunks = iter_filtered_cache_chunks(path_to_cache_dir, fields, from_time, to_time, self.chunk_size)
+        try:
+            written = await stream_chunks(self, chunks, self.chunk_size)
+        except StreamClosedError:
+            self.logger.warning(f'Client closed connection while loading cache {cid}.')
+            return
+        self.logger.debug(f'Filtered cache {cid} was sent: {written} bytes.')
+
+    async def get_encoded_manifest(self, path_to_cache_dir):
+        """
+        Chooses encoding of response by Accept-Encoding header and gets manifest with compressed copies of cache.
+        If they aren't ready yet, they are requested and response isn't compressed.
+
+        :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+        :return:                    encoding and manifest or (None, None)
+        """
+        encoding = choose_encoding(self.request.headers.get('Accept-Encoding'), self.encodings)
+        if encoding is None:
+            return None, None
+        self.set_header('Vary', 'Accept-Encoding')
+        manifest = await IOLoop.current().run_in_executor(None, get_encoded_manifest, path_to_cache_dir, encoding)
+        if manifest is None:
+            request_compression(path_to_cache_dir, encoding, self.compression_workers)
+            return None, None
+        return encoding, manifest
+
+    async def load_and_send_from_memcache(self, cid, raw=False):
         """
-        Makes listing of directory with cache data and read files
-        content. Then join chunks together and writes data in socket.
+        Streams cache data to socket by chunks of files content (see utils.cache_stream),
+        so response is not kept in memory.
 
         :param cid:         OT_Dispatcher's job cid
+        :param raw:         send parts as is after manifest instead of JSON
         :return:
         """
         self.logger.debug(f'Started loading cache {cid}.')
         path_to_cache_dir = os.path.join(self.data_path, self._cache_name_template.format(cid))
         self.logger.debug(f'Path to cache {path_to_cache_dir}.')
-        file_names = [file_name for file_name in os.listdir(path_to_cache_dir) if file_name[-5:] == '.json']
-        with open(os.path.join(path_to_cache_dir, "_SCHEMA")) as fr:
-            df_schema = fr.read()
-        self.write('{"status": "success", "schema": "%s", "events": {' % df_schema.strip())
-        length = len(file_names)
-        for i in range(length):
-            file_name = file_names[i]
-            self.logger.debug(f'Reading part: {file_name}')
-            self.write(f'"{file_name}": ')
-            with open(os.path.join(path_to_cache_dir, file_name)) as fr:
-                body = fr.read()
-            self.write(json.dumps(body))
-            if i != length - 1:
-                self.write(', ')
-        self.write('}}')
+        try:
+            if raw:
+                encoding, manifest = await self.get_encoded_manifest(path_to_cache_dir)
+                written = await send_raw_cache(self, path_to_cache_dir, self.chunk_size, encoding, manifest)
+            else:
+                written = await stream_cache(self, path_to_cache_dir, self.chunk_size)
+        except StreamClosedError:
+            self.logger.warning(f'Client closed connection while loading cache {cid}.')
+            return
+        self.logger.debug(f'Cache {cid} was sent: {written} bytes.')
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import uuid
+from types import SimpleNamespace
+
+import tornado.websocket
+
+from notifications.checker import NotificationChecker
+from notifications.handlers import TooManyJobsNotification, LimitedDataNotification
+
+__author__ = "Anton Khromov"
+__copyright__ = "Copyright 2019, Open Technologies 98"
+__credits__ = []
+__license__ = ""
+__version__ = "0.0.1"
+__maintainer__ = "Andrey Starchenkov"
+__email__ = "akhromov@ot.ru"
+__status__ = "Production"
+
+
+class JobsWebSocket(tornado.websocket.WebSocketHandler):
+    """
+    This handler lets OT.Simple OTP app subscribe to statuses of many Jobs at once instead of polling
+    checkjob for every one of them.
+
+    Client messages:
+    {"action": "subscribe", "jobs": [{"id": <subscription id>, <checkjob arguments>}, ...]}
+    {"action": "unsubscribe", "ids": [<subscription id>, ...]}
+
+    Server messages:
+    {"id": <subscription id>, "status": <checkjob response>} every time Job's status changes.
+    Subscription is ended when Job gets one of FINAL_STATUSES. If Job is still not found after watch_timeout
+    seconds of jobs_manager section, notfound status is sent again and subscription is ended.
+    {"status": "error", "msg": <error>} on wrong client message.
+    """
+
+    FINAL_STATUSES = ('success', 'nocache', 'failed', 'canceled')
+    NOT_FOUND_STATUS = 'notfound'
+
+    def initialize(self, manager, notification_conf, db_conn_pool):
+        """
+        Gets config and init logger.
+
+        :param manager: Jobs manager object.
+
+        :return:
+        """
+        self.handler_id = str(uuid.uuid4())
+        self.jobs_manager = manager
+        self.logger = logging.getLogger('osr_hid')
+        self.notification_checker = NotificationChecker([TooManyJobsNotification(db_conn_pool, notification_conf,
+                                                                                 manager.get_running_jobs_num),
+                                                         LimitedDataNotification(notification_conf)])
+        self.subscriptions = {}
+
+    def open(self):
+        self.logger.debug('Jobs websocket was opened', extra={'hid': self.handler_id})
+
+    def on_close(self):
+        for subscription in self.subscriptions.values():
+            subscription.cancel()
+        self.subscriptions = {}
+        self.logger.debug('Jobs websocket was closed', extra={'hid': self.handler_id})
+
+    def on_message(self, message):
+        try:
+            message = json.loads(message)
+            action = message['action']
+            if action == 'subscribe':
+                for job in message['jobs']:
+                    self._subscribe(job)
+            elif action == 'unsubscribe':
+                for sid in message['ids']:
+                    subscription = self.subscriptions.pop(str(sid), None)
+                    if subscription:
+                        subscription.cancel()
+            else:
+                raise ValueError(f'Unknown action: {action}')
+        except Exception as e:
+            error = {'status': 'error', 'msg': str(e)}
+            self.logger.error(f'Jobs websocket RESPONSE: {error}', extra={'hid': self.handler_id})
+            self.write_message(error)
+
+    def _subscribe(self, job):
+        sid = str(job['id'])
+        arguments = {k: (str(v).encode(),) for k, v in job.items() if k != 'id'}
+        request = SimpleNamespace(arguments=arguments, body_arguments=arguments, remote_ip=self.request.remote_ip)
+        if sid in self.subscriptions:
+            self.subscriptions[sid].cancel()
+        self.subscriptions[sid] = asyncio.ensure_future(self._watch(sid, request))
+
+    async def _watch(self, sid, request):
+        """
+        Pushes Job's statuses till it gets final one.
+        """
+        status = None
+        try:
+            while status not in self.FINAL_STATUSES:
+                response = await self.jobs_manager.watch_job(hid=self.handler_id, request=request, status=status)
+                new_status = response.get('status')
+                if new_status == status and status != self.NOT_FOUND_STATUS:
+                    continue
+                # Job may be not found till it's registered, but it isn't waited for longer than one watch.
+                ended = new_status == status == self.NOT_FOUND_STATUS
+                status = new_status
+                notifications = self.notification_checker.check_notifications(**response)
+                if notifications:
+                    response['notifications'] = notifications
+                self.logger.debug(f'Jobs websocket RESPONSE: {sid} {response}', extra={'hid': self.handler_id})
+                await self.write_message({'id': sid, 'status': response})
+                if ended:
+                    break
+        except (asyncio.CancelledError, tornado.websocket.WebSocketClosedError):
+            pass
+        except Exception as e:
+            error = {'status': 'error', 'msg': str(e)}
+            self.logger.error(f'Jobs websocket RESPONSE: {sid} {error}', extra={'hid': self.handler_id})
+            try:
+                self.write_message({'id': sid, 'status': error})
+            except tornado.websocket.WebSocketClosedError:
+                pass
+        finally:
+            if self.subscriptions.get(sid) is asyncio.current_task():
+                del self.subscriptions[sid]
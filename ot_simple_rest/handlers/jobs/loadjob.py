@@ -2,6 +2,9 @@ import logging
 import uuid
 
 import tornado.web
+from tornado.iostream import StreamClosedError
+
+from utils.cache_stream import stream_chunks
 
 __author__ = "Andrey Starchenkov, Anton Khromov"
 __copyright__ = "Copyright 2019, Open Technologies 98"
@@ -21,7 +24,7 @@ class LoadJob(tornado.web.RequestHandler):
     2. Get Job's status based on (original_otl, tws, twf) parameters.
     3. Check Job's status and return it to OT.Simple OTP app if it is not still ready.
     4. Load results of Job from cache for transcending.
-    5. Return Job's status or results.
+    5. Return Job's status or stream results by chunks.
     """
 
     def initialize(self, manager):
@@ -62,14 +65,20 @@ class LoadJob(tornado.web.RequestHandler):
         :return:
         """
         try:
-            response = self.jobs_manager.load_job(hid=self.handler_id,
-                                                request=self.request)
+            response = await self.jobs_manager.load_job(hid=self.handler_id,
+                                                      request=self.request)
         except Exception as e:
             error = {'status': 'error', 'msg': str(e)}
             self.logger.error(f"LoadJob RESPONSE: {error}", extra={'hid': self.handler_id})
             return self.write(error)
-        self.logger.debug(f'LoadJob RESPONSE: {response}', extra={'hid': self.handler_id})
-        self.write(response)
-
+        if isinstance(response, dict):
+            self.logger.debug(f'LoadJob RESPONSE: {response}', extra={'hid': self.handler_id})
+            return self.write(response)
+        try:
+            written = await stream_chunks(self, response)
+        except StreamClosedError:
+            self.logger.warning('LoadJob client closed connection while loading cache', extra={'hid': self.handler_id})
+            return
+        self.logger.info(f'LoadJob RESPONSE: {written} bytes of cache', extra={'hid': self.handler_id})
 
 
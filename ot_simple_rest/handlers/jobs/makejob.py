@@ -1,6 +1,8 @@
+import json
 import logging
 import re
 import uuid
+from types import SimpleNamespace
 
 import tornado.web
 import jwt
@@ -45,6 +47,7 @@ class MakeJob(BaseHandler):
         self.check_index_access = False if self.user_conf['check_index_access'] == 'False' else True
         self.jobs_manager = kwargs['manager']
         self.logger = logging.getLogger('osr_hid')
+        self.user_indexes = None
 
     def prepare(self):
         client_token = self.get_cookie('eva_token')
@@ -80,8 +83,8 @@ class MakeJob(BaseHandler):
             self.logger.debug(f'Error_msg: {error_msg}', extra={'hid': self.handler_id})
             self.finish(error_msg)
 
-    def get_original_otl(self):
-        request = self.request.arguments
+    def get_original_otl(self, request=None):
+        request = request or self.request.arguments
         original_otl = request["original_otl"][0].decode()
         original_otl = re.sub(r"\|\s*ot\s[^|]*\|", "", original_otl)
         original_otl = re.sub(r"\|\s*simple[^\"]*", "", original_otl)
@@ -102,7 +105,9 @@ class MakeJob(BaseHandler):
             return True, indexes
 
         accessed_indexes = []
-        user_indexes = self.db.get_indexes_data(user_id=self.current_user, names_only=True)
+        if self.user_indexes is None:
+            self.user_indexes = self.db.get_indexes_data(user_id=self.current_user, names_only=True)
+        user_indexes = self.user_indexes
         self.logger.debug(f'Available indexes for user: {user_indexes}', extra={'hid': self.handler_id})
 
         if '*' in user_indexes:
@@ -127,27 +132,39 @@ class MakeJob(BaseHandler):
 
         return accessed_indexes
 
-    async def post(self):
+    def check_indexes_access(self, original_otl):
         """
-        It writes response to remote side.
+        It checks user's access to indexes of the query.
 
-        :return:
+        :param original_otl: Original OTP query.
+        :return: Accessed indexes and fail response or None if user has access.
         """
-        original_otl = self.get_original_otl()
         indexes = re.findall(r"index\s?=\s?([\"\']?_?\w*[\w*][_\w+]*?[\"\']?)", original_otl)
         user_accessed_indexes = self.get_user_indexes_rights(indexes)
 
         if not user_accessed_indexes:
-            return self.write({"status": "fail", "error": "User has no access to index"})
+            return user_accessed_indexes, {"status": "fail", "error": "User has no access to index"}
 
         if len(user_accessed_indexes) == 1 and user_accessed_indexes[0] == '*':
             for index in indexes:
                 if '*' in index:
-                    return self.write({
+                    return user_accessed_indexes, {
                         "status": "fail",
                         "error": f"Can't find matches for index: {index}. "
                                  f"Check and update actual indexes in database! "
-                    })
+                    }
+        return user_accessed_indexes, None
+
+    async def post(self):
+        """
+        It writes response to remote side.
+
+        :return:
+        """
+        original_otl = self.get_original_otl()
+        user_accessed_indexes, error = self.check_indexes_access(original_otl)
+        if error:
+            return self.write(error)
 
         self.logger.debug(f'User has access. Indexes: {user_accessed_indexes}.', extra={'hid': self.handler_id})
         response = await self.jobs_manager.make_job(hid=self.handler_id,
@@ -155,3 +172,55 @@ class MakeJob(BaseHandler):
                                                     indexes=user_accessed_indexes)
         self.logger.debug(f'MakeJob RESPONSE: {response}', extra={'hid': self.handler_id})
         self.write(response)
+
+
+class MakeJobs(MakeJob):
+    """
+    Batch of MakeJob for dashboards with many searches. User and his indexes are got once,
+    jobs of all searches are registered in one Dispatcher DB transaction.
+
+    Request body: {"searches": [{<makejob arguments>}, ...], <makejob arguments common for all searches>}
+    Response: {"status": "success", "results": [<makejob response>, ...]} in the order of searches.
+    Malformed body is answered with 400 and {"status": "fail", "error": <reason>}.
+    """
+
+    async def post(self):
+        """
+        It writes response to remote side.
+
+        :return:
+        """
+        try:
+            body = json.loads(self.request.body.decode())
+            common_arguments = {k: v for k, v in body.items() if k != 'searches'}
+            searches_arguments = [{k: (str(v).encode(),) for k, v in {**common_arguments, **search}.items()}
+                                  for search in body['searches']]
+        except (ValueError, KeyError, TypeError, AttributeError) as err:
+            error = {"status": "fail", "error": f'Malformed request body: {err!r}'}
+            self.logger.error(f'MakeJobs RESPONSE: {error}', extra={'hid': self.handler_id})
+            self.set_status(400)
+            return self.write(error)
+
+        responses = [None] * len(searches_arguments)
+        requests, positions = [], []
+        for position, arguments in enumerate(searches_arguments):
+            try:
+                user_accessed_indexes, error = self.check_indexes_access(self.get_original_otl(arguments))
+            except Exception as err:
+                user_accessed_indexes, error = None, {"status": "fail", "error": str(err)}
+            if error:
+                responses[position] = error
+                continue
+            request = SimpleNamespace(arguments=arguments, body_arguments=arguments, remote_ip=self.request.remote_ip)
+            requests.append((request, user_accessed_indexes))
+            positions.append(position)
+
+        self.logger.debug(f'User has access to {len(requests)} of {len(responses)} searches.',
+                          extra={'hid': self.handler_id})
+        if requests:
+            for position, response in zip(positions, await self.jobs_manager.make_jobs(hid=self.handler_id,
+                                                                                       requests=requests)):
+                responses[position] = response
+        response = {"status": "success", "results": responses}
+        self.logger.debug(f'MakeJobs RESPONSE: {response}', extra={'hid': self.handler_id})
+        self.write(response)
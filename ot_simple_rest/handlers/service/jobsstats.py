@@ -0,0 +1,43 @@
+import logging
+
+import tornado.web
+
+from tools.loader_cache import LoaderCache
+
+__author__ = "Andrey Starchenkov"
+__copyright__ = "Copyright 2019, Open Technologies 98"
+__credits__ = []
+__license__ = ""
+__version__ = "0.0.1"
+__maintainer__ = "Andrey Starchenkov"
+__email__ = "astarchenkov@ot.ru"
+__status__ = "Production"
+
+
+class JobsStats(tornado.web.RequestHandler):
+    """
+    Returns statistics of jobs manager: queue depth, wait time of jobs in the queue, workers load,
+    and of shared cache of timelines and interesting fields loaders.
+    """
+
+    logger = logging.getLogger('osr')
+
+    def initialize(self, manager):
+        """
+        Gets jobs manager.
+
+        :param manager: Jobs manager object.
+        :return:
+        """
+        self.jobs_manager = manager
+
+    async def get(self):
+        """
+        It writes response to remote side.
+
+        :return:
+        """
+        stats = self.jobs_manager.get_stats()
+        stats['loader_cache'] = LoaderCache.shared().get_stats()
+        self.logger.debug(f'Jobs stats: {stats}')
+        self.write({'status': 'success', 'stats': stats})
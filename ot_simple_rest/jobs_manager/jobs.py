@@ -1,12 +1,16 @@
+import asyncio
 import logging
 import re
 import os
-import json
 import uuid
-import asyncio
-from pathlib import Path
+from functools import partial
+
+from tornado.ioloop import IOLoop
 
 from utils import backlasher
+from utils.cache_manifest import get_manifest
+from utils.cache_stream import iter_cache_chunks, DEFAULT_CHUNK_SIZE
+from handlers.jobs.db_connector import job_key
 from parsers.otl_resolver.Resolver import Resolver
 
 __author__ = "Anton Khromov"
@@ -28,37 +32,50 @@ class Job:
     logger = logging.getLogger('osr')
 
     def __init__(self, *, id, request, db_conn, mem_conf, resolver_conf,
-                 tracker_max_interval, indexes=None):
+                 tracker_max_interval, indexes=None, async_db_conn=None, status_cache=None,
+                 sampler=None):
         self.handler_id = id
         self.request = request
         self.indexes = indexes
         self.db = db_conn
+        self.async_db = async_db_conn
+        self.status_cache = status_cache
+        self.sampler = sampler
         self.mem_conf = mem_conf
+        self.chunk_size = int(mem_conf.get('stream_chunk_size', DEFAULT_CHUNK_SIZE))
         self.resolver_conf = resolver_conf
         self.tracker_max_interval = tracker_max_interval
 
         self.logger = logging.getLogger('osr_hid')
 
         self.status = {'status': 'created'}
+        self.registration = None
         self.resolved_data = None
         self.search = None
+        self.queued_at = None
 
     @classmethod
     def count_lines(cls, dir_path):
         """
-        Count lines in every json file situated in the directory specified
+        Count lines in every json file situated in the directory specified.
+        Lines are taken from manifest of cache, so files are read only once.
         @param dir_path: path to the directory
         @return: total lines count
         """
-        cls.logger.debug('Starting counting lines...')
-        lines_num = 0
-        for file in Path(dir_path).glob('*.json'):
-            cls.logger.debug(f'File: {file}; lines_num: {lines_num}.')
-            with file.open(encoding='UTF-8') as fr:
-                for _ in fr:
-                    lines_num += 1
-        cls.logger.debug('Success counted lines')
-        return lines_num
+        try:
+            return get_manifest(dir_path)['lines']
+        except FileNotFoundError:
+            cls.logger.debug(f'No cache in {dir_path}.')
+            return 0
+
+    async def prepare_cache(self, job_status_data):
+        """
+        Gets manifest of Job's cache in executor, so it's not built in IOLoop by set_checked.
+        :param job_status_data: Job's id, status, cache's expiring date and message or None if Job is not found.
+        :return:
+        """
+        if job_status_data and job_status_data[1] == 'finished' and job_status_data[2]:
+            await IOLoop.current().run_in_executor(None, self.count_lines, self._get_cache_dir(job_status_data[0]))
 
     def _get_cache_dir(self, cid):
         self.logger.debug('Creating path to cache...', extra={'hid': self.handler_id})
@@ -68,8 +85,25 @@ class Job:
         self.logger.debug('Success created path to cache', extra={'hid': self.handler_id})
         return path_
 
-    def check_dispatcher_status(self):
-        delta = self.db.check_dispatcher_status()
+    async def _query(self, method_name, **kwargs):
+        """
+        Runs Dispatcher DB query without blocking of IOLoop. Native async connector is awaited directly,
+        synchronous one is moved to the executor.
+        :param method_name: name of PostgresConnector's method.
+        :return: result of the method.
+        """
+        if self.async_db:
+            return await getattr(self.async_db, method_name)(**kwargs)
+        return await IOLoop.current().run_in_executor(None, partial(getattr(self.db, method_name), **kwargs))
+
+    async def check_dispatcher_status(self):
+        delta = self.status_cache.get_dispatcher_delta() if self.status_cache else None
+        if delta is None and self.sampler:
+            delta = self.sampler.get_dispatcher_delta()
+        if delta is None:
+            delta = await self._query('check_dispatcher_status')
+            if self.status_cache:
+                self.status_cache.put_dispatcher_delta(delta)
         self.logger.debug(f"Dispatcher last check: {delta}.", extra={'hid': self.handler_id})
         if delta and delta <= self.tracker_max_interval:
             return True
@@ -77,36 +111,23 @@ class Job:
 
     def load_and_send_from_memcache(self, cid):
         """
-        It loads result's cache from ramcache and then writes batches.
+        It makes generator of result's cache loaded from ramcache by chunks (see utils.cache_stream).
+        Nothing is read till the generator is started.
         :param cid: Cache's id.
         :type cid: Integer.
-        :return: List of cache table lines.
+        :return: Generator of response bytes.
         """
         self.logger.debug(f'Started loading cache {cid}.', extra={'hid': self.handler_id})
         path_to_cache_dir = self._get_cache_dir(cid)
         self.logger.debug(f'Path to cache {path_to_cache_dir}.', extra={'hid': self.handler_id})
-        file_names = [file_name for file_name in os.listdir(path_to_cache_dir) if file_name[-5:] == '.json']
-        with open(path_to_cache_dir + "_SCHEMA") as fr:
-            df_schema = fr.read()
-        yield '{"status": "success", "schema": "%s", "events": {' % df_schema.strip()
-        length = len(file_names)
-        for i in range(length):
-            file_name = file_names[i]
-            self.logger.debug(f'Reading part: {file_name}', extra={'hid': self.handler_id})
-            yield f'"{file_name}": '
-            with open(path_to_cache_dir + file_name) as fr:
-                body = fr.read()
-            yield json.dumps(body)
-            if i != length - 1:
-                yield ", "
-        yield '}}'
+        return iter_cache_chunks(path_to_cache_dir, self.chunk_size)
 
     @staticmethod
     def validate():
         # TODO: Implement in a future release
         return True
 
-    def check_cache(self, cache_ttl, original_otl, tws, twf, field_extraction, preview):
+    async def check_cache(self, cache_ttl, original_otl, tws, twf, field_extraction, preview):
         """
         It checks if the same query Job is already finished and it's cache is ready to be downloaded. This way it will
         return it's id for OT.Simple OTP app JobLoader to download it's cache.
@@ -126,13 +147,13 @@ class Job:
         cache_id = creating_date = None
         self.logger.debug(f'cache_ttl: {cache_ttl}', extra={'hid': self.handler_id})
         if cache_ttl:
-            cache_id, creating_date = self.db.check_cache(original_otl=original_otl, tws=tws, twf=twf,
-                                                          field_extraction=field_extraction, preview=preview)
+            cache_id, creating_date = await self._query('check_cache', original_otl=original_otl, tws=tws, twf=twf,
+                                                        field_extraction=field_extraction, preview=preview)
 
         self.logger.debug(f'cache_id: {cache_id}, creating_date: {creating_date}', extra={'hid': self.handler_id})
         return cache_id, creating_date
 
-    def check_running(self, original_otl, tws, twf, field_extraction, preview):
+    async def check_running(self, original_otl, tws, twf, field_extraction, preview):
         """
         It checks if the same query Job is already running. This way it will return id of running job and will not
         register a new one.
@@ -148,12 +169,41 @@ class Job:
         :type preview: Boolean.
         :return: Job's id and date of creating.
         """
-        job_id, creating_date = self.db.check_running(original_otl=original_otl, tws=tws, twf=twf,
-                                                      field_extraction=field_extraction, preview=preview)
+        job_id, creating_date = await self._query('check_running', original_otl=original_otl, tws=tws, twf=twf,
+                                                  field_extraction=field_extraction, preview=preview)
 
         self.logger.debug(f'job_id: {job_id}, creating_date: {creating_date}', extra={'hid': self.handler_id})
         return job_id, creating_date
 
+    async def check_job_status(self, original_otl, tws, twf, field_extraction, preview):
+        """
+        It gets status of the latest Job of the query from jobs status cache or from Dispatcher DB on a miss.
+        :param original_otl: Original OTP query.
+        :type original_otl: String.
+        :param tws: Time Window Start.
+        :type tws: Integer.
+        :param twf: Time Window Finish.
+        :type twf: Integer.
+        :param field_extraction: Field Extraction mode.
+        :type field_extraction: Boolean.
+        :param preview: Preview mode.
+        :type preview: Boolean.
+        :return: Job's id, status, cache's expiring date and message or None if Job is not found.
+        """
+        if self.status_cache:
+            key = self.status_cache.make_key(original_otl, tws, twf, field_extraction, preview)
+            job_status_data = self.status_cache.get_job_status(key)
+            if job_status_data:
+                self.logger.debug(f'Job status was found in cache: {job_status_data}', extra={'hid': self.handler_id})
+                return job_status_data
+            generation = self.status_cache.generation
+
+        job_status_data = await self._query('check_job_status', original_otl=original_otl, tws=tws, twf=twf,
+                                            field_extraction=field_extraction, preview=preview)
+        if self.status_cache:
+            self.status_cache.put_job_status(key, job_status_data, generation)
+        return job_status_data
+
     def get_request_params(self):
         request = self.request.arguments
         # Remove OT.Simple OTP app service data from OTP query.
@@ -190,6 +240,14 @@ class Job:
         pattern_to_remove = '[\r\n]'
         return re.sub(pattern_to_remove, '', original_otl)
 
+    @property
+    def fingerprint(self):
+        """
+        Key of the same query Jobs: (original_otl, tws, twf, field_extraction, preview) of the search.
+        """
+        return (self.search[0], self.resolved_data['tws'], self.resolved_data['twf'],
+                self.resolved_data['field_extraction'], self.resolved_data['preview'])
+
     def resolve(self):
         """
         It resolves search on subsearches and extracts info from request data.
@@ -231,83 +289,86 @@ class Job:
                               'field_extraction': field_extraction, 'username': username, 'preview': preview,
                               'resolved_otl': resolved_otl, 'original_otl': original_otl, 'sid': sid}
 
-    async def start_make(self):
+    def get_registration(self):
         """
-        It checks for the same query Jobs and returns id for loading results to OT.Simple OTP app.
-        :return:
+        It forms params of Job's registration in Dispatcher DB (see PostgresConnector.register_job).
+        :return: Dict of register_job kwargs.
         """
-        cache_ttl = self.resolved_data['cache_ttl']
-        tws, twf = self.resolved_data['tws'], self.resolved_data['twf']
-        field_extraction = self.resolved_data['field_extraction']
-        preview = self.resolved_data['preview']
         resolved_otl = self.resolved_data['resolved_otl']
-        original_otl = self.resolved_data['original_otl']
-        username = self.resolved_data['username']
-        sid = self.resolved_data['sid']
-
-        # Check if the same query Job is already calculated and has ready cache.
-        cache_id, creating_date = self.check_cache(cache_ttl, self.search[0], tws, twf, field_extraction, preview)
-
-        if cache_id is None:
-            self.logger.debug(f'No cache', extra={'hid': self.handler_id})
-
-            # Check for validation.
-            if self.validate():
-
-                # Check if the same query Job is already be running.
-                job_id, creating_date = self.check_running(self.search[0], tws, twf, field_extraction, preview)
-                self.logger.debug(f'Running job_id: {job_id}, creating_date: {creating_date}',
-                                  extra={'hid': self.handler_id})
-                if job_id is None:
-
-                    # Form the list of subsearches for each search.
-                    subsearches = []
-                    if 'subsearch=' in self.search[1]:
-                        _subsearches = re.findall(r'subsearch=([\w\d]+)', self.search[1])
-                        for each in _subsearches:
-                            subsearches.append(resolved_otl['subsearches'][each][0])
-
-                    # Register new Job in Dispatcher DB.
-                    self.logger.debug(f'Search: {self.search[1]}. Subsearches: {subsearches}.',
-                                      extra={'hid': self.handler_id})
-                    job_id, creating_date = self.db.add_job(search=self.search, subsearches=subsearches,
-                                                            tws=tws, twf=twf, cache_ttl=cache_ttl,
-                                                            username=username,
-                                                            field_extraction=field_extraction,
-                                                            preview=preview)
-
-                    # Add SID to DB if search is not subsearch.
-                    if self.search == self.resolved_data['searches'][-1]:
-                        self.db.add_sid(sid=sid, remote_ip=self.request.remote_ip,
-                                        original_otl=original_otl)
-
-                # Return id of new Job.
-                response = {"_time": creating_date, "status": "success", "job_id": job_id}
 
-            else:
-                # Return validation error.
-                response = {"status": "fail", "error": "Validation failed"}
+        # Form the list of subsearches for each search.
+        subsearches = []
+        if 'subsearch=' in self.search[1]:
+            _subsearches = re.findall(r'subsearch=([\w\d]+)', self.search[1])
+            for each in _subsearches:
+                subsearches.append(resolved_otl['subsearches'][each][0])
+        self.logger.debug(f'Search: {self.search[1]}. Subsearches: {subsearches}.', extra={'hid': self.handler_id})
+
+        registration = {'search': self.search, 'subsearches': subsearches,
+                        'tws': self.resolved_data['tws'], 'twf': self.resolved_data['twf'],
+                        'cache_ttl': self.resolved_data['cache_ttl'], 'username': self.resolved_data['username'],
+                        'field_extraction': self.resolved_data['field_extraction'],
+                        'preview': self.resolved_data['preview']}
+
+        # Add SID to DB if search is not subsearch.
+        if self.search == self.resolved_data['searches'][-1]:
+            registration.update(sid=self.resolved_data['sid'], remote_ip=self.request.remote_ip,
+                                original_otl=self.resolved_data['original_otl'])
+        return registration
+
+    async def add_sid(self):
+        """
+        It adds SID of the search to Dispatcher DB for Job which joined the same new Job in flight instead of
+        registering (see register_job, SID is added only with new Job).
+        :return:
+        """
+        # Add SID to DB if search is not subsearch.
+        if self.search == self.resolved_data['searches'][-1]:
+            await self._query('add_sid', sid=self.resolved_data['sid'], remote_ip=self.request.remote_ip,
+                              original_otl=self.resolved_data['original_otl'])
 
-        else:
-            # Return id of the same already calculated Job with ready cache. Ot.Simple OTP app JobLoader will
-            # request it to download.
-            response = {"_time": creating_date, "status": "success", "job_id": cache_id}
+    def set_registered(self, job_id, creating_date, registration):
+        """
+        It sets status of registered Job.
+        :param job_id: Id of new Job or of the same one.
+        :param creating_date: Date of Job's creating.
+        :param registration: Registration kind: 'cache', 'running' or 'new'.
+        :return:
+        """
+        self.logger.debug(f'Job_id: {job_id}, creating_date: {creating_date}, registration: {registration}',
+                          extra={'hid': self.handler_id})
 
+        # Return id of new Job or the same one. Ot.Simple OTP app JobLoader will request it to download.
+        response = {"_time": creating_date, "status": "success", "job_id": job_id}
         self.logger.debug(f'Response: {response}', extra={'hid': self.handler_id})
         self.status = response
-        await asyncio.sleep(0.001)
+        self.registration = registration
 
-    def start_check(self, with_load=False):
+    async def start_make(self):
+        """
+        It checks for the same query Jobs and returns id for loading results to OT.Simple OTP app.
+        Cache lookup, running Job lookup and registration are made atomically in one Dispatcher DB round trip.
+        :return:
+        """
+        # Check for validation.
+        if self.validate():
+            # Get the same query Job with ready cache or already running one or register new Job in Dispatcher DB.
+            self.set_registered(*await self._query('register_job', **self.get_registration()))
+        else:
+            # Return validation error.
+            response = {"status": "fail", "error": "Validation failed"}
+            self.logger.debug(f'Response: {response}', extra={'hid': self.handler_id})
+            self.status = response
+
+    async def start_check(self, with_load=False):
         """
         It checks for Job's status then downloads the result.
 
         :return:
         """
-        dispatcher_status = self.check_dispatcher_status()
+        dispatcher_status = await self.check_dispatcher_status()
         if not dispatcher_status:
-            msg = 'SuperDispatcher is offline. Please check Spark Cluster.'
-            self.logger.warning(msg, extra={'hid': self.handler_id})
-            self.status = {'status': 'failed', 'error': msg}
+            self.set_dispatcher_offline()
             return
 
         params = self.get_request_params()
@@ -320,8 +381,23 @@ class Job:
 
         # Step 2. Get Job's status based on (original_otl, tws, twf) parameters.
 
-        job_status_data = self.db.check_job_status(original_otl=original_otl, tws=tws, twf=twf,
-                                                   field_extraction=field_extraction, preview=preview)
+        job_status_data = await self.check_job_status(original_otl, tws, twf, field_extraction, preview)
+        if not with_load:
+            await self.prepare_cache(job_status_data)
+        self.set_checked(job_status_data, with_load)
+
+    def set_dispatcher_offline(self):
+        msg = 'SuperDispatcher is offline. Please check Spark Cluster.'
+        self.logger.warning(msg, extra={'hid': self.handler_id})
+        self.status = {'status': 'failed', 'error': msg}
+
+    def set_checked(self, job_status_data, with_load=False):
+        """
+        It sets status of checked Job and loads the result if it's needed.
+        :param job_status_data: Job's id, status, cache's expiring date and message or None if Job is not found.
+        :param with_load: Sign of need load results after finish.
+        :return:
+        """
         self.logger.info(job_status_data, extra={'hid': self.handler_id})
 
         # Check if such Job presents.
@@ -331,9 +407,8 @@ class Job:
             if status == 'finished' and expiring_date:
                 if with_load:
                     # Step 4. Load results of Job from cache for transcending.
-                    response = ''.join(list(self.load_and_send_from_memcache(cid)))
-                    self.logger.info(f'Cache cid={cid} was loaded. Created response: {response}.',
-                                     extra={'hid': self.handler_id})
+                    response = self.load_and_send_from_memcache(cid)
+                    self.logger.info(f'Cache cid={cid} was found and will be streamed.', extra={'hid': self.handler_id})
                 else:
                     self.logger.debug(f'Cache for task_id={cid} was found.', extra={'hid': self.handler_id})
                     response = {'status': 'success', 'cid': cid, 'lines': self.count_lines(self._get_cache_dir(cid))}
@@ -352,3 +427,74 @@ class Job:
             # Return missed job error.
             response = {'status': 'notfound', 'error': 'Job is not found'}
         self.status = response
+
+
+class JobsBatch:
+    """
+    Jobs of many searches made together: all of them are registered in one Dispatcher DB transaction
+    or checked with one Dispatcher's heartbeat check and one query of statuses.
+    """
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.queued_at = None
+
+    async def start_make(self):
+        """
+        It registers all Jobs of the batch in Dispatcher DB and sets their statuses.
+        :return:
+        """
+        valid_jobs = []
+        for job in self.jobs:
+            if job.validate():
+                valid_jobs.append(job)
+            else:
+                job.status = {"status": "fail", "error": "Validation failed"}
+
+        if valid_jobs:
+            registrations = await valid_jobs[0]._query('register_jobs', registrations=[job.get_registration()
+                                                                                       for job in valid_jobs])
+            for job, registration in zip(valid_jobs, registrations):
+                job.set_registered(*registration)
+
+    async def start_check(self):
+        """
+        It checks statuses of all Jobs of the batch. Statuses missed in jobs status cache are got by one query.
+        :return:
+        """
+        if not self.jobs:
+            return
+        if not await self.jobs[0].check_dispatcher_status():
+            for job in self.jobs:
+                job.set_dispatcher_offline()
+            return
+
+        keys = {}
+        for job in self.jobs:
+            try:
+                params = job.get_request_params()
+                keys[job] = job_key(params['original_otl'], params['tws'], params['twf'],
+                                    params['field_extraction'], params['preview'])
+            except Exception as err:
+                job.status = {'status': 'error', 'msg': str(err)}
+
+        status_cache = self.jobs[0].status_cache
+        jobs_status_data, missed_keys = {}, []
+        for key in set(keys.values()):
+            job_status_data = status_cache.get_job_status(key) if status_cache else None
+            if job_status_data:
+                jobs_status_data[key] = job_status_data
+            else:
+                missed_keys.append(key)
+
+        if missed_keys:
+            generation = status_cache.generation if status_cache else None
+            found_jobs_status_data = await self.jobs[0]._query('check_jobs_status', keys=missed_keys)
+            for key in missed_keys:
+                jobs_status_data[key] = found_jobs_status_data.get(key)
+                if status_cache:
+                    status_cache.put_job_status(key, jobs_status_data[key], generation)
+
+        await asyncio.gather(*[job.prepare_cache(jobs_status_data[key]) for job, key in keys.items()])
+        for job, key in keys.items():
+            job.set_checked(jobs_status_data[key])
@@ -1,9 +1,13 @@
 import logging
 import asyncio
+import time
 from datetime import datetime
+from functools import partial
 
-from jobs_manager.jobs import Job
-from handlers.jobs.db_connector import PostgresConnector
+from jobs_manager.jobs import Job, JobsBatch
+from jobs_manager.status_cache import JobsStatusCache
+from jobs_manager.sampler import DispatcherSampler
+from handlers.jobs.db_connector import PostgresConnector, AsyncPostgresConnector
 
 logger = logging.getLogger('osr')
 
@@ -24,26 +28,77 @@ class JobsManager:
     There is two methods for create auxiliary jobs:
     - make_job: creates job and queue it in asyncio.Queue for scheduled executing.
                 This action creates JOB in OT_Dispatcher.
+    - make_jobs: creates jobs of many searches and queue them as one batch.
     - check_job: creates job and start it immediately.
                 This action checks status JOB in OT_Dispatcher.
     - load_job: creates job and start it immediately.
                 This action checks status JOB in OT_Dispatcher and load results of finished job.
-    Also we have a _start_monitoring method to identify and run jobs from jobs queue.
+    - check_jobs: checks jobs of many searches together.
+    - watch_job: checks job till its status changes (long poll of check_job).
+    Also we have a pool of _worker coroutines to run jobs from jobs queue.
 
-    Job from the queue will be started later, when _start_monitoring detect it.
-    If jobs queue is empty, monitoring is waiting for new jobs.
+    Job from the queue will be started later, when one of the workers gets it. Number of workers is the limit of
+    jobs making in parallel. If jobs queue is full, make_job rejects the request instead of waiting for free space.
+
+    Identical jobs (see Job.fingerprint) are single-flight: while one of them is queued or making, the others
+    are not queued but get the status (and job_id) of that one, their SIDs are added to Dispatcher DB if that one
+    was registered as new Job.
+
+    If async_db_conn_pool (asyncpg pool) is given, jobs query Dispatcher DB with native async driver,
+    otherwise synchronous connector calls are moved to the executor. Resolver always uses synchronous connector.
+
+    If status_cache is enabled in manager_conf (it requires async_db_conn_pool), check_job answers from
+    JobsStatusCache fed by Dispatcher DB events and queries DB only on misses.
+
+    Dispatcher's heartbeat and number of running jobs are sampled by DispatcherSampler every sampler_interval
+    seconds (0 disables it), they are queried in DB only if neither jobs status cache nor sampler knows them.
     """
 
+    DEFAULT_WORKERS = 8
+    DEFAULT_QUEUE_SIZE = 100
+    DEFAULT_WATCH_TIMEOUT = 60
+    DEFAULT_WATCH_POLL_INTERVAL = 1
+
     def __init__(self, db_conn_pool, mem_conf, disp_conf,
-                 resolver_conf):
+                 resolver_conf, async_db_conn_pool=None, manager_conf=None):
         self.db_conn = PostgresConnector(db_conn_pool)
+        self.async_db_conn = AsyncPostgresConnector(async_db_conn_pool) if async_db_conn_pool else None
         self.mem_conf = mem_conf
         self.disp_conf = disp_conf
         self.r_conf = resolver_conf
         self.tracker_max_interval = float(disp_conf['tracker_max_interval'])
 
+        manager_conf = manager_conf or {}
+        self.workers_num = int(manager_conf.get('workers', self.DEFAULT_WORKERS))
+        self.watch_timeout = float(manager_conf.get('watch_timeout', self.DEFAULT_WATCH_TIMEOUT))
+        self.watch_poll_interval = float(manager_conf.get('watch_poll_interval', self.DEFAULT_WATCH_POLL_INTERVAL))
+
+        self.status_cache = None
+        if manager_conf.get('status_cache', False):
+            if async_db_conn_pool:
+                self.status_cache = JobsStatusCache(async_db_conn_pool, int(manager_conf.get(
+                    'status_cache_size', JobsStatusCache.DEFAULT_SIZE)))
+            else:
+                logger.warning('Jobs status cache requires async DB pool, it was not enabled')
+
+        self.sampler = None
+        sampler_interval = float(manager_conf.get('sampler_interval', DispatcherSampler.DEFAULT_INTERVAL))
+        if sampler_interval > 0:
+            self.sampler = DispatcherSampler(self.db_conn, self.async_db_conn, sampler_interval, float(manager_conf.get(
+                'sampler_max_staleness', DispatcherSampler.DEFAULT_MAX_STALENESS)))
+
         self._enable = False
-        self.jobs_queue = asyncio.Queue(maxsize=100)
+        self._workers = []
+        self.jobs_queue = asyncio.Queue(maxsize=int(manager_conf.get('queue_size', self.DEFAULT_QUEUE_SIZE)))
+
+        self._in_flight = 0
+        self._queued = self._rejected = self._processed = self._failed = 0
+        self._max_queue_depth = 0
+        self._wait_time_total = self._wait_time_max = 0.0
+
+        self._flights = {}
+        self._single_flight_hits = self._single_flight_misses = 0
+        self._sid_tasks = set()
 
         logger.info('Jobs manager started')
 
@@ -57,31 +112,9 @@ class JobsManager:
         :return:            None
         """
         try:
-            parent_job = Job(id=hid,
-                             request=request,
-                             indexes=indexes,
-                             db_conn=self.db_conn,
-                             mem_conf=self.mem_conf,
-                             resolver_conf=self.r_conf,
-                             tracker_max_interval=self.tracker_max_interval)
-            parent_job.resolve()
-            resolved_data = parent_job.resolved_data
-
-            for search in resolved_data['searches']:
-                if search == resolved_data['searches'][-1]:
-                    parent_job.search = search
-                    await self.jobs_queue.put(parent_job)
-                else:
-                    job = Job(id=hid,
-                              request=request,
-                              indexes=indexes,
-                              db_conn=self.db_conn,
-                              mem_conf=self.mem_conf,
-                              resolver_conf=self.r_conf,
-                              tracker_max_interval=self.tracker_max_interval)
-                    job.resolved_data = resolved_data
-                    job.search = search
-                    await self.jobs_queue.put(job)
+            self._enqueue(self._create_make_jobs(hid, request, indexes))
+        except asyncio.QueueFull:
+            response = self._reject()
         except Exception as err:
             response = {"status": "fail", "timestamp": str(datetime.now()), "error": str(err)}
         else:
@@ -89,7 +122,143 @@ class JobsManager:
             logger.debug('MakeJob was queued')
         return response
 
-    def check_job(self, *, hid, request, with_load=False):
+    async def make_jobs(self, *, hid, requests):
+        """
+        Creates jobs of many searches and queues them as one batch, which is registered in one Dispatcher DB
+        transaction. The same subsearches of different searches are made once.
+
+        :param hid:         handler identifier
+        :param requests:    list of (request, indexes) pairs of searches
+        :return:            list of responses in the same order
+        """
+        responses, jobs = [], []
+        for request, indexes in requests:
+            try:
+                jobs += self._create_make_jobs(hid, request, indexes)
+            except Exception as err:
+                responses.append({"status": "fail", "timestamp": str(datetime.now()), "error": str(err)})
+            else:
+                responses.append({"status": "success", "timestamp": str(datetime.now())})
+
+        try:
+            self._enqueue(jobs, batch=True)
+        except asyncio.QueueFull:
+            rejection = self._reject()
+            responses = [rejection if response['status'] == 'success' else response for response in responses]
+        except Exception as err:
+            responses = [{"status": "fail", "timestamp": str(datetime.now()), "error": str(err)}] * len(responses)
+        else:
+            logger.debug(f'MakeJobs batch of {len(jobs)} jobs was queued')
+        return responses
+
+    def _create_make_jobs(self, hid, request, indexes):
+        """
+        Creates jobs of the search and of its subsearches.
+
+        :param hid:         handler identifier
+        :param request:     request object from handler
+        :param indexes:     list of accessed indexes
+        :return:            list of jobs, subsearches first
+        """
+        parent_job = Job(id=hid,
+                         request=request,
+                         indexes=indexes,
+                         db_conn=self.db_conn,
+                         async_db_conn=self.async_db_conn,
+                         mem_conf=self.mem_conf,
+                         resolver_conf=self.r_conf,
+                         tracker_max_interval=self.tracker_max_interval)
+        parent_job.resolve()
+        resolved_data = parent_job.resolved_data
+
+        jobs = []
+        for search in resolved_data['searches']:
+            if search == resolved_data['searches'][-1]:
+                parent_job.search = search
+                jobs.append(parent_job)
+            else:
+                job = Job(id=hid,
+                          request=request,
+                          indexes=indexes,
+                          db_conn=self.db_conn,
+                          async_db_conn=self.async_db_conn,
+                          mem_conf=self.mem_conf,
+                          resolver_conf=self.r_conf,
+                          tracker_max_interval=self.tracker_max_interval)
+                job.resolved_data = resolved_data
+                job.search = search
+                jobs.append(job)
+        return jobs
+
+    def _reject(self):
+        self._rejected += 1
+        logger.warning(f'Jobs queue is full, MakeJob was rejected. Queue size: {self.jobs_queue.qsize()}')
+        return {"status": "fail", "timestamp": str(datetime.now()), "error": "Jobs queue is full. Try again later"}
+
+    def _enqueue(self, jobs, batch=False):
+        """
+        Puts all jobs of one request to the queue or none of them. Job with the same fingerprint as already queued
+        or making one is not queued but waits for the result of that one.
+
+        :param jobs:    list of jobs, subsearches first
+        :param batch:   put jobs to the queue as one JobsBatch
+        :return:        None
+        """
+        loop = asyncio.get_event_loop()
+        new_flights = {}
+        leaders, followers = [], []
+        for job in jobs:
+            fingerprint = job.fingerprint
+            if fingerprint in self._flights or fingerprint in new_flights:
+                followers.append(job)
+            else:
+                new_flights[fingerprint] = loop.create_future()
+                leaders.append(job)
+
+        items = ([JobsBatch(leaders)] if leaders else []) if batch else leaders
+        if self.jobs_queue.maxsize and self.jobs_queue.maxsize - self.jobs_queue.qsize() < len(items):
+            raise asyncio.QueueFull
+
+        self._flights.update(new_flights)
+        for item in items:
+            item.queued_at = time.monotonic()
+            self.jobs_queue.put_nowait(item)
+        for job in followers:
+            self._flights[job.fingerprint].add_done_callback(partial(self._share_status, job))
+
+        self._queued += len(items)
+        self._single_flight_misses += len(leaders)
+        self._single_flight_hits += len(followers)
+        self._max_queue_depth = max(self._max_queue_depth, self.jobs_queue.qsize())
+        if followers:
+            logger.debug(f'{len(followers)} jobs joined the same jobs in flight')
+
+    def _share_status(self, job, flight):
+        job.status, job.registration = flight.result()
+        if job.registration == 'new':
+            task = asyncio.ensure_future(self._add_sid(job))
+            self._sid_tasks.add(task)
+            task.add_done_callback(self._sid_tasks.discard)
+
+    @staticmethod
+    async def _add_sid(job):
+        try:
+            await job.add_sid()
+        except Exception as err:
+            logger.error(f'Failed to add SID of job joined the same job in flight: {err}')
+
+    def _land(self, job):
+        """
+        Shares status of made job with the same jobs joined while it was in flight.
+
+        :param job:     made job
+        :return:        None
+        """
+        flight = self._flights.pop(job.fingerprint, None)
+        if flight and not flight.done():
+            flight.set_result((job.status, job.registration))
+
+    async def check_job(self, *, hid, request, with_load=False):
         """
         Creates Job instance with needed params and start it for check job.
 
@@ -98,42 +267,143 @@ class JobsManager:
         :param with_load:   sign of need load results after finish
         :return:            results of checking job
         """
+        job = self._create_check_job(hid, request)
+        await job.start_check(with_load)
+        return job.status
+
+    def _create_check_job(self, hid, request):
         job = Job(id=hid,
                   request=request,
                   db_conn=self.db_conn,
+                  async_db_conn=self.async_db_conn,
+                  status_cache=self.status_cache,
+                  sampler=self.sampler,
                   mem_conf=self.mem_conf,
                   resolver_conf=self.r_conf,
                   tracker_max_interval=self.tracker_max_interval)
         logger.debug('CheckJob was created')
-        job.start_check(with_load)
-        return job.status
+        return job
+
+    async def watch_job(self, *, hid, request, status=None, timeout=None):
+        """
+        Checks job till its status differs from the given one or timeout passes. Job is checked again on its
+        events from jobs status cache or every watch_poll_interval seconds.
 
-    def load_job(self, *, hid, request):
+        :param hid:         handler identifier
+        :param request:     request object from handler
+        :param status:      status known by client
+        :param timeout:     seconds to wait for change, limited by watch_timeout
+        :return:            results of the last checking job
+        """
+        loop = asyncio.get_event_loop()
+        timeout = self.watch_timeout if timeout is None else min(float(timeout), self.watch_timeout)
+        deadline = loop.time() + timeout
+        while True:
+            job = self._create_check_job(hid, request)
+            changed = None
+            if self.status_cache:
+                params = job.get_request_params()
+                changed = self.status_cache.watch(JobsStatusCache.make_key(
+                    params['original_otl'], params['tws'], params['twf'], params['field_extraction'], params['preview']))
+            try:
+                await job.start_check()
+                remaining = deadline - loop.time()
+                if job.status.get('status') != status or remaining <= 0:
+                    return job.status
+                wait = min(remaining, self.watch_poll_interval)
+                if changed:
+                    await asyncio.wait([changed], timeout=wait)
+                else:
+                    await asyncio.sleep(wait)
+            finally:
+                if changed:
+                    changed.cancel()
+
+    async def check_jobs(self, *, hid, requests):
+        """
+        Checks jobs of many searches together: Dispatcher's heartbeat is checked once, statuses missed in jobs
+        status cache are got by one query.
+
+        :param hid:         handler identifier
+        :param requests:    list of request objects of searches
+        :return:            list of results of checking jobs in the same order
+        """
+        jobs = [self._create_check_job(hid, request) for request in requests]
+        await JobsBatch(jobs).start_check()
+        return [job.status for job in jobs]
+
+    async def load_job(self, *, hid, request):
         """
         Creates Job instance with needed params and start it for check job and load results.
 
         :param hid:         handler identifier
         :param request:     request object from handler
-        :return:            results of loading job
+        :return:            status of job or generator of its cached results (see Job.load_and_send_from_memcache)
+        """
+        return await self.check_job(hid=hid, request=request, with_load=True)
+
+    def get_running_jobs_num(self):
+        """
+        :return:    number of running jobs from jobs status cache or sampler or None if it's unknown
         """
-        return self.check_job(hid=hid, request=request, with_load=True)
+        running_jobs_num = self.status_cache.running_jobs_num if self.status_cache else None
+        if running_jobs_num is None and self.sampler:
+            running_jobs_num = self.sampler.running_jobs_num
+        return running_jobs_num
 
-    async def _start_monitoring(self):
+    async def _worker(self, num):
         """
-        Runs endless loop with jobs check and execute code in it.
+        Waits for jobs from the queue and makes them one by one.
 
+        :param num:     worker's number for logging
         :return:        None
         """
-        logger.info('Watchdog was started')
-        loop = asyncio.get_event_loop()
+        logger.info(f'Worker {num} was started')
         while self._enable:
-            if not self.jobs_queue.empty():
-                job = await self.jobs_queue.get()
-                logger.debug('Got a job from queue')
-                loop.create_task(job.start_make())
-            else:
-                await asyncio.sleep(0.05)
-        logger.info('Manager was stopped')
+            job = await self.jobs_queue.get()
+            wait_time = time.monotonic() - job.queued_at
+            self._wait_time_total += wait_time
+            self._wait_time_max = max(self._wait_time_max, wait_time)
+            logger.debug(f'Worker {num} got a job from queue after {wait_time:.3f}s of waiting')
+
+            self._in_flight += 1
+            try:
+                await job.start_make()
+            except Exception as err:
+                self._failed += 1
+                logger.error(f'Worker {num} failed to make job: {err}')
+            finally:
+                for made_job in job.jobs if isinstance(job, JobsBatch) else [job]:
+                    self._land(made_job)
+                self._in_flight -= 1
+                self._processed += 1
+                self.jobs_queue.task_done()
+        logger.info(f'Worker {num} was stopped')
+
+    def get_stats(self):
+        """
+        Gathers statistics of jobs queue and workers.
+
+        :return:        dict with counters, queue depth and wait time in seconds
+        """
+        return {
+            'workers': self.workers_num,
+            'in_flight': self._in_flight,
+            'queue_size': self.jobs_queue.maxsize,
+            'queue_depth': self.jobs_queue.qsize(),
+            'max_queue_depth': self._max_queue_depth,
+            'queued': self._queued,
+            'rejected': self._rejected,
+            'processed': self._processed,
+            'failed': self._failed,
+            'avg_wait_time': self._wait_time_total / self._processed if self._processed else 0.0,
+            'max_wait_time': self._wait_time_max,
+            'in_flight_fingerprints': len(self._flights),
+            'single_flight_hits': self._single_flight_hits,
+            'single_flight_misses': self._single_flight_misses,
+            'status_cache': self.status_cache.get_stats() if self.status_cache else None,
+            'sampler': self.sampler.get_stats() if self.sampler else None,
+        }
 
     def start(self):
         """
@@ -142,7 +412,12 @@ class JobsManager:
         :return:        None
         """
         self._enable = True
-        asyncio.ensure_future(self._start_monitoring())
+        self._workers = [asyncio.ensure_future(self._worker(num)) for num in range(self.workers_num)]
+        if self.status_cache:
+            self.status_cache.start()
+        if self.sampler:
+            self.sampler.start()
+        logger.info(f'Jobs manager started {self.workers_num} workers')
 
     def stop(self):
         """
@@ -151,3 +426,11 @@ class JobsManager:
         :return:        None
         """
         self._enable = False
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        if self.status_cache:
+            self.status_cache.stop()
+        if self.sampler:
+            self.sampler.stop()
+        logger.info('Manager was stopped')
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+from functools import partial
+
+from tornado.ioloop import IOLoop
+
+logger = logging.getLogger('osr')
+
+__author__ = "Anton Khromov"
+__copyright__ = "Copyright 2019, Open Technologies 98"
+__credits__ = []
+__license__ = ""
+__version__ = "0.0.1"
+__maintainer__ = "Andrey Starchenkov"
+__email__ = "akhromov@ot.ru"
+__status__ = "Production"
+
+
+class DispatcherSampler:
+    """
+    Samples delta of Dispatcher's last tick and number of running jobs from Dispatcher DB every interval seconds,
+    so checkjob and notifications read them from memory instead of querying DB on every request.
+
+    Sample older than max_staleness seconds (e.g. DB is unavailable) is not used, getters return None then.
+    """
+
+    DEFAULT_INTERVAL = 1
+    DEFAULT_MAX_STALENESS = 5
+
+    def __init__(self, db_conn, async_db_conn=None, interval=DEFAULT_INTERVAL, max_staleness=DEFAULT_MAX_STALENESS):
+        self.db = db_conn
+        self.async_db = async_db_conn
+        self.interval = interval
+        self.max_staleness = max_staleness
+
+        self._dispatcher_delta = None
+        self._running_jobs_num = None
+        self._sampled_at = None
+        self._sampler = None
+
+    async def _query(self, method_name):
+        if self.async_db:
+            return await getattr(self.async_db, method_name)()
+        return await IOLoop.current().run_in_executor(None, partial(getattr(self.db, method_name)))
+
+    async def sample(self):
+        dispatcher_delta = await self._query('check_dispatcher_status')
+        running_jobs_num = await self._query('get_running_jobs_num')
+        self._dispatcher_delta = float(dispatcher_delta) if dispatcher_delta is not None else None
+        self._running_jobs_num = running_jobs_num
+        self._sampled_at = time.monotonic()
+
+    def _age(self):
+        if self._sampled_at is None:
+            return None
+        age = time.monotonic() - self._sampled_at
+        return age if age <= self.max_staleness else None
+
+    def get_dispatcher_delta(self):
+        """
+        :return:    seconds since Dispatcher's last tick or None if sample is stale or has no ticks
+        """
+        age = self._age()
+        if age is None or self._dispatcher_delta is None:
+            return None
+        return self._dispatcher_delta + age
+
+    @property
+    def running_jobs_num(self):
+        return self._running_jobs_num if self._age() is not None else None
+
+    def get_stats(self):
+        return {'interval': self.interval, 'max_staleness': self.max_staleness,
+                'age': time.monotonic() - self._sampled_at if self._sampled_at is not None else None,
+                'dispatcher_delta': self.get_dispatcher_delta(), 'running_jobs_num': self.running_jobs_num}
+
+    async def run(self):
+        while True:
+            try:
+                await self.sample()
+            except Exception as err:
+                logger.error(f'Dispatcher sampler failed: {err}')
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._sampler = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self._sampler:
+            self._sampler.cancel()
+            self._sampler = None
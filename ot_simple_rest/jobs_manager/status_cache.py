@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from functools import partial
+
+from handlers.jobs.db_connector import job_key
+
+logger = logging.getLogger('osr')
+
+__author__ = "Anton Khromov"
+__copyright__ = "Copyright 2019, Open Technologies 98"
+__credits__ = []
+__license__ = ""
+__version__ = "0.0.1"
+__maintainer__ = "Andrey Starchenkov"
+__email__ = "akhromov@ot.ru"
+__status__ = "Production"
+
+
+class JobsStatusCache:
+    """
+    In-memory copy of Dispatcher DB state needed for checkjob: status of the latest job of every
+    (original_otl, tws, twf, field_extraction, preview), expiring date of its cache, delta of Dispatcher's last tick
+    and number of running jobs.
+
+    It's fed by NOTIFY events of OTLQueries, CachesDL and Ticks triggers (see sql/update_to_1.19.0.sql) received
+    on a dedicated LISTEN connection of asyncpg pool. Jobs registered while listening are known from their
+    INSERT events, statuses of others are put by jobs after DB lookup. Messages are not sent with events,
+    so failed and canceled jobs are dropped on events and kept only after DB lookup.
+
+    While the listener is not connected the cache is not ready and all lookups are misses. Events may be lost
+    during reconnection, so the cache is cleared every time listening is started.
+
+    Watchers of a job (see watch) are woken up by its events and by clearing of the cache.
+    """
+
+    CHANNELS = ('otlqueries_changes', 'cachesdl_changes', 'ticks_changes')
+    EVENT_STATUSES = ('new', 'running', 'finished', 'external')
+    DEFAULT_SIZE = 10000
+    RECONNECT_INTERVAL = 5
+    RUNNING_RESYNC_INTERVAL = 60
+
+    def __init__(self, async_db_conn_pool, size=DEFAULT_SIZE):
+        self.pool = async_db_conn_pool
+        self.size = size
+
+        self.ready = False
+        self.generation = 0
+        self._jobs = OrderedDict()
+        self._last_tick = None
+        self._running_jobs_num = None
+        self._watchers = {}
+
+        self._lost = asyncio.Event()
+        self._listener = None
+        self.hits = self.misses = 0
+
+    make_key = staticmethod(job_key)
+
+    def get_job_status(self, key):
+        """
+        :param key:     see make_key
+        :return:        (id, status, expiring_date, msg) as PostgresConnector.check_job_status returns or None if missed
+        """
+        job_status_data = self._jobs.get(key) if self.ready else None
+        if job_status_data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._jobs.move_to_end(key)
+        return job_status_data
+
+    def put_job_status(self, key, job_status_data, generation):
+        """
+        Puts job status looked up in DB. It's dropped if any event was received since the lookup was started,
+        so the cache is never older than events.
+
+        :param key:                 see make_key
+        :param job_status_data:     (id, status, expiring_date, msg)
+        :param generation:          value of generation before the lookup
+        :return:                    None
+        """
+        if self.ready and generation == self.generation and job_status_data:
+            self._set(key, tuple(job_status_data))
+
+    def watch(self, key):
+        """
+        :param key:     see make_key
+        :return:        future resolved on the next event of the job, cancel it to stop watching
+        """
+        future = asyncio.get_event_loop().create_future()
+        self._watchers.setdefault(key, set()).add(future)
+        future.add_done_callback(partial(self._unwatch, key))
+        return future
+
+    def _unwatch(self, key, future):
+        watchers = self._watchers.get(key)
+        if watchers is not None:
+            watchers.discard(future)
+            if not watchers:
+                del self._watchers[key]
+
+    def _wake(self, key):
+        for future in list(self._watchers.get(key, ())):
+            if not future.done():
+                future.set_result(None)
+
+    def get_dispatcher_delta(self):
+        """
+        :return:    seconds since Dispatcher's last tick or None if it's unknown
+        """
+        if not self.ready or self._last_tick is None:
+            return None
+        return time.monotonic() - self._last_tick
+
+    def put_dispatcher_delta(self, delta):
+        if self.ready and delta is not None:
+            self._tick(float(delta))
+
+    @property
+    def running_jobs_num(self):
+        return self._running_jobs_num if self.ready else None
+
+    def get_stats(self):
+        return {'ready': self.ready, 'jobs': len(self._jobs), 'hits': self.hits, 'misses': self.misses,
+                'running_jobs_num': self.running_jobs_num, 'dispatcher_delta': self.get_dispatcher_delta(),
+                'watched_jobs': len(self._watchers)}
+
+    def _set(self, key, job_status_data):
+        self._jobs[key] = job_status_data
+        self._jobs.move_to_end(key)
+        while len(self._jobs) > self.size:
+            self._jobs.popitem(last=False)
+
+    def _tick(self, delta):
+        last_tick = time.monotonic() - delta
+        if self._last_tick is None or last_tick > self._last_tick:
+            self._last_tick = last_tick
+
+    def _on_otlqueries_change(self, event):
+        # Job status events make lookups in flight stale, Dispatcher's ticks don't.
+        self.generation += 1
+        key = self.make_key(event['hashed_original_otl'], event['tws'], event['twf'],
+                            event['field_extraction'], event['preview'], hashed=True)
+        job_id, status, old_status = event['id'], event.get('status'), event.get('old_status')
+
+        if self._running_jobs_num is not None:
+            self._running_jobs_num += (status == 'running') - (old_status == 'running')
+
+        self._wake(key)
+        cached = self._jobs.get(key)
+        if event['op'] == 'INSERT':
+            if cached is None or job_id >= cached[0]:
+                self._set(key, (job_id, status, None, None))
+        elif cached is not None and cached[0] == job_id:
+            if event['op'] == 'UPDATE' and status in self.EVENT_STATUSES:
+                self._jobs[key] = (job_id, status, cached[2], None)
+            else:
+                # Message of failed job and previous job of deleted one are looked up in DB.
+                del self._jobs[key]
+
+    def _on_cachesdl_change(self, event):
+        self.generation += 1
+        key = self.make_key(event['hashed_original_otl'], event['tws'], event['twf'],
+                            event['field_extraction'], event['preview'], hashed=True)
+        self._wake(key)
+        cached = self._jobs.get(key)
+        if cached is not None and cached[0] == event['id']:
+            expiring_date = None if event['op'] == 'DELETE' else event['expiring_date']
+            self._jobs[key] = (cached[0], cached[1], expiring_date, cached[3])
+
+    def _on_ticks_change(self, event):
+        self._tick(float(event['delta']))
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            event = json.loads(payload)
+            if channel == 'otlqueries_changes':
+                self._on_otlqueries_change(event)
+            elif channel == 'cachesdl_changes':
+                self._on_cachesdl_change(event)
+            elif channel == 'ticks_changes':
+                self._on_ticks_change(event)
+        except Exception as err:
+            logger.error(f'Jobs status cache failed to handle {channel} event {payload}: {err}')
+            self._reset()
+
+    def _on_termination(self, connection):
+        logger.warning('Jobs status cache listener connection was lost')
+        self._lost.set()
+
+    def _reset(self):
+        self.generation += 1
+        self._jobs.clear()
+        self._last_tick = None
+        self._running_jobs_num = None
+        for key in list(self._watchers):
+            self._wake(key)
+
+    async def _resync_running_jobs_num(self):
+        generation = self.generation
+        running_jobs_num = await self.pool.fetchval("SELECT COUNT(*) FROM otlqueries WHERE status = 'running';")
+        if generation == self.generation or self._running_jobs_num is None:
+            self._running_jobs_num = running_jobs_num
+
+    async def listen(self):
+        """
+        Keeps LISTEN connection and the cache up to date till the task is cancelled.
+
+        :return:    None
+        """
+        while True:
+            connection = None
+            try:
+                connection = await self.pool.acquire()
+                self._lost.clear()
+                self._reset()
+                connection.add_termination_listener(self._on_termination)
+                for channel in self.CHANNELS:
+                    await connection.add_listener(channel, self._on_notification)
+                self.ready = True
+                logger.info('Jobs status cache is listening Dispatcher DB events')
+
+                while not self._lost.is_set():
+                    await self._resync_running_jobs_num()
+                    try:
+                        await asyncio.wait_for(self._lost.wait(), timeout=self.RUNNING_RESYNC_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.error(f'Jobs status cache listener failed: {err}')
+            finally:
+                self.ready = False
+                self._reset()
+                if connection is not None:
+                    await self._release(connection)
+            await asyncio.sleep(self.RECONNECT_INTERVAL)
+
+    async def _release(self, connection):
+        try:
+            connection.remove_termination_listener(self._on_termination)
+            if not connection.is_closed():
+                for channel in self.CHANNELS:
+                    await connection.remove_listener(channel, self._on_notification)
+            await self.pool.release(connection)
+        except Exception as err:
+            logger.error(f'Jobs status cache failed to release listener connection: {err}')
+
+    def start(self):
+        self._listener = asyncio.ensure_future(self.listen())
+
+    def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            self._listener = None
+        self.ready = False
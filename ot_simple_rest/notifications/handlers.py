@@ -1,5 +1,5 @@
 from abc import abstractmethod
-from typing import Dict
+from typing import Callable, Dict, Optional
 
 import notifications.codes
 from notifications.format import Notification
@@ -17,14 +17,17 @@ class TooManyJobsNotification(AbstractNotificationHandler):
     DEFAULT_THRESHOLD = 8
     NOTIFICATION_CODE = notifications.codes.TOO_MANY_JOBS
 
-    def __init__(self, db_pool, conf: dict) -> None:
+    def __init__(self, db_pool, conf: dict, running_jobs_num: Callable[[], Optional[int]] = None) -> None:
         super().__init__()
         self.db = PostgresConnector(db_pool)
         self.conf = conf
+        self.running_jobs_num = running_jobs_num
 
     def check(self, *args, **kwargs) -> Dict[str, str]:
         if self.db and self.conf:
-            running_jobs_counter = self.db.get_running_jobs_num()
+            running_jobs_counter = self.running_jobs_num() if self.running_jobs_num else None
+            if running_jobs_counter is None:
+                running_jobs_counter = self.db.get_running_jobs_num()
             if running_jobs_counter >= int(self.conf.get('jobs_queue_threshold', self.DEFAULT_THRESHOLD)):
                 return Notification(code=self.NOTIFICATION_CODE, value=running_jobs_counter).as_dict()
 
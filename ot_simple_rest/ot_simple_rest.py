@@ -3,12 +3,14 @@
 # ot_simple_rest.py
 
 import logging.config
+import multiprocessing
 import os
 import sys
 from configparser import ConfigParser
 
 import tornado.ioloop
 
+import asyncpg
 from psycopg2.pool import ThreadedConnectionPool
 
 from handlers.eva.auth import AuthLoginHandler
@@ -28,14 +30,16 @@ from handlers.eva.timelines import GetTimelines
 from handlers.eva.interesting_fields import GetInterestingFields
 from handlers.eva.settings import Settings
 
-from handlers.jobs.makejob import MakeJob
+from handlers.jobs.makejob import MakeJob, MakeJobs
 from handlers.jobs.loadjob import LoadJob
-from handlers.jobs.checkjob import CheckJob
+from handlers.jobs.checkjob import CheckJob, CheckJobs
+from handlers.jobs.jobsws import JobsWebSocket
 from handlers.jobs.getresult import GetResult
 from handlers.jobs.saveotrest import SaveOtRest
 from handlers.service.makerolemodel import MakeRoleModel
 from handlers.service.makedatamodels import MakeDataModels
 from handlers.service.pingpong import PingPong
+from handlers.service.jobsstats import JobsStats
 
 from jobs_manager.manager import JobsManager
 from task_scheduler.tasks import DbTasksSchduler
@@ -136,6 +140,9 @@ def main():
     static_conf = dict(config['static'])
     user_conf = dict(config['user'])
     pool_conf = dict(config['db_pool_conf'])
+    manager_conf = dict(config['jobs_manager']) if 'jobs_manager' in config else dict()
+    if 'jobs_manager' in config:
+        manager_conf['status_cache'] = config['jobs_manager'].getboolean('status_cache', fallback=False)
     notification_conf = dict(config['notification_triggers']) if 'notification_triggers' in config else dict()
     svg_upload_conf = dict(config['svg_upload']) if 'svg_upload' in config else dict()
     file_upload_conf = dict(config['static_upload']) if 'static_upload' in config else dict()
@@ -155,8 +162,17 @@ def main():
     db_pool = ThreadedConnectionPool(int(pool_conf['min_size']), int(pool_conf['max_size']), **db_conf)
     db_pool_eva = ThreadedConnectionPool(int(pool_conf['min_size']), int(pool_conf['max_size']), **db_conf_eva)
 
+    # Native async pool for Dispatcher DB queries of the jobs pipeline
+    db_pool_async = None
+    if config['db_pool_conf'].getboolean('async', fallback=False):
+        db_pool_async = tornado.ioloop.IOLoop.current().run_sync(
+            lambda: asyncpg.create_pool(min_size=int(pool_conf['min_size']), max_size=int(pool_conf['max_size']),
+                                        **db_conf))
+        logger.info('Async DB pool was created')
+
     # Create jobs manager instance and start it
-    manager = JobsManager(db_conn_pool=db_pool, mem_conf=mem_conf, disp_conf=disp_conf, resolver_conf=resolver_conf)
+    manager = JobsManager(db_conn_pool=db_pool, mem_conf=mem_conf, disp_conf=disp_conf, resolver_conf=resolver_conf,
+                          async_db_conn_pool=db_pool_async, manager_conf=manager_conf)
     manager.start()
 
     # Create and start task scheduler
@@ -166,13 +182,19 @@ def main():
     # Set TORNADO application with custom handlers.
     application = Tornado([
         (r'/api/ping', PingPong),
+        (r'/api/jobs/stats', JobsStats, {"manager": manager}),
+        (r'/api/jobs/ws', JobsWebSocket, {"manager": manager, "notification_conf": notification_conf,
+                                          "db_conn_pool": db_pool}),
         (r'/api/checkjob', CheckJob, {"manager": manager, "notification_conf": notification_conf,
                                       "db_conn_pool": db_pool}),
+        (r'/api/checkjobs', CheckJobs, {"manager": manager, "notification_conf": notification_conf,
+                                        "db_conn_pool": db_pool}),
         (r'/api/getresult', GetResult, {"mem_conf": mem_conf, "static_conf": static_conf}),
         (r'/api/gettimelines', GetTimelines, {"mem_conf": mem_conf, "static_conf": static_conf,
                                               "notification_conf": notification_conf}),
         (r'/api/getinterestingfields', GetInterestingFields, {"mem_conf": mem_conf, "static_conf": static_conf}),
         (r'/api/makejob', MakeJob, {"db_conn_pool": db_pool_eva, "manager": manager, "user_conf": user_conf}),
+        (r'/api/makejobs', MakeJobs, {"db_conn_pool": db_pool_eva, "manager": manager, "user_conf": user_conf}),
         (r'/api/loadjob', LoadJob, {"manager": manager}),
         (r'/api/otrest', SaveOtRest, {"db_conn_pool": db_pool, "mem_conf": mem_conf}),
         (r'/api/makerolemodel', MakeRoleModel, {"db_conn_pool": db_pool}),
@@ -266,7 +288,11 @@ def main():
         tornado.ioloop.IOLoop.current().stop()
         db_pool.closeall()
         db_pool_eva.closeall()
+        if db_pool_async:
+            db_pool_async.terminate()
 
 
 if __name__ == '__main__':
+    # Workers of process pool of timelines loader re-run frozen (PyInstaller) executable.
+    multiprocessing.freeze_support()
     main()
@@ -1,15 +1,20 @@
 import logging
 import os
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Generator, Optional
+from typing import Any, Dict, Generator, List, Optional
 from pathlib import Path
 from tornado.web import HTTPError
 
+from utils.cache_columnar import read_columns
+from utils.cache_manifest import get_manifest
+from .loader_cache import LoaderCache
+
 
 class BaseLoader(ABC):
 
     """
-    Base class for loaders, that loads data using only cid
+    Base class for loaders, that loads data using only cid.
+    Loaded data are kept in LoaderCache shared by loaders (loader_cache_size bytes of mem_conf, 0 disables it).
     """
 
     def __init__(self, mem_conf: Dict, static_conf: Dict):
@@ -18,17 +23,41 @@ class BaseLoader(ABC):
         self.data_path = self.mem_conf['path']
         self.logger = logging.getLogger('osr')
         self._cache_name_template = 'search_{}.cache/data'
+        self.cache = LoaderCache.shared(int(self.mem_conf.get('loader_cache_size', LoaderCache.DEFAULT_MAX_SIZE)))
 
     def _get_path_to_cache_dir(self, cid) -> str:
         self.logger.debug(f'Started loading cache {cid}.')
         return os.path.join(self.data_path, self._cache_name_template.format(cid))
 
-    def _get_cache_file_names(self, path_to_cache_dir, cid: str) -> Generator:
+    def _get_manifest(self, path_to_cache_dir, cid: str, with_times: bool = False) -> Dict:
         self.logger.debug(f'Path to cache {path_to_cache_dir}.')
         if not os.path.exists(path_to_cache_dir):
             self.logger.error(f'No cache with id={cid}')
             raise HTTPError(405, f'No cache with id={cid}')
-        return Path(path_to_cache_dir).glob('*.json')
+        return get_manifest(path_to_cache_dir, with_times)
+
+    def _get_cache_file_names(self, path_to_cache_dir, cid: str) -> Generator:
+        manifest = self._get_manifest(path_to_cache_dir, cid)
+        return (Path(path_to_cache_dir) / part['name'] for part in manifest['parts'])
+
+    def _read_columns(self, path_to_cache_dir, columns: Optional[List[str]] = None):
+        """
+        Reads only needed columns from columnar copy of cache (see utils.cache_columnar), returns pyarrow Table
+        or None if the copy can't be used and parts should be read.
+        """
+        table = read_columns(path_to_cache_dir, columns)
+        if table is not None:
+            self.logger.debug(f'Columns {table.column_names} of {path_to_cache_dir} are read from columnar copy.')
+        return table
+
+    def load(self, cid: str, from_time: Optional[int] = None, to_time: Optional[int] = None) -> Any:
+        """
+        Returns data of load_data from shared cache, data are loaded once for every version of cache manifest.
+        It does blocking IO, run it in executor. Don't change returned data, they are shared.
+        """
+        manifest = self._get_manifest(os.path.join(self.data_path, self._cache_name_template.format(cid)), cid)
+        key = (type(self).__name__, self.data_path, cid, manifest['signature'], from_time, to_time)
+        return self.cache.get(key, lambda: self.load_data(cid, from_time, to_time))
 
     @abstractmethod
     def load_data(self, cid: str, from_time: Optional[int] = None, to_time: Optional[int] = None) -> Any:
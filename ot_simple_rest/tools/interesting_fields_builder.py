@@ -1,7 +1,50 @@
-from pandas import DataFrame as PandasDataFrame
+import sys
+from pandas import DataFrame as PandasDataFrame, Series as PandasSeries
 from typing import List, Dict
 
 
+class FieldsCounts:
+    """
+    Mergeable counts of data for interesting fields: number of rows, number of not empty cells and counts of values
+    of every column. Data can be counted by chunks, taken memory is proportional to number of distinct values.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.not_empty: Dict[str, int] = {}
+        self.values: Dict[str, PandasSeries] = {}
+
+    @property
+    def columns(self) -> List[str]:
+        """Columns in order of their first appearance"""
+        return list(self.values)
+
+    def add(self, data: PandasDataFrame) -> 'FieldsCounts':
+        """
+        Adds counts of chunk of data to counts of previous chunks
+        """
+        self.rows += data.shape[0]
+        not_empty = data.count()
+        for col in data.columns:
+            self._add_column(col, int(not_empty[col]), data[col].value_counts(sort=False))
+        return self
+
+    def _add_column(self, col: str, not_empty: int, values: PandasSeries):
+        if col in self.values:
+            self.not_empty[col] += not_empty
+            # Values are kept in order of their first appearance, so equal counts are ordered as by value_counts.
+            counted = self.values[col]
+            index = counted.index.append(values.index[~values.index.isin(counted.index)])
+            values = counted.reindex(index, fill_value=0) + values.reindex(index, fill_value=0)
+        else:
+            self.not_empty[col] = not_empty
+        self.values[col] = values
+
+    def __sizeof__(self):
+        return sys.getsizeof(self.not_empty) + sum(int(values.memory_usage(index=True, deep=True))
+                                                   for values in self.values.values())
+
+
 class InterestingFieldsBuilder:
     """
     The builder class is responsible for creating the list of interesting fields from already loaded data.
@@ -38,23 +81,21 @@ class InterestingFieldsBuilder:
     def get_interesting_fields(self, data: PandasDataFrame) -> List[Dict]:
         if data.empty:
             raise Exception('Empty data')
-        interesting_fields = {}
-        i = 0
-        value_counts_columns = {}
-        not_nan_for_every_col = data.count()
-        for col in data.columns:
-            interesting_fields[col] = {'id': i, 'text': col, 'totalCount': int(not_nan_for_every_col[col]), 'static': []}
-            value_counts_columns[col] = data[col].value_counts()
-            i += 1
-        for col_name, unique_values in value_counts_columns.items():
-            for value_as_index, value_counter in unique_values.items():
-                value = value_as_index
-                count = value_counter
-                percent = count / data.shape[0] * 100
-                percent = self._round_percent(percent, data.shape[0])
-                interesting_fields[col_name]['static'].append({
+        return self.get_interesting_fields_from_counts(FieldsCounts().add(data))
+
+    def get_interesting_fields_from_counts(self, counts: FieldsCounts) -> List[Dict]:
+        if not counts.rows:
+            raise Exception('Empty data')
+        interesting_fields = []
+        for i, col in enumerate(counts.columns):
+            static = []
+            for value, count in counts.values[col].sort_values(ascending=False, kind='stable').items():
+                percent = count / counts.rows * 100
+                percent = self._round_percent(percent, counts.rows)
+                static.append({
                     'value': value,
                     'count': count,
                     '%': percent
                 })
-        return list(interesting_fields.values())
+            interesting_fields.append({'id': i, 'text': col, 'totalCount': counts.not_empty[col], 'static': static})
+        return interesting_fields
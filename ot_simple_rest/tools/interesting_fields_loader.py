@@ -1,8 +1,39 @@
 from .base_loader import BaseLoader
-import os
+from .interesting_fields_builder import FieldsCounts
+from io import BytesIO
+from pathlib import Path
 import pandas as pd
-from pandas import DataFrame as PandasDataFrame
-from typing import Dict, Optional
+from pandas import DataFrame as PandasDataFrame, Series as PandasSeries
+from pandas.api.types import is_string_dtype
+from typing import Dict, Iterator, List, Optional
+
+from utils.cache_manifest import time_ranges, iter_range_lines
+
+try:
+    import pyarrow.compute as pc
+except ImportError:
+    pc = None
+
+
+def _infer_json_dtype(column: PandasSeries) -> PandasSeries:
+    """
+    Type inference of pd.read_json (dtype=True): strings are converted to floats,
+    floats and strings are converted to integers if they have the same values.
+    """
+    data = column
+    if is_string_dtype(data.dtype):
+        try:
+            data = data.astype('float64')
+        except (TypeError, ValueError):
+            pass
+    if len(data) and data.dtype in ('float', 'object'):
+        try:
+            as_int = column.astype('int64')
+            if (as_int == data).all():
+                data = as_int
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return data
 
 
 class InterestingFieldsLoader(BaseLoader):
@@ -11,8 +42,11 @@ class InterestingFieldsLoader(BaseLoader):
     Main purpose to load data from cid and return the data as a dataframe.
     """
 
+    DEFAULT_CHUNK_SIZE = 100000
+
     def __init__(self, mem_conf: Dict, static_conf: Dict):
         super().__init__(mem_conf, static_conf)
+        self.chunk_size = int(self.mem_conf.get('loader_chunk_size', self.DEFAULT_CHUNK_SIZE))
 
     def load_data(self, cid: str, from_time: Optional[int] = None, to_time: Optional[int] = None) -> PandasDataFrame:
         """
@@ -23,16 +57,96 @@ class InterestingFieldsLoader(BaseLoader):
         :param to_time:         loads data till that moment
         :return:            pandas dataframe
         """
-        data = None
+        chunks = list(self._iter_chunks(cid, from_time, to_time))
+        if not chunks:
+            return pd.DataFrame()
+        return pd.concat(chunks, ignore_index=True)
+
+    def load_counts(self, cid: str, from_time: Optional[int] = None, to_time: Optional[int] = None) -> FieldsCounts:
+        """
+        Returns counts of values of data from shared cache of loaders. Data are counted by chunks of chunk_size
+        lines (loader_chunk_size of mem_conf), so only counts of distinct values are kept in memory.
+        It does blocking IO, run it in executor.
+
+        :param cid:         OT_Dispatcher's job cid
+        :param from_time:         counts data from that moment
+        :param to_time:         counts data till that moment
+        :return:            counts for InterestingFieldsBuilder.get_interesting_fields_from_counts
+        """
+        path_to_cache_dir = self._get_path_to_cache_dir(cid)
+        manifest = self._get_manifest(path_to_cache_dir, cid)
+        key = (type(self).__name__, 'counts', self.data_path, cid, manifest['signature'], from_time, to_time)
+        return self.cache.get(key, lambda: self._count(cid, from_time, to_time))
+
+    def _count(self, cid: str, from_time: Optional[int], to_time: Optional[int]) -> FieldsCounts:
+        counts = FieldsCounts()
+        for chunk in self._iter_chunks(cid, from_time, to_time):
+            counts.add(chunk)
+        return counts
+
+    def _iter_chunks(self, cid: str, from_time: Optional[int], to_time: Optional[int]) -> Iterator[PandasDataFrame]:
+        """
+        Yields data by chunks of at most chunk_size rows filtered by time
+        """
         path_to_cache_dir = self._get_path_to_cache_dir(cid)
         file_names = self._get_cache_file_names(path_to_cache_dir, cid)
+        table = self._read_columns(path_to_cache_dir)
+        if table is not None:
+            # Columns without values in the time range are kept as read_json keeps them.
+            columns = [name for name in table.column_names if table.column(name).null_count < table.num_rows]
+            # Rows are filtered before conversion to pandas.
+            if from_time:
+                table = table.filter(pc.greater_equal(table['_time'], from_time))
+            if to_time:
+                table = table.filter(pc.less_equal(table['_time'], to_time))
+            for offset in range(0, table.num_rows, self.chunk_size):
+                yield self._columns_to_pandas(table.slice(offset, self.chunk_size), columns)
+            return
+        ranges = None
+        if from_time or to_time:
+            # Only blocks of lines which may be in the time range are read.
+            ranges = time_ranges(self._get_manifest(path_to_cache_dir, cid, with_times=True),
+                                 from_time or None, to_time or None)
         for file_name in file_names:
-            self.logger.debug(f'Reading part: {file_name}')
-            df = pd.read_json(file_name, lines=True, convert_dates=False)
-            if not data:
-                data = df
-            else:
-                data.append(df, ignore_index=True)
+            if ranges is None:
+                self.logger.debug(f'Reading part: {file_name}')
+                reader = pd.read_json(file_name, lines=True, convert_dates=False, chunksize=self.chunk_size)
+                try:
+                    for chunk in reader:
+                        yield self._filter(chunk, from_time, to_time)
+                finally:
+                    reader.close()
+            elif file_name.name in ranges:
+                self.logger.debug(f'Reading {len(ranges[file_name.name])} ranges of part: {file_name}')
+                for chunk in self._read_ranges(file_name, ranges[file_name.name]):
+                    yield self._filter(chunk, from_time, to_time)
+
+    def _read_ranges(self, file_name: Path, ranges: List) -> Iterator[PandasDataFrame]:
+        """
+        Parses lines of byte ranges of part by chunks of chunk_size lines as read_json with chunksize does
+        """
+        lines = []
+        for line in iter_range_lines(file_name, ranges):
+            lines.append(line)
+            if len(lines) == self.chunk_size:
+                yield pd.read_json(BytesIO(b''.join(lines)), lines=True, convert_dates=False)
+                lines = []
+        if lines:
+            yield pd.read_json(BytesIO(b''.join(lines)), lines=True, convert_dates=False)
+
+    @staticmethod
+    def _columns_to_pandas(table, columns: List[str]) -> PandasDataFrame:
+        """
+        Converts rows of columnar copy to pandas as read_json parses the same lines of parts: only columns with values
+        in the lines are taken like fields of the lines and types of columns are inferred the same way
+        """
+        data = table.select(columns).to_pandas()
+        for col in columns:
+            data[col] = _infer_json_dtype(data[col])
+        return data
+
+    @staticmethod
+    def _filter(data: PandasDataFrame, from_time: Optional[int], to_time: Optional[int]) -> PandasDataFrame:
         if from_time:
             data = data[data['_time'] >= from_time]
         if to_time:
@@ -0,0 +1,114 @@
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import numpy as np
+from pandas import DataFrame as PandasDataFrame
+
+
+def estimate_size(data: Any) -> int:
+    """
+    Approximate number of bytes taken by data loaded by loaders
+    """
+    if isinstance(data, PandasDataFrame):
+        return int(data.memory_usage(index=True, deep=True).sum())
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    if isinstance(data, tuple):
+        return sys.getsizeof(data) + sum(estimate_size(item) for item in data)
+    if isinstance(data, list):
+        return sys.getsizeof(data) + (len(data) * sys.getsizeof(data[0]) if data else 0)
+    return sys.getsizeof(data)
+
+
+class LoaderCache:
+    """
+    In-process LRU of data decoded by loaders, shared by all of them (see BaseLoader.load).
+    Size of cached data is limited by max_size bytes, least recently used data are evicted.
+
+    Concurrent loads of the same key are single-flight: the first thread loads data and the others wait for it.
+    """
+
+    DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+    _shared: Optional['LoaderCache'] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self._data = OrderedDict()
+        self._loading: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.shared_loads = self.evictions = 0
+        self.logger = logging.getLogger('osr')
+
+    @classmethod
+    def shared(cls, max_size: Optional[int] = None) -> 'LoaderCache':
+        """
+        Returns cache of process, max_size changes its limit.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            if max_size is not None:
+                cls._shared.max_size = max_size
+            return cls._shared
+
+    def get(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        """
+        Returns cached data of key or loads it with load function.
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key][0]
+            future = self._loading.get(key)
+            if future is None:
+                future = self._loading[key] = Future()
+                self.misses += 1
+                is_loader = True
+            else:
+                self.shared_loads += 1
+                is_loader = False
+        if not is_loader:
+            return future.result()
+
+        try:
+            data = load()
+        except BaseException as err:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(err)
+            raise
+        self._put(key, data)
+        future.set_result(data)
+        return data
+
+    def _put(self, key: Hashable, data: Any):
+        size = estimate_size(data)
+        with self._lock:
+            del self._loading[key]
+            if size > self.max_size:
+                self.logger.debug(f'Data of {key} takes {size} bytes and is not cached.')
+                return
+            self._data[key] = (data, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def get_stats(self) -> Dict:
+        return {'max_size': self.max_size, 'size': self.size, 'entries': len(self._data),
+                'loading': len(self._loading), 'hits': self.hits, 'misses': self.misses,
+                'shared_loads': self.shared_loads, 'evictions': self.evictions}
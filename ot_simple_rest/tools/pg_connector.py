@@ -1,10 +1,11 @@
 import logging
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 
 import tornado.util
 import psycopg2
+import asyncpg
 from psycopg2.pool import PoolError
-from asyncio import sleep
+from time import sleep
 
 __author__ = "Anton Khromov"
 __copyright__ = "Copyright 2019, Open Technologies 98"
@@ -101,3 +102,56 @@ class PGConnector:
             cur.close()
             if not with_transaction:
                 self.pool.putconn(conn)
+
+
+class AsyncPGConnector:
+    """
+    Base Postgres connector class for native async driver (asyncpg) pool with no specific methods.
+    Queries use asyncpg placeholders: $1, $2, ...
+    """
+
+    def __init__(self, conn_pool):
+        self.pool = conn_pool
+        self.logger = logging.getLogger('osr')
+
+    @asynccontextmanager
+    async def transaction(self, name="transaction", **kwargs):
+        async with self.pool.acquire() as conn:
+            tr = conn.transaction(isolation=kwargs.get("isolation_level", None),
+                                  readonly=kwargs.get("readonly", False),
+                                  deferrable=kwargs.get("deferrable", False))
+            await tr.start()
+            try:
+                yield conn
+            except Exception as e:
+                await tr.rollback()
+                self.logger.error(f"Transaction {name} error: {e}")
+                raise RuntimeError(f"Transaction {name} failed")
+            else:
+                await tr.commit()
+
+    async def execute_query(self, query, conn=None, params=None, with_fetch=True, fetchall=False):
+        """
+        Executes query in autocommit mode or inside of the transaction if connection is given.
+        Rows are returned as tuples to be interchangeable with PGConnector results.
+        Connection errors are logged and raised, so callers don't get None instead of rows.
+        """
+        params = params or ()
+        if not conn:
+            async with self.pool.acquire() as conn:
+                return await self._execute(conn, query, params, with_fetch, fetchall)
+        return await self._execute(conn, query, params, with_fetch, fetchall)
+
+    async def _execute(self, conn, query, params, with_fetch, fetchall):
+        self.logger.debug('Connection: %s' % conn)
+        try:
+            if not with_fetch:
+                await conn.execute(query, *params)
+            elif fetchall:
+                return [tuple(row) for row in await conn.fetch(query, *params)]
+            else:
+                row = await conn.fetchrow(query, *params)
+                return tuple(row) if row else None
+        except (asyncpg.PostgresConnectionError, OSError) as err:
+            self.logger.error(f'SQL Error: {err}')
+            raise
@@ -1,7 +1,5 @@
-from datetime import datetime
-from dateutil import tz
-from collections import Counter
-from typing import List, Dict
+import numpy as np
+from typing import List, Dict, Sequence, Tuple
 
 
 class TimeIntervals:
@@ -11,64 +9,12 @@ class TimeIntervals:
     MONTHS = 3
 
 
-class Interval:
-    def __init__(self, timestamp: float):
-        self._dt: datetime = self._set_interval(
-            datetime.fromtimestamp(timestamp, tz=tz.UTC)
-        )
-
-    def _set_interval(self, dt: datetime):
-        """
-        Calculates datetime of interval beginning
-        """
-        raise NotImplementedError
-
-    def as_timestamp(self) -> float:
-        """
-        Returns timestamp of beginning
-        """
-        return self._dt.timestamp()
-
-    def __hash__(self):
-        return self._dt.__hash__()
-
-    def __lt__(self, other):
-        return self._dt < other._dt
-
-    def __le__(self, other):
-        return self._dt <= other._dt
-
-    def __gt__(self, other):
-        return self._dt > other._dt
-
-    def __ge__(self, other):
-        return self._dt >= other._dt
-
-    def __eq__(self, other):
-        return self._dt == other._dt
-
-    def __ne__(self, other):
-        return self._dt != other._dt
-
-
-class MinuteInterval(Interval):
-    def _set_interval(self, dt: datetime):
-        return dt.replace(second=0, microsecond=0)
-
-
-class HourInterval(Interval):
-    def _set_interval(self, dt: datetime):
-        return dt.replace(minute=0, second=0, microsecond=0)
-
-
-class DayInterval(Interval):
-    def _set_interval(self, dt: datetime):
-        return dt.replace(hour=0, minute=0, second=0, microsecond=0)
-
-
-class MonthInterval(Interval):
-    def _set_interval(self, dt: datetime):
-        return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+# 1970-01-05, the first Monday after epoch, weeks start on Mondays.
+WEEK_START = 4 * DAY
 
 
 class TimelinesBuilder:
@@ -83,48 +29,130 @@ class TimelinesBuilder:
     2nd - 1 hour
     3rd - 1 day
     4th - 1 month
+
+    Intervals are calculated with NumPy in UTC: minutes, hours and days by integer division of timestamps,
+    months by datetime64[M].
+
+    Every timeline can be made of minutes histogram (see count_minutes), including timelines of INTERVALS
+    not returned by get_all_timelines: 5 and 15 minutes and weeks (starting on Mondays).
     """
 
+    INTERVALS = ('minutes', '5minutes', '15minutes', 'hours', 'days', 'weeks', 'months')
+    WIDTHS = {'minutes': MINUTE, '5minutes': 5 * MINUTE, '15minutes': 15 * MINUTE, 'hours': HOUR, 'days': DAY}
+
     @staticmethod
-    def _get_timeline(data: List[int], interval_type: type) -> List[Dict[str, int]]:
+    def _to_seconds(data: Sequence[float]) -> np.ndarray:
         """
-        Args:
-            data: list of intergers representing timestamps
-            interval_type: interval class, one of the Interval childs
-        Returns:
-             timeline for class interval
+        Returns timestamps as int64 seconds, fractions of seconds are floored
+        """
+        data = np.asarray(data)
+        if data.dtype.kind != 'i':
+            data = np.floor(data).astype(np.int64)
+        return data
+
+    @staticmethod
+    def _months(seconds: np.ndarray) -> np.ndarray:
+        """
+        Returns timestamps of beginnings of months of timestamps
+        """
+        return seconds.astype('datetime64[s]').astype('datetime64[M]').astype('datetime64[s]').astype(np.int64)
+
+    @staticmethod
+    def _count(intervals: np.ndarray, counts: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Counts sorted intervals, counts are weights of intervals
         """
-        counter = Counter(
-            [interval_type(timestamp) for timestamp in data]
-        )
+        if counts is None:
+            return np.unique(intervals, return_counts=True)
+        intervals, starts = np.unique(intervals, return_index=True)
+        return intervals, np.add.reduceat(counts, starts) if len(starts) else counts[:0]
+
+    @staticmethod
+    def _as_timeline(intervals: np.ndarray, counts: np.ndarray) -> List[Dict[str, int]]:
         return [
             {
-                "time": interval.as_timestamp(),
-                "value": counter[interval]
+                "time": time,
+                "value": value
             }
-            for interval in sorted(counter)
+            for time, value in zip(intervals.astype(np.float64).tolist(), counts.tolist())
         ]
 
-    def get_all_timelines(self, data: List[int]) -> List[List[Dict[str, int]]]:
+    def count_minutes(self, data: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns minutes histogram of timestamps: sorted beginnings of minutes and numbers of timestamps in them
+        """
+        return self._count(self._to_seconds(data) // MINUTE * MINUTE)
+
+    def _group_minutes(self, minutes: np.ndarray, interval: str) -> np.ndarray:
+        if interval == 'minutes':
+            return minutes
+        if interval == 'months':
+            return self._months(minutes)
+        if interval == 'weeks':
+            return (minutes - WEEK_START) // WEEK * WEEK + WEEK_START
+        return minutes // self.WIDTHS[interval] * self.WIDTHS[interval]
+
+    def get_timeline_from_minutes(self, minutes: np.ndarray, counts: np.ndarray,
+                                  interval: str) -> List[Dict[str, int]]:
+        """
+        Args:
+            minutes, counts: minutes histogram, see count_minutes
+            interval: one of INTERVALS
+        Returns:
+             timeline for interval
+        """
+        if interval == 'minutes':
+            return self._as_timeline(minutes, counts)
+        return self._as_timeline(*self._count(self._group_minutes(minutes, interval), counts))
+
+    def get_fitting_timeline(self, minutes: np.ndarray, counts: np.ndarray, max_points: int,
+                             interval: str = 'minutes') -> Tuple[str, List[Dict[str, int]]]:
+        """
+        Makes timeline of the finest interval not finer than interval which has at most max_points points.
+        If even months timeline has more points, adjacent months are merged into intervals of N months
+        aligned to epoch (named "<N>months").
+        Args:
+            minutes, counts: minutes histogram, see count_minutes
+            max_points: max number of points of timeline, positive
+            interval: the finest interval of INTERVALS
+        Returns:
+             name of interval and timeline
+        """
+        for name in self.INTERVALS[self.INTERVALS.index(interval):]:
+            intervals, interval_counts = self._count(self._group_minutes(minutes, name), counts)
+            if len(intervals) <= max_points:
+                return name, self._as_timeline(intervals, interval_counts)
+
+        months = intervals.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+        # Every merged interval has at most width months, so there can't be less than that.
+        width = -(-len(months) // max_points)
+        merged, merged_counts = self._count(months // width * width, interval_counts)
+        while len(merged) > max_points:
+            width += 1
+            merged, merged_counts = self._count(months // width * width, interval_counts)
+        merged = merged.astype('datetime64[M]').astype('datetime64[s]').astype(np.int64)
+        return f'{width}months', self._as_timeline(merged, merged_counts)
+
+    def get_all_timelines_from_minutes(self, minutes: np.ndarray,
+                                       counts: np.ndarray) -> List[List[Dict[str, int]]]:
+        return [self.get_timeline_from_minutes(minutes, counts, interval)
+                for interval in ('minutes', 'hours', 'days', 'months')]
+
+    def get_all_timelines(self, data: Sequence[float]) -> List[List[Dict[str, int]]]:
         """
         You can use get_<interval>_timeline one by one, but it will be around for times longer
-        This method is optimized
+        This method is optimized: timestamps are counted by minutes once, other timelines are made of minutes
         """
-        return [
-            self.get_minutes_timeline(data),
-            self.get_hours_timeline(data),
-            self.get_days_timeline(data),
-            self.get_months_timeline(data),
-        ]
+        return self.get_all_timelines_from_minutes(*self.count_minutes(data))
 
-    def get_minutes_timeline(self, data: List[int]) -> List[Dict[str, int]]:
-        return self._get_timeline(data, MinuteInterval)
+    def get_minutes_timeline(self, data: Sequence[float]) -> List[Dict[str, int]]:
+        return self._as_timeline(*self._count(self._to_seconds(data) // MINUTE * MINUTE))
 
-    def get_hours_timeline(self, data: List[int]) -> List[Dict[str, int]]:
-        return self._get_timeline(data, HourInterval)
+    def get_hours_timeline(self, data: Sequence[float]) -> List[Dict[str, int]]:
+        return self._as_timeline(*self._count(self._to_seconds(data) // HOUR * HOUR))
 
-    def get_days_timeline(self, data: List[int]) -> List[Dict[str, int]]:
-        return self._get_timeline(data, DayInterval)
+    def get_days_timeline(self, data: Sequence[float]) -> List[Dict[str, int]]:
+        return self._as_timeline(*self._count(self._to_seconds(data) // DAY * DAY))
 
-    def get_months_timeline(self, data: List[int]) -> List[Dict[str, int]]:
-        return self._get_timeline(data, MonthInterval)
+    def get_months_timeline(self, data: Sequence[float]) -> List[Dict[str, int]]:
+        return self._as_timeline(*self._count(self._months(self._to_seconds(data))))
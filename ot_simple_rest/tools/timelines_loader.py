@@ -1,36 +1,141 @@
 from .base_loader import BaseLoader
 import json
+import multiprocessing
 import os
-from typing import List, Dict, Optional, Tuple, Union
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.cache_manifest import find_times, get_manifest, save_manifest, READ_SIZE
+from .timelines_builder import TimelinesBuilder
+
+MINUTES_FILE_NAME = '_MINUTES.npy'
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool(processes: int) -> ProcessPoolExecutor:
+    """
+    Returns process pool shared by loaders, it's started on the first call
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _read_block_times(block: bytes) -> np.ndarray:
+    times = find_times(block)
+    missing = np.flatnonzero(np.isnan(times))
+    if len(missing):
+        lines = block.split(b'\n')
+        for i in missing:
+            if lines[i].strip():
+                times[i] = float(json.loads(lines[i])['_time'])
+    return times
+
+
+def read_times(data_path: str) -> np.ndarray:
+    """
+    Reads _time of every line of part by chunks. Numeric _time is found by regex without parsing lines
+    (see utils.cache_manifest.find_times), only lines without it are parsed.
+    :param data_path:   path to file
+    :return:            float64 array of _time of every line, NaN for blank lines
+    """
+    times = []
+    rest = b''
+    with open(data_path, 'rb') as fr:
+        while True:
+            chunk = fr.read(READ_SIZE)
+            if not chunk:
+                break
+            end = chunk.rfind(b'\n') + 1
+            if not end:
+                rest += chunk
+                continue
+            times.append(_read_block_times(rest + chunk[:end]))
+            rest = chunk[end:]
+    if rest:
+        times.append(_read_block_times(rest + b'\n'))
+    return np.concatenate(times) if times else np.empty(0)
 
 
 class TimelinesLoader(BaseLoader):
     """
     Main purpose: to load data from cid, filter it.
+
+    _time column is read from columnar copy of cache if it's available, otherwise parts are read
+    in parallel by process pool of loader_processes (mem_conf) processes.
+
+    Timelines are made of minutes histogram of cache (see load_minutes), which is counted once and saved
+    to _MINUTES.npy of cache directory.
     """
 
+    DEFAULT_PROCESSES = 1
+
     def __init__(self, mem_conf: Dict, static_conf: Dict):
         super().__init__(mem_conf, static_conf)
+        self.processes = int(self.mem_conf.get('loader_processes', self.DEFAULT_PROCESSES))
 
-    def load_data(self, cid: str, from_time: Optional[int] = None, to_time: Optional[int] = None) -> List[int]:
+    def load_data(self, cid: str, from_time: Optional[int] = None, to_time: Optional[int] = None) -> np.ndarray:
         """
         Load data by cid
         :param cid:         OT_Dispatcher's job cid
         :param from_time:         not relevant for this class
         :param to_time:         not relevant for this class
-        :return:            list of timestamps and last_timestamp
+        :return:            contiguous array of timestamps
         """
-        data = []
         path_to_cache_dir = self._get_path_to_cache_dir(cid)
-        file_names = self._get_cache_file_names(path_to_cache_dir, cid)
-        total_lines = 0
-        for file_name in file_names:
-            self.logger.debug(f'Reading part: {file_name}')
-            self.read_file(data, os.path.join(path_to_cache_dir, file_name))
+        manifest = self._get_manifest(path_to_cache_dir, cid)
+        table = self._read_columns(path_to_cache_dir, ['_time'])
+        if table is not None:
+            column = table.column('_time')
+            if column.null_count:
+                raise KeyError('_time')
+            data = np.ascontiguousarray(column.to_numpy())
+        else:
+            data = self.read_parts(path_to_cache_dir, manifest)
         if not len(data):
             raise Exception('Empty data')
         return data
 
+    def load_minutes(self, cid: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns minutes histogram of cache from shared cache of loaders. It does blocking IO, run it in executor.
+        :param cid:         OT_Dispatcher's job cid
+        :return:            beginnings of minutes in UTC and numbers of events in them, see TimelinesBuilder
+        """
+        path_to_cache_dir = self._get_path_to_cache_dir(cid)
+        manifest = self._get_manifest(path_to_cache_dir, cid)
+        key = (type(self).__name__, 'minutes', self.data_path, cid, manifest['signature'])
+        return self.cache.get(key, lambda: self._load_minutes(cid, path_to_cache_dir))
+
+    def _load_minutes(self, cid: str, path_to_cache_dir: str) -> Tuple[np.ndarray, np.ndarray]:
+        manifest = get_manifest(path_to_cache_dir)
+        path = os.path.join(path_to_cache_dir, MINUTES_FILE_NAME)
+        if 'minutes' in manifest and os.path.exists(path):
+            self.logger.debug(f'Minutes of cache {cid} are read from {path}.')
+            minutes, counts = np.load(path)
+            return minutes, counts
+
+        minutes, counts = TimelinesBuilder().count_minutes(self.load_data(cid))
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}'
+        try:
+            with open(tmp_path, 'wb') as fw:
+                np.save(fw, np.stack([minutes, counts]))
+            os.replace(tmp_path, path)
+        except OSError as err:
+            self.logger.warning(f'Failed to save minutes of cache {cid}: {err}')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return minutes, counts
+        save_manifest(path_to_cache_dir, dict(manifest, minutes={'file': MINUTES_FILE_NAME, 'minutes': len(minutes)}))
+        return minutes, counts
+
     @staticmethod
     def read_file(data: List[int], data_path: str):
         """
@@ -38,6 +143,29 @@ class TimelinesLoader(BaseLoader):
         :param data:        list of timestamps that is mutated inside this method
         :param data_path:   path to file
         """
-        with open(data_path) as fr:
-            for line in fr:
-                data.append(json.loads(line)['_time'])
+        times = read_times(data_path)
+        data.extend(int(time) if time.is_integer() else time for time in times[~np.isnan(times)].tolist())
+
+    def read_parts(self, path_to_cache_dir: str, manifest: Dict) -> np.ndarray:
+        """
+        Reads _time of parts into array preallocated by number of lines of cache
+        :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+        :param manifest:            manifest of cache
+        :return:                    float64 array of timestamps
+        """
+        parts = manifest['parts']
+        data = np.empty(manifest['lines'], dtype=np.float64)
+        paths = [os.path.join(path_to_cache_dir, part['name']) for part in parts]
+        if self.processes > 1 and len(parts) > 1:
+            self.logger.debug(f'Reading {len(parts)} parts in {self.processes} processes.')
+            results = get_process_pool(self.processes).map(read_times, paths)
+        else:
+            results = map(read_times, paths)
+        offset = 0
+        for part, times in zip(parts, results):
+            self.logger.debug(f'Read part: {part["name"]}')
+            data[offset:offset + len(times)] = times
+            offset += len(times)
+        data = data[:offset]
+        blank = np.isnan(data)
+        return data[~blank] if blank.any() else data
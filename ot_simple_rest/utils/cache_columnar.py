@@ -0,0 +1,137 @@
+import logging
+import os
+import re
+import threading
+
+from utils.cache_manifest import get_manifest, parse_schema, save_manifest
+
+try:
+    import pyarrow as pa
+    import pyarrow.json as pa_json
+except ImportError:
+    pa = None
+
+__author__ = "Anton Khromov"
+__copyright__ = "Copyright 2019, Open Technologies 98"
+__credits__ = []
+__license__ = ""
+__version__ = "0.0.1"
+__maintainer__ = "Andrey Starchenkov"
+__email__ = "akhromov@ot.ru"
+__status__ = "Production"
+
+logger = logging.getLogger('osr')
+
+COLUMNAR_FILE_NAME = '_COLUMNS.arrow'
+READ_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Only scalar Spark types are stored, columns of other types (arrays, maps, structs...) are left out.
+_DECIMAL_RE = re.compile(r'DECIMAL(\(.*\))?$')
+if pa is not None:
+    _TYPES = {'TINYINT': pa.int64(), 'SMALLINT': pa.int64(), 'INT': pa.int64(), 'INTEGER': pa.int64(),
+              'BIGINT': pa.int64(), 'LONG': pa.int64(), 'FLOAT': pa.float64(), 'DOUBLE': pa.float64(),
+              'BOOLEAN': pa.bool_(), 'STRING': pa.string()}
+
+_building = {}
+_building_lock = threading.Lock()
+
+
+def arrow_schema(df_schema):
+    """
+    :param df_schema:   _SCHEMA of cache
+    :return:            pyarrow schema of scalar columns of _SCHEMA
+    """
+    fields = []
+    for name, column_type in parse_schema(df_schema):
+        column_type = column_type.upper()
+        arrow_type = pa.float64() if _DECIMAL_RE.match(column_type) else _TYPES.get(column_type)
+        if arrow_type is not None:
+            fields.append((name, arrow_type))
+    return pa.schema(fields)
+
+
+def build_columnar(path_to_cache_dir):
+    """
+    Writes columns of cache parts into Arrow IPC file _COLUMNS.arrow of cache directory and adds it to manifest
+    as "columnar": {"file", "columns", "rows"}. Columns and their types are taken from _SCHEMA, if parts
+    don't match it, "columnar" has no file and no columns, so it isn't built again.
+    It does blocking IO, run it in executor.
+
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :return:                    manifest with columnar or None if cache was changed while building
+    """
+    manifest = get_manifest(path_to_cache_dir)
+    schema = arrow_schema(manifest['schema'])
+    path = os.path.join(path_to_cache_dir, COLUMNAR_FILE_NAME)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}'
+    parse_options = pa_json.ParseOptions(explicit_schema=schema, unexpected_field_behavior='ignore')
+    read_options = pa_json.ReadOptions(block_size=READ_BLOCK_SIZE)
+    rows = 0
+    try:
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+            for part in manifest['parts']:
+                if part['size']:
+                    table = pa_json.read_json(os.path.join(path_to_cache_dir, part['name']),
+                                              read_options=read_options, parse_options=parse_options)
+                    writer.write_table(table)
+                    rows += table.num_rows
+        os.replace(tmp_path, path)
+        columnar = {'file': COLUMNAR_FILE_NAME, 'columns': schema.names, 'rows': rows}
+    except pa.ArrowInvalid as err:
+        logger.warning(f'Cache {path_to_cache_dir} doesn\'t match its schema, columns aren\'t stored: {err}')
+        columnar = {'file': None, 'columns': [], 'rows': 0}
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    manifest = dict(manifest, columnar=columnar)
+    return manifest if save_manifest(path_to_cache_dir, manifest) else None
+
+
+def _get_columnar_manifest(path_to_cache_dir):
+    manifest = get_manifest(path_to_cache_dir)
+    columnar = manifest.get('columnar')
+    if columnar is not None and (columnar['file'] is None
+                                 or os.path.exists(os.path.join(path_to_cache_dir, columnar['file']))):
+        return manifest
+    return None
+
+
+def read_columns(path_to_cache_dir, columns):
+    """
+    Reads columns of cache from its Arrow file, which is built on the first call (see build_columnar).
+    The file is memory mapped, so only pages of the columns are read. It does blocking IO, run it in executor.
+
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :param columns:             list of column names or None for all columns of _SCHEMA
+    :return:                    pyarrow Table or None if pyarrow isn't installed or columns aren't stored
+    """
+    if pa is None:
+        return None
+    path_to_cache_dir = os.path.normpath(path_to_cache_dir)
+    if get_manifest(path_to_cache_dir)['schema'] is None:
+        return None
+    manifest = _get_columnar_manifest(path_to_cache_dir)
+    if manifest is None:
+        # The same cache is built once by concurrent requests.
+        with _building_lock:
+            lock = _building.setdefault(path_to_cache_dir, threading.Lock())
+        try:
+            with lock:
+                manifest = _get_columnar_manifest(path_to_cache_dir)
+                if manifest is None:
+                    logger.debug(f'Building columns of cache {path_to_cache_dir}.')
+                    manifest = build_columnar(path_to_cache_dir)
+        finally:
+            with _building_lock:
+                _building.pop(path_to_cache_dir, None)
+        if manifest is None:
+            return None
+
+    columnar = manifest['columnar']
+    if columns is None:
+        columns = [name for name, _ in parse_schema(manifest['schema'])]
+    if columnar['file'] is None or not set(columns) <= set(columnar['columns']):
+        return None
+    with pa.memory_map(os.path.join(path_to_cache_dir, columnar['file'])) as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.select(columns)
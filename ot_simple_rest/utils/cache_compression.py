@@ -0,0 +1,282 @@
+import logging
+import os
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from tornado.ioloop import IOLoop
+
+from utils.cache_manifest import get_manifest, save_manifest
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__author__ = "Anton Khromov"
+__copyright__ = "Copyright 2019, Open Technologies 98"
+__credits__ = []
+__license__ = ""
+__version__ = "0.0.1"
+__maintainer__ = "Andrey Starchenkov"
+__email__ = "akhromov@ot.ru"
+__status__ = "Production"
+
+logger = logging.getLogger('osr')
+
+EXTENSIONS = {'zstd': '.zst', 'gzip': '.gz'}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+READ_SIZE = 1024 * 1024
+
+# Header of gzip member without name and mtime. Deflate stream of compressed copy ends with sync flush
+# and empty final block (see _compress_gzip).
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\x03'
+DEFLATE_END = b'\x03\x00'
+GZIP_TRAILER_SIZE = 8
+
+DEFAULT_WORKERS = 1
+
+_compressing = set()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(workers):
+    """
+    Returns executor of compression shared by handlers, it's started on the first call. Compression doesn't take
+    threads of default executor used by DB queries and reading of caches.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(workers, thread_name_prefix='compression')
+        return _executor
+
+
+@lru_cache()
+def parse_encodings(value):
+    """
+    :param value:   comma separated encodings from config, e.g. "zstd,gzip"
+    :return:        tuple of supported encodings in order of preference
+    """
+    encodings = [encoding.strip() for encoding in (value or '').split(',') if encoding.strip()]
+    for encoding in encodings:
+        if encoding not in EXTENSIONS:
+            raise ValueError(f'Unknown encoding of cache: {encoding}')
+    if 'zstd' in encodings and zstandard is None:
+        logger.warning('zstandard module is not installed, zstd encoding of cache is disabled')
+        encodings.remove('zstd')
+    return tuple(encodings)
+
+
+def choose_encoding(accept_encoding, encodings):
+    """
+    :param accept_encoding: Accept-Encoding header of request
+    :param encodings:       encodings of cache in order of preference
+    :return:                the first of encodings accepted by client or None
+    """
+    accepted = set()
+    for coding in (accept_encoding or '').split(','):
+        name, _, params = coding.partition(';')
+        params = params.replace(' ', '')
+        if name.strip() and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(name.strip().lower())
+    for encoding in encodings:
+        if encoding in accepted or '*' in accepted:
+            return encoding
+    return None
+
+
+def _gf2_matrix_times(matrix, vector):
+    result = 0
+    i = 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[i]
+        vector >>= 1
+        i += 1
+    return result
+
+
+def _gf2_matrix_square(matrix):
+    return [_gf2_matrix_times(matrix, row) for row in matrix]
+
+
+def crc32_combine(crc1, crc2, len2):
+    """
+    CRC-32 of concatenation of two blobs by their CRC-32 as zlib's crc32_combine does.
+
+    :param crc1:    CRC-32 of the first blob
+    :param crc2:    CRC-32 of the second blob
+    :param len2:    length of the second blob
+    :return:        CRC-32 of the first blob followed by the second one
+    """
+    if len2 <= 0:
+        return crc1
+    # Operator of one zero bit and then of two and four zero bits.
+    odd = [0xedb88320] + [1 << n for n in range(31)]
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+    while True:
+        even = _gf2_matrix_square(odd)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+        odd = _gf2_matrix_square(even)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+    return crc1 ^ crc2
+
+
+def _compress_gzip(fr, fw):
+    """
+    Writes single member gzip whose deflate stream ends with sync flush and empty final block, so its body
+    can be spliced with other ones into one gzip stream (see frame_raw_cache).
+    """
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    crc = isize = 0
+    fw.write(GZIP_HEADER)
+    while True:
+        chunk = fr.read(READ_SIZE)
+        if not chunk:
+            break
+        crc = zlib.crc32(chunk, crc)
+        isize += len(chunk)
+        fw.write(compressor.compress(chunk))
+    fw.write(compressor.flush(zlib.Z_SYNC_FLUSH))
+    end = compressor.flush(zlib.Z_FINISH)
+    if end != DEFLATE_END:
+        raise ValueError('Unexpected end of deflate stream')
+    fw.write(end)
+    fw.write(struct.pack('<II', crc, isize & 0xffffffff))
+    return {'crc32': crc, 'isize': isize}
+
+
+def _compress_zstd(fr, fw):
+    read, written = zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(fr, fw, read_size=READ_SIZE)
+    return {'isize': read}
+
+
+def compress_cache(path_to_cache_dir, encoding):
+    """
+    Writes compressed copies of parts and _SCHEMA next to them (part-00000.json.gz etc.) and adds them to manifest
+    of cache. Copies are written to temporary files in parent directory of cache (the same filesystem) and moved
+    to cache when they are complete. It does blocking IO, run it in executor.
+
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :param encoding:            gzip or zstd
+    :return:                    manifest with the encoding or None if cache was changed while compressing
+    """
+    manifest = get_manifest(path_to_cache_dir)
+    compress = _compress_gzip if encoding == 'gzip' else _compress_zstd
+    file_names = [part['name'] for part in manifest['parts']]
+    if manifest['schema'] is not None:
+        file_names.append('_SCHEMA')
+
+    tmp_dir = os.path.dirname(os.path.normpath(path_to_cache_dir))
+    variants = {}
+    crc = isize = 0
+    for file_name in file_names:
+        path = os.path.join(path_to_cache_dir, file_name)
+        compressed_path = path + EXTENSIONS[encoding]
+        tmp_path = os.path.join(tmp_dir, f'{file_name}{EXTENSIONS[encoding]}.{os.getpid()}.tmp')
+        try:
+            with open(path, 'rb') as fr, open(tmp_path, 'wb') as fw:
+                variant = compress(fr, fw)
+            os.replace(tmp_path, compressed_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        variant['size'] = os.path.getsize(compressed_path)
+        variants[file_name] = variant
+        if encoding == 'gzip' and file_name != '_SCHEMA':
+            crc = crc32_combine(crc, variant['crc32'], variant['isize'])
+            isize += variant['isize']
+
+    # Checksum of all parts lets gzip response be framed without reading them (see frame_raw_cache).
+    encoded = {'files': variants, 'crc32': crc, 'isize': isize}
+    encodings = dict(manifest.get('encodings', {}), **{encoding: encoded})
+    manifest = dict(manifest, encodings=encodings)
+    return manifest if save_manifest(path_to_cache_dir, manifest) else None
+
+
+def get_encoded_manifest(path_to_cache_dir, encoding):
+    """
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :param encoding:            gzip or zstd
+    :return:                    manifest if compressed copies of cache are ready or None
+    """
+    manifest = get_manifest(path_to_cache_dir)
+    encoded = manifest.get('encodings', {}).get(encoding)
+    if encoded is None:
+        return None
+    for file_name in encoded['files']:
+        if not os.path.exists(os.path.join(path_to_cache_dir, file_name + EXTENSIONS[encoding])):
+            return None
+    return manifest
+
+
+def request_compression(path_to_cache_dir, encoding, workers=DEFAULT_WORKERS):
+    """
+    Starts compression of cache in executor of compression unless it's already started. Call it from IOLoop.
+
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :param encoding:            gzip or zstd
+    :param workers:             number of threads of executor of compression if it isn't started yet
+    :return:                    None
+    """
+    key = (os.path.normpath(path_to_cache_dir), encoding)
+    if key in _compressing:
+        return
+    _compressing.add(key)
+
+    def done(future):
+        _compressing.discard(key)
+        if future.exception():
+            logger.error(f'Failed to compress cache {path_to_cache_dir} with {encoding}: {future.exception()}')
+
+    logger.debug(f'Compressing cache {path_to_cache_dir} with {encoding}.')
+    IOLoop.current().run_in_executor(get_executor(workers), compress_cache, path_to_cache_dir,
+                                     encoding).add_done_callback(done)
+
+
+def frame_raw_cache(encoding, head, manifest, path_to_cache_dir):
+    """
+    Makes compressed raw response (see utils.cache_stream.send_raw_cache) of compressed copies of parts:
+    gzip deflate streams are spliced into one gzip member, zstd frames are concatenated.
+    Only the head is compressed here.
+
+    :param encoding:            gzip or zstd
+    :param head:                the first line of response
+    :param manifest:            manifest with the encoding
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :return:                    prefix bytes, list of (path, start, end) of compressed copies, suffix bytes
+    """
+    encoded = manifest['encodings'][encoding]
+    variants = encoded['files']
+    ranges = []
+    if encoding == 'zstd':
+        prefix = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(head)
+        for part in manifest['parts']:
+            variant = variants[part['name']]
+            ranges.append((os.path.join(path_to_cache_dir, part['name'] + '.zst'), 0, variant['size']))
+        return prefix, ranges, b''
+
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    prefix = GZIP_HEADER + compressor.compress(head) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    for part in manifest['parts']:
+        variant = variants[part['name']]
+        ranges.append((os.path.join(path_to_cache_dir, part['name'] + '.gz'), len(GZIP_HEADER),
+                       variant['size'] - len(DEFLATE_END) - GZIP_TRAILER_SIZE))
+    crc = crc32_combine(zlib.crc32(head), encoded['crc32'], encoded['isize'])
+    isize = len(head) + encoded['isize']
+    return prefix, ranges, DEFLATE_END + struct.pack('<II', crc, isize & 0xffffffff)
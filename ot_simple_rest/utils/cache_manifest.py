@@ -0,0 +1,372 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+__author__ = "Anton Khromov"
+__copyright__ = "Copyright 2019, Open Technologies 98"
+__credits__ = []
+__license__ = ""
+__version__ = "0.0.1"
+__maintainer__ = "Andrey Starchenkov"
+__email__ = "akhromov@ot.ru"
+__status__ = "Production"
+
+logger = logging.getLogger('osr')
+
+MANIFEST_FILE_NAME = '_MANIFEST'
+MANIFEST_VERSION = 4
+MANIFESTS_CACHE_SIZE = 1024
+READ_SIZE = 1024 * 1024
+LINE_INDEX_STEP = 1024
+
+# Matches every line of block of whole lines, the group is numeric _time of line or empty. Only _time preceded
+# by no other opening brace than the line's one is taken: it's the key of top-level object, not of nested one
+# (quotes inside of strings are escaped, so "_time" can't be a part of string).
+_LINE_TIME_RE = re.compile(rb'[ \t]*\{[^{\n]*?"_time"[ \t]*:[ \t]*(-?[0-9][0-9.eE+-]*)[^\n]*\n|[^\n]*\n')
+# Columns of _SCHEMA are separated by commas followed by backquoted name, types may have commas too.
+_SCHEMA_COLUMNS_RE = re.compile(r',(?=\s*`)')
+_SCHEMA_COLUMN_RE = re.compile(r'\s*`((?:[^`]|``)*)`\s*(.*)', re.S)
+
+_manifests = OrderedDict()
+_manifests_lock = threading.Lock()
+
+
+def parse_schema(df_schema):
+    """
+    :param df_schema:   _SCHEMA of cache, e.g. "`_time` BIGINT,`_raw` STRING"
+    :return:            list of (column name, column type) in order of _SCHEMA
+    """
+    columns = []
+    for column in _SCHEMA_COLUMNS_RE.split(df_schema or ''):
+        match = _SCHEMA_COLUMN_RE.match(column)
+        if match:
+            columns.append((match.group(1).replace('``', '`'), match.group(2).strip()))
+    return columns
+
+
+def _as_number(value):
+    return int(value) if value.is_integer() else value
+
+
+def _parse_time(line):
+    try:
+        value = json.loads(line)['_time']
+    except (ValueError, KeyError, TypeError):
+        return np.nan
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+def find_times(block):
+    """
+    Finds numeric _time of lines by regex, lines where it isn't found (e.g. _time follows nested object) are parsed.
+
+    :param block:   whole lines
+    :return:        array of _time of every line, NaN if line has no numeric _time
+    """
+    values = np.array(_LINE_TIME_RE.findall(block))
+    times = np.full(len(values), np.nan)
+    found = values != b''
+    times[found] = values[found].astype(np.float64)
+    missing = np.flatnonzero(~found)
+    if len(missing):
+        lines = block.split(b'\n')
+        for i in missing.tolist():
+            if lines[i].strip():
+                times[i] = _parse_time(lines[i])
+    return times
+
+
+def _time_index(times):
+    """
+    :param times:   _time of every line of part
+    :return:        [min _time, max _time] of every block of LINE_INDEX_STEP lines or None if some lines of block
+                    have no numeric _time, so the block can't be skipped by time range
+    """
+    blocks = np.full(-(-len(times) // LINE_INDEX_STEP) * LINE_INDEX_STEP, np.inf)
+    blocks[:len(times)] = times
+    blocks = blocks.reshape(-1, LINE_INDEX_STEP)
+    complete = ~np.isnan(blocks).any(axis=1)
+    mins = np.where(complete, blocks.min(axis=1), 0)
+    maxs = np.where(complete, np.where(np.isinf(blocks), -np.inf, blocks).max(axis=1), 0)
+    return [[_as_number(low), _as_number(high)] if is_complete else None
+            for low, high, is_complete in zip(mins.tolist(), maxs.tolist(), complete.tolist())]
+
+
+def _scan_part(path, with_times=False):
+    """
+    Counts lines of JSON lines part and makes sparse index of lines: offsets of every LINE_INDEX_STEP-th line.
+    With times it also finds min and max of _time without parsing lines and min and max of _time of lines
+    between offsets of the index.
+
+    :param path:        path to part
+    :param with_times:  find _time of lines
+    :return:            part's entry of manifest
+    """
+    lines = 0
+    times = []
+    line_index = [0]
+    position = 0
+    rest = b''
+    with open(path, 'rb') as fr:
+        while True:
+            chunk = fr.read(READ_SIZE)
+            if not chunk:
+                break
+            line_ends = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord('\n'))
+            # Line breaks closing lines number LINE_INDEX_STEP, 2 * LINE_INDEX_STEP...
+            first = (-lines - 1) % LINE_INDEX_STEP
+            line_index += (line_ends[first::LINE_INDEX_STEP] + position + 1).tolist()
+            lines += len(line_ends)
+            position += len(chunk)
+            if not with_times:
+                rest = chunk[-1:] if chunk[-1:] != b'\n' else b''
+                continue
+            # Only whole lines are scanned, so _time isn't cut by chunk's end.
+            if not len(line_ends):
+                rest += chunk
+                continue
+            end = line_ends[-1] + 1
+            times.append(find_times(rest + chunk[:end]))
+            rest = chunk[end:]
+    if rest:
+        lines += 1
+        if with_times:
+            times.append(find_times(rest + b'\n'))
+    if line_index[-1] == position:
+        line_index.pop()
+    part = {'name': os.path.basename(path), 'size': position, 'lines': lines, 'line_index': line_index}
+    if with_times:
+        times = np.concatenate(times) if times else np.empty(0)
+        found = times[~np.isnan(times)]
+        part.update(min_time=_as_number(found.min().item()) if len(found) else None,
+                    max_time=_as_number(found.max().item()) if len(found) else None,
+                    time_index=_time_index(times))
+    return part
+
+
+def _get_signature(path_to_cache_dir):
+    """
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :return:                    digest of names, sizes and mtimes of parts and _SCHEMA, other files of directory
+                                (manifest, compressed and columnar copies...) don't change it
+    """
+    files = sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+                   for entry in os.scandir(path_to_cache_dir)
+                   if entry.name[-5:] == '.json' or entry.name == '_SCHEMA')
+    return hashlib.md5(json.dumps(files).encode()).hexdigest()
+
+
+def build_manifest(path_to_cache_dir, with_times=False):
+    """
+    Scans cache directory.
+
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :param with_times:          find _time of lines of parts, it takes much longer than counting lines
+    :return:                    manifest {"version", "signature": see _get_signature, "schema": _SCHEMA or None,
+                                "size", "lines", "line_step": LINE_INDEX_STEP,
+                                "parts": [{"name", "size", "lines",
+                                           "line_index": offsets of lines 0, line_step, 2 * line_step...}, ...]}
+                                with times manifest and its parts have "min_time", "max_time" and parts have
+                                "time_index": [min, max] of _time of lines of every block of line_index or None
+                                if it's unknown
+    """
+    signature = _get_signature(path_to_cache_dir)
+    try:
+        with open(os.path.join(path_to_cache_dir, '_SCHEMA')) as fr:
+            df_schema = fr.read().strip()
+    except FileNotFoundError:
+        df_schema = None
+    parts = [_scan_part(os.path.join(path_to_cache_dir, file_name), with_times)
+             for file_name in os.listdir(path_to_cache_dir) if file_name[-5:] == '.json']
+    manifest = {'version': MANIFEST_VERSION, 'signature': signature, 'schema': df_schema,
+                'size': sum(part['size'] for part in parts), 'lines': sum(part['lines'] for part in parts),
+                'line_step': LINE_INDEX_STEP, 'parts': parts}
+    if with_times:
+        min_times = [part['min_time'] for part in parts if part['min_time'] is not None]
+        max_times = [part['max_time'] for part in parts if part['max_time'] is not None]
+        manifest.update(min_time=min(min_times) if min_times else None,
+                        max_time=max(max_times) if max_times else None)
+    return manifest
+
+
+def _read_manifest(path_to_cache_dir, signature):
+    manifest_path = os.path.join(path_to_cache_dir, MANIFEST_FILE_NAME)
+    try:
+        with open(manifest_path) as fr:
+            manifest = json.load(fr)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('signature') != signature:
+        return None
+    return manifest
+
+
+def _write_manifest(path_to_cache_dir, manifest):
+    manifest_path = os.path.join(path_to_cache_dir, MANIFEST_FILE_NAME)
+    tmp_path = f'{manifest_path}.{os.getpid()}.{threading.get_ident()}'
+    try:
+        with open(tmp_path, 'w') as fw:
+            json.dump(manifest, fw)
+        os.replace(tmp_path, manifest_path)
+    except OSError as err:
+        logger.warning(f'Failed to write manifest of cache {path_to_cache_dir}: {err}')
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _put(path_to_cache_dir, manifest):
+    with _manifests_lock:
+        _manifests[path_to_cache_dir] = manifest
+        _manifests.move_to_end(path_to_cache_dir)
+        while len(_manifests) > MANIFESTS_CACHE_SIZE:
+            _manifests.popitem(last=False)
+
+
+def get_manifest(path_to_cache_dir, with_times=False):
+    """
+    Returns manifest of cache (see build_manifest). It's kept in memory and in _MANIFEST file of cache directory
+    and is rebuilt when parts or _SCHEMA are changed (see _get_signature), only files of directory are listed
+    and stat'ed on every call. _time of lines is found only on the first call with times,
+    they are kept in manifest afterwards. It does blocking IO, run it in executor from IOLoop.
+
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :param with_times:          manifest must have min and max of _time and time index of parts
+    :return:                    manifest dict, don't change it
+    """
+    path_to_cache_dir = os.path.normpath(path_to_cache_dir)
+    signature = _get_signature(path_to_cache_dir)
+    with _manifests_lock:
+        cached = _manifests.get(path_to_cache_dir)
+        if cached is not None and cached['signature'] == signature and (not with_times or 'min_time' in cached):
+            _manifests.move_to_end(path_to_cache_dir)
+            return cached
+
+    if cached is not None and cached['signature'] == signature:
+        manifest = cached
+    else:
+        manifest = _read_manifest(path_to_cache_dir, signature)
+    if manifest is None or with_times and 'min_time' not in manifest:
+        logger.debug(f'Building manifest of cache {path_to_cache_dir}{" with times" if with_times else ""}.')
+        built = build_manifest(path_to_cache_dir, with_times)
+        # Keys added to manifest of the same parts (e.g. compressed copies) are kept.
+        if manifest is not None and manifest['signature'] == built['signature']:
+            built = dict(manifest, **built)
+        manifest = built
+        _write_manifest(path_to_cache_dir, manifest)
+
+    _put(path_to_cache_dir, manifest)
+    return manifest
+
+
+def save_manifest(path_to_cache_dir, manifest):
+    """
+    Saves manifest extended with data about cache, e.g. compressed copies of parts written next to them.
+
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :param manifest:            manifest got by get_manifest with additional keys
+    :return:                    False if parts of cache were changed and manifest isn't saved
+    """
+    path_to_cache_dir = os.path.normpath(path_to_cache_dir)
+    if _get_signature(path_to_cache_dir) != manifest['signature']:
+        return False
+    with _manifests_lock:
+        cached = _manifests.get(path_to_cache_dir)
+    # Keys added to the same manifest meanwhile (e.g. by compression in background) are kept.
+    if cached is not None and cached['signature'] == manifest['signature']:
+        manifest.update((key, value) for key, value in cached.items() if key not in manifest)
+    _write_manifest(path_to_cache_dir, manifest)
+    _put(path_to_cache_dir, manifest)
+    return True
+
+
+def read_lines(path_to_cache_dir, manifest, offset, limit):
+    """
+    Reads lines of cache from offset seeking to them by sparse index of lines of manifest, so only needed blocks
+    of parts are read. It does blocking IO, run it in executor.
+
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :param manifest:            manifest of cache
+    :param offset:              number of the first line in cache, parts are numbered in manifest's order
+    :param limit:               max number of lines
+    :return:                    list of lines without line breaks
+    """
+    lines = []
+    step = manifest['line_step']
+    for part in manifest['parts']:
+        if len(lines) >= limit:
+            break
+        if offset >= part['lines']:
+            offset -= part['lines']
+            continue
+        block = offset // step
+        with open(os.path.join(path_to_cache_dir, part['name']), 'rb') as fr:
+            fr.seek(part['line_index'][block])
+            for _ in range(offset - block * step):
+                fr.readline()
+            while len(lines) < limit:
+                line = fr.readline()
+                if not line:
+                    break
+                lines.append(line.rstrip(b'\r\n'))
+        offset = 0
+    return lines
+
+
+def time_ranges(manifest, from_time=None, to_time=None):
+    """
+    Finds blocks of lines of parts which may have _time in [from_time, to_time] by time index of manifest.
+
+    :param manifest:    manifest of cache, with times if from_time or to_time is given
+    :param from_time:   min _time or None
+    :param to_time:     max _time or None
+    :return:            dict of part name and list of (start, end) byte ranges of the blocks, adjacent blocks
+                        are merged, parts without such blocks are left out
+    """
+    if from_time is None and to_time is None:
+        return {part['name']: [(0, part['size'])] for part in manifest['parts'] if part['size']}
+    ranges = {}
+    for part in manifest['parts']:
+        offsets = part['line_index'] + [part['size']]
+        part_ranges = []
+        for i, bounds in enumerate(part['time_index']):
+            if bounds is not None and (from_time is not None and bounds[1] < from_time
+                                       or to_time is not None and bounds[0] > to_time):
+                continue
+            if part_ranges and part_ranges[-1][1] == offsets[i]:
+                part_ranges[-1] = (part_ranges[-1][0], offsets[i + 1])
+            else:
+                part_ranges.append((offsets[i], offsets[i + 1]))
+        if part_ranges:
+            ranges[part['name']] = part_ranges
+    return ranges
+
+
+def iter_range_lines(path, ranges):
+    """
+    Reads lines of byte ranges of part by chunks. It does blocking IO, run it in executor.
+
+    :param path:    path to part
+    :param ranges:  list of (start, end) of ranges of whole lines, see time_ranges
+    :return:        generator of lines with line breaks
+    """
+    with open(path, 'rb') as fr:
+        for start, end in ranges:
+            fr.seek(start)
+            rest = b''
+            while start < end:
+                chunk = fr.read(min(READ_SIZE, end - start))
+                if not chunk:
+                    break
+                start += len(chunk)
+                lines = (rest + chunk).split(b'\n')
+                rest = lines.pop()
+                for line in lines:
+                    yield line + b'\n'
+            if rest:
+                yield rest
@@ -0,0 +1,268 @@
+import json
+import mmap
+import os
+
+from tornado.ioloop import IOLoop
+
+from utils.cache_compression import frame_raw_cache
+from utils.cache_manifest import get_manifest, parse_schema, time_ranges, iter_range_lines
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+__author__ = "Anton Khromov"
+__copyright__ = "Copyright 2019, Open Technologies 98"
+__credits__ = []
+__license__ = ""
+__version__ = "0.0.1"
+__maintainer__ = "Andrey Starchenkov"
+__email__ = "akhromov@ot.ru"
+__status__ = "Production"
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+RAW_CONTENT_TYPE = 'application/x-ndjson'
+
+if orjson is not None:
+    _loads, _dumps = orjson.loads, orjson.dumps
+else:
+    _loads = json.loads
+
+    def _dumps(event):
+        return json.dumps(event, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def get_cache_parts(path_to_cache_dir):
+    """
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :return:                    schema and list of (part name, size in bytes)
+    """
+    with open(os.path.join(path_to_cache_dir, '_SCHEMA')) as fr:
+        df_schema = fr.read().strip()
+    parts = [(entry.name, entry.stat().st_size) for entry in os.scandir(path_to_cache_dir)
+             if entry.name[-5:] == '.json']
+    return df_schema, parts
+
+
+def iter_cache_chunks(path_to_cache_dir, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Reads cache parts by chunks and yields response
+    {"status": "success", "schema": <_SCHEMA>, "events": {<part name>: <part content as JSON string>, ...}}
+    as bytes. Chunks are escaped one by one, so the response is the same as escaping whole parts
+    but only one chunk is kept in memory.
+
+    It does blocking reads, run it in executor.
+
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :param chunk_size:          number of characters read from part at once
+    :return:                    generator of response bytes
+    """
+    file_names = [file_name for file_name in os.listdir(path_to_cache_dir) if file_name[-5:] == '.json']
+    with open(os.path.join(path_to_cache_dir, '_SCHEMA')) as fr:
+        df_schema = fr.read()
+    yield ('{"status": "success", "schema": "%s", "events": {' % df_schema.strip()).encode()
+    length = len(file_names)
+    for i in range(length):
+        file_name = file_names[i]
+        yield f'"{file_name}": "'.encode()
+        with open(os.path.join(path_to_cache_dir, file_name)) as fr:
+            while True:
+                chunk = fr.read(chunk_size)
+                if not chunk:
+                    break
+                # Escaped string without quotes, json.dumps escapes every character separately.
+                yield json.dumps(chunk)[1:-1].encode()
+        yield b'"' if i == length - 1 else b'", '
+    yield b'}}'
+
+
+def project_schema(df_schema, fields):
+    """
+    :param df_schema:   _SCHEMA of cache, e.g. "`_time` BIGINT,`_raw` STRING"
+    :param fields:      list of fields or None
+    :return:            _SCHEMA with only columns of fields in its order
+    """
+    if df_schema is None or fields is None:
+        return df_schema
+    fields = set(fields)
+    return ','.join('`%s` %s' % (name.replace('`', '``'), column_type)
+                    for name, column_type in parse_schema(df_schema) if name in fields)
+
+
+def make_event_filter(fields=None, from_time=None, to_time=None):
+    """
+    Makes function of cache line which returns the line with only fields or None if line's _time is out of
+    [from_time, to_time]. Lines are parsed with orjson if it's installed.
+
+    :param fields:      list of fields or None for all fields
+    :param from_time:   min _time or None
+    :param to_time:     max _time or None
+    :return:            function of line bytes returning line bytes with line break or None
+    """
+    with_time = from_time is not None or to_time is not None
+
+    def event_filter(line):
+        if not line.strip():
+            return None
+        event = _loads(line)
+        if with_time:
+            _time = event.get('_time')
+            if not isinstance(_time, (int, float)):
+                try:
+                    _time = float(_time)
+                except (TypeError, ValueError):
+                    return None
+            if from_time is not None and _time < from_time or to_time is not None and _time > to_time:
+                return None
+        if fields is None:
+            return line if line[-1:] == b'\n' else line + b'\n'
+        return _dumps({field: event[field] for field in fields if field in event}) + b'\n'
+
+    return event_filter
+
+
+def iter_filtered_cache_chunks(path_to_cache_dir, fields=None, from_time=None, to_time=None,
+                               chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the same response as iter_cache_chunks, but only with events whose _time is in [from_time, to_time]
+    and only with fields of them. _SCHEMA is trimmed to the fields. Only blocks of lines whose time range
+    in manifest intersects the range are read (see utils.cache_manifest.time_ranges), content of parts
+    without such blocks is empty.
+
+    It does blocking reads, run it in executor.
+
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :param fields:              list of fields or None for all fields
+    :param from_time:           min _time or None
+    :param to_time:             max _time or None
+    :param chunk_size:          number of bytes of filtered lines escaped at once
+    :return:                    generator of response bytes
+    """
+    manifest = get_manifest(path_to_cache_dir, with_times=from_time is not None or to_time is not None)
+    event_filter = make_event_filter(fields, from_time, to_time)
+    df_schema = project_schema(manifest['schema'], fields)
+    yield ('{"status": "success", "schema": "%s", "events": {' % (df_schema or '')).encode()
+    parts = manifest['parts']
+    ranges = time_ranges(manifest, from_time, to_time)
+    for i, part in enumerate(parts):
+        yield f'"{part["name"]}": "'.encode()
+        if part['name'] in ranges:
+            buffer, size = [], 0
+            for line in iter_range_lines(os.path.join(path_to_cache_dir, part['name']), ranges[part['name']]):
+                line = event_filter(line)
+                if line is None:
+                    continue
+                buffer.append(line)
+                size += len(line)
+                if size >= chunk_size:
+                    yield json.dumps(b''.join(buffer).decode())[1:-1].encode()
+                    buffer, size = [], 0
+            if buffer:
+                yield json.dumps(b''.join(buffer).decode())[1:-1].encode()
+        yield b'"' if i == len(parts) - 1 else b'", '
+    yield b'}}'
+
+
+async def stream_chunks(handler, chunks, flush_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes chunks of blocking generator to handler's response. Generator is advanced in executor and response is
+    flushed every flush_size bytes waiting for the client to receive them, so memory used doesn't depend
+    on response size.
+
+    :param handler:     tornado.web.RequestHandler
+    :param chunks:      generator of bytes, e.g. iter_cache_chunks
+    :param flush_size:  number of bytes written between flushes
+    :return:            number of written bytes
+    """
+    loop = IOLoop.current()
+    written = pending = 0
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                break
+            handler.write(chunk)
+            written += len(chunk)
+            pending += len(chunk)
+            if pending >= flush_size:
+                await handler.flush()
+                pending = 0
+    finally:
+        chunks.close()
+    return written
+
+
+async def stream_cache(handler, path_to_cache_dir, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes cache to handler's response (see iter_cache_chunks and stream_chunks).
+
+    :param handler:             tornado.web.RequestHandler
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :param chunk_size:          number of characters read from part at once
+    :return:                    number of written bytes
+    """
+    return await stream_chunks(handler, iter_cache_chunks(path_to_cache_dir, chunk_size), chunk_size)
+
+
+async def send_raw_cache(handler, path_to_cache_dir, chunk_size=DEFAULT_CHUNK_SIZE, encoding=None, manifest=None):
+    """
+    Writes cache to handler's response as is: the first line is manifest
+    {"status": "success", "schema": <_SCHEMA>, "parts": [{"name": <part name>, "size": <bytes>}, ...]}
+    and then parts follow one by one, so the client splits them by sizes.
+
+    Parts are not decoded and copied in Python: their memory maps are written to the connection by windows
+    of chunk_size bytes with Content-Length framing, every window is awaited till it's sent and then dropped
+    from process memory. With encoding response is made of compressed copies of parts
+    (see utils.cache_compression.frame_raw_cache) and sent with Content-Encoding.
+
+    :param handler:             tornado.web.RequestHandler
+    :param path_to_cache_dir:   directory with _SCHEMA and *.json parts of cache
+    :param chunk_size:          number of bytes written at once
+    :param encoding:            gzip, zstd or None
+    :param manifest:            manifest of cache, required with encoding
+    :return:                    number of written bytes
+    """
+    if manifest is None:
+        df_schema, parts = await IOLoop.current().run_in_executor(None, get_cache_parts, path_to_cache_dir)
+    else:
+        df_schema, parts = manifest['schema'], [(part['name'], part['size']) for part in manifest['parts']]
+    head = {'status': 'success', 'schema': df_schema, 'parts': [{'name': name, 'size': size} for name, size in parts]}
+    head = (json.dumps(head) + '\n').encode()
+    if encoding is None:
+        prefix, suffix = head, b''
+        ranges = [(os.path.join(path_to_cache_dir, name), 0, size) for name, size in parts]
+    else:
+        prefix, ranges, suffix = frame_raw_cache(encoding, head, manifest, path_to_cache_dir)
+        handler.set_header('Content-Encoding', encoding)
+    length = len(prefix) + sum(end - start for _, start, end in ranges) + len(suffix)
+    handler.set_header('Content-Type', RAW_CONTENT_TYPE)
+    handler.set_header('Content-Length', length)
+    handler.write(prefix)
+    await handler.flush()
+
+    # Windows are page aligned to be dropped from memory with madvise.
+    window = max(chunk_size // mmap.PAGESIZE, 1) * mmap.PAGESIZE
+    for path, start, end in ranges:
+        if end > start:
+            await _send_range(handler.request.connection, path, start, end, window)
+    if suffix:
+        await handler.request.connection.write(suffix)
+    return length
+
+
+async def _send_range(connection, path, start, end, window):
+    with open(path, 'rb') as fr:
+        mm = mmap.mmap(fr.fileno(), end, access=mmap.ACCESS_READ)
+    try:
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+        for offset in range(start - start % window, end, window):
+            with memoryview(mm)[max(offset, start):min(offset + window, end)] as view:
+                await connection.write(view)
+            mm.madvise(mmap.MADV_DONTNEED, offset, min(window, end - offset))
+    finally:
+        try:
+            mm.close()
+        except BufferError:
+            # Closed connection still refers to the window, the map is closed when the window is collected.
+            pass
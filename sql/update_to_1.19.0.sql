@@ -0,0 +1,121 @@
+ALTER TABLE OTLQueries ADD COLUMN hashed_original_otl VARCHAR(128);
+
+CREATE OR REPLACE FUNCTION hash_original_otl() RETURNS TRIGGER AS
+$$
+BEGIN
+    NEW.hashed_original_otl := encode(sha512(convert_to(NEW.original_otl, 'UTF8')), 'hex');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER otlqueries_hash_original_otl BEFORE INSERT OR UPDATE OF original_otl ON OTLQueries
+    FOR EACH ROW EXECUTE PROCEDURE hash_original_otl();
+
+UPDATE OTLQueries SET hashed_original_otl = encode(sha512(convert_to(original_otl, 'UTF8')), 'hex');
+ALTER TABLE OTLQueries ALTER COLUMN hashed_original_otl SET NOT NULL;
+
+CREATE INDEX otlqueries_hashed_original_otl_idx ON OTLQueries (hashed_original_otl, tws, twf, field_extraction, preview);
+
+CREATE OR REPLACE FUNCTION register_job(_original_otl TEXT, _service_otl TEXT, _subsearches TEXT[],
+                                        _tws INTEGER, _twf INTEGER, _cache_ttl INTEGER, _username TEXT,
+                                        _field_extraction BOOLEAN, _preview BOOLEAN,
+                                        _sid TEXT DEFAULT NULL, _src_ip TEXT DEFAULT NULL, _sid_otl TEXT DEFAULT NULL)
+RETURNS TABLE (job_id INTEGER, creating_date DOUBLE PRECISION, registration TEXT) AS
+$$
+DECLARE
+    _hashed_original_otl VARCHAR(128) := encode(sha512(convert_to(_original_otl, 'UTF8')), 'hex');
+BEGIN
+    -- Registrations of the same job wait for each other till the end of transaction, so only one of them inserts.
+    PERFORM pg_advisory_xact_lock(hashtext(_hashed_original_otl),
+                                  hashtext(concat_ws(':', _tws, _twf, _field_extraction, _preview)));
+
+    IF _cache_ttl > 0 THEN
+        RETURN QUERY SELECT c.id, extract(epoch from c.creating_date)::DOUBLE PRECISION, 'cache'::TEXT
+            FROM CachesDL c
+            WHERE c.hashed_original_otl = _hashed_original_otl AND c.tws = _tws AND c.twf = _twf
+                AND c.field_extraction = _field_extraction AND c.preview = _preview
+            LIMIT 1;
+        IF FOUND THEN
+            RETURN;
+        END IF;
+    END IF;
+
+    RETURN QUERY SELECT q.id, extract(epoch from q.creating_date)::DOUBLE PRECISION, 'running'::TEXT
+        FROM OTLQueries q
+        WHERE q.hashed_original_otl = _hashed_original_otl AND q.tws = _tws AND q.twf = _twf
+            AND q.field_extraction = _field_extraction AND q.preview = _preview AND q.status IN ('running', 'new')
+        LIMIT 1;
+    IF FOUND THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY INSERT INTO OTLQueries (original_otl, service_otl, subsearches, tws, twf, cache_ttl, username,
+                                         field_extraction, preview)
+        VALUES (_original_otl, _service_otl, _subsearches, _tws, _twf, _cache_ttl, _username,
+                _field_extraction, _preview)
+        RETURNING id, extract(epoch from OTLQueries.creating_date)::DOUBLE PRECISION, 'new'::TEXT;
+
+    IF _sid IS NOT NULL THEN
+        INSERT INTO GUISIDs (sid, src_ip, otl) VALUES (_sid, _src_ip, _sid_otl) ON CONFLICT DO NOTHING;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_otlqueries_changes() RETURNS TRIGGER AS
+$$
+DECLARE
+    _old_status status_type;
+BEGIN
+    -- Query text and message are not sent because NOTIFY payload is limited by 8000 bytes.
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('otlqueries_changes', json_build_object(
+            'op', TG_OP, 'id', OLD.id, 'hashed_original_otl', OLD.hashed_original_otl, 'tws', OLD.tws, 'twf', OLD.twf,
+            'field_extraction', OLD.field_extraction, 'preview', OLD.preview, 'old_status', OLD.status)::TEXT);
+        RETURN OLD;
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        _old_status := OLD.status;
+    END IF;
+    PERFORM pg_notify('otlqueries_changes', json_build_object(
+        'op', TG_OP, 'id', NEW.id, 'hashed_original_otl', NEW.hashed_original_otl, 'tws', NEW.tws, 'twf', NEW.twf,
+        'field_extraction', NEW.field_extraction, 'preview', NEW.preview, 'status', NEW.status,
+        'old_status', _old_status)::TEXT);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER otlqueries_notify_changes AFTER INSERT OR UPDATE OF status, msg OR DELETE ON OTLQueries
+    FOR EACH ROW EXECUTE PROCEDURE notify_otlqueries_changes();
+
+CREATE OR REPLACE FUNCTION notify_cachesdl_changes() RETURNS TRIGGER AS
+$$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('cachesdl_changes', json_build_object(
+            'op', TG_OP, 'id', OLD.id, 'hashed_original_otl', OLD.hashed_original_otl, 'tws', OLD.tws, 'twf', OLD.twf,
+            'field_extraction', OLD.field_extraction, 'preview', OLD.preview)::TEXT);
+        RETURN OLD;
+    END IF;
+    PERFORM pg_notify('cachesdl_changes', json_build_object(
+        'op', TG_OP, 'id', NEW.id, 'hashed_original_otl', NEW.hashed_original_otl, 'tws', NEW.tws, 'twf', NEW.twf,
+        'field_extraction', NEW.field_extraction, 'preview', NEW.preview,
+        'expiring_date', extract(epoch from NEW.expiring_date))::TEXT);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER cachesdl_notify_changes AFTER INSERT OR UPDATE OR DELETE ON CachesDL
+    FOR EACH ROW EXECUTE PROCEDURE notify_cachesdl_changes();
+
+CREATE OR REPLACE FUNCTION notify_ticks_changes() RETURNS TRIGGER AS
+$$
+BEGIN
+    -- Delta is calculated by DB clock as in heartbeat check, so clocks of DB and REST hosts may differ.
+    PERFORM pg_notify('ticks_changes', json_build_object(
+        'delta', extract(epoch from CURRENT_TIMESTAMP) - extract(epoch from NEW.lastcheck))::TEXT);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ticks_notify_changes AFTER INSERT OR UPDATE ON Ticks
+    FOR EACH ROW EXECUTE PROCEDURE notify_ticks_changes();
@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+import unittest
+
+import shutil
+
+from utils.cache_columnar import read_columns, COLUMNAR_FILE_NAME
+from utils.cache_manifest import get_manifest
+from tools.interesting_fields_builder import InterestingFieldsBuilder
+from tools.interesting_fields_loader import InterestingFieldsLoader
+from tools.timelines_loader import TimelinesLoader
+
+
+class TestCacheColumnar(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'search_1.cache', 'data')
+        os.makedirs(self.path)
+        self.write_schema('`_time` BIGINT,`host` STRING,`bytes` DOUBLE,`tags` ARRAY<STRING>')
+        self.events = []
+        for n in range(3):
+            with open(os.path.join(self.path, f'part-{n:05}.json'), 'w') as fw:
+                for i in range(100 * n):
+                    event = {'_time': 1650000000 + 60 * i + n, 'host': f'host{i % 7}', 'tags': ['a']}
+                    if i % 3:
+                        event['bytes'] = i * 1.5
+                    self.events.append(event)
+                    fw.write(json.dumps(event) + '\n')
+        self.conf = {'path': self.tmp.name}
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def write_schema(self, df_schema):
+        # Changed _SCHEMA makes manifest rebuilt.
+        with open(os.path.join(self.path, '_SCHEMA.tmp'), 'w') as fw:
+            fw.write(df_schema + '\n')
+        os.replace(os.path.join(self.path, '_SCHEMA.tmp'), os.path.join(self.path, '_SCHEMA'))
+
+    def test_read_columns(self):
+        table = read_columns(self.path, ['_time', 'bytes'])
+        self.assertTrue(os.path.exists(os.path.join(self.path, COLUMNAR_FILE_NAME)))
+        self.assertEqual(get_manifest(self.path)['columnar']['rows'], len(self.events))
+        self.assertEqual(table.column_names, ['_time', 'bytes'])
+        self.assertEqual(sorted(table.column('_time').to_pylist()), sorted(event['_time'] for event in self.events))
+        self.assertEqual(table.column('bytes').null_count, sum('bytes' not in event for event in self.events))
+        # Arrays aren't stored, so all columns of _SCHEMA can't be read.
+        self.assertIsNone(read_columns(self.path, None))
+        self.assertIsNone(read_columns(self.path, ['tags']))
+
+    def test_loaders(self):
+        timelines = TimelinesLoader(self.conf, {}).load_data('1')
+        self.assertEqual(sorted(timelines), sorted(event['_time'] for event in self.events))
+
+        self.write_schema('`_time` BIGINT,`host` STRING,`bytes` DOUBLE')
+        from_time, to_time = 1650000000 + 60 * 10, 1650000000 + 60 * 50
+        df = InterestingFieldsLoader(self.conf, {}).load_data('1', from_time, to_time)
+        self.assertTrue(os.path.exists(os.path.join(self.path, COLUMNAR_FILE_NAME)))
+        self.assertEqual(list(df.columns), ['_time', 'host', 'bytes'])
+        events = [event for event in self.events if from_time <= event['_time'] <= to_time]
+        self.assertEqual(sorted(df['_time']), sorted(event['_time'] for event in events))
+        self.assertEqual(df['host'].value_counts().to_dict(),
+                         {host: sum(event['host'] == host for event in events) for host in set(df['host'])})
+        self.assertEqual(int(df['bytes'].count()), sum('bytes' in event for event in events))
+
+    def test_interesting_fields_of_both_paths(self):
+        # Numbers as strings, integral doubles, doubles and booleans with nulls, column without values.
+        self.write_schema('`_time` BIGINT,`host` STRING,`code` STRING,`size` DOUBLE,`user` STRING,'
+                          '`bytes` DOUBLE,`ok` BOOLEAN,`empty` STRING')
+        for n in range(3):
+            with open(os.path.join(self.path, f'part-{n:05}.json'), 'w') as fw:
+                for i in range(40):
+                    event = {'_time': 1650000000 + 40 * n + i, 'host': f'host{i % 3}', 'code': str(i % 3),
+                             'size': float(i % 4)}
+                    if i % 5:
+                        event['bytes'] = i * 1.5
+                        event['ok'] = i % 2 == 0
+                    if n == 0 and i < 10:
+                        event['user'] = f'user{i}'
+                    fw.write(json.dumps(event) + '\n')
+        # The same parts without _SCHEMA have no columnar copy.
+        shutil.copytree(self.path, os.path.join(self.tmp.name, 'search_2.cache', 'data'),
+                        ignore=shutil.ignore_patterns('_SCHEMA', '_MANIFEST'))
+        builder = InterestingFieldsBuilder()
+        loader = InterestingFieldsLoader(dict(self.conf, loader_chunk_size='50'), {})
+        for from_time, to_time in ((None, None), (1650000030, 1650000089)):
+            columnar = builder.get_interesting_fields_from_counts(loader.load_counts('1', from_time, to_time))
+            self.assertTrue(os.path.exists(os.path.join(self.path, COLUMNAR_FILE_NAME)))
+            parts = builder.get_interesting_fields_from_counts(loader.load_counts('2', from_time, to_time))
+            self.assertEqual(json.dumps(columnar), json.dumps(parts))
+            # Column without values in the time range is kept as the whole data are read and filtered.
+            self.assertEqual([field['text'] for field in columnar],
+                             ['_time', 'host', 'code', 'size', 'user', 'bytes', 'ok'])
+            self.assertEqual(columnar[4]['totalCount'], 0 if from_time else 10)
+        self.assertEqual(sorted(value['value'] for value in columnar[2]['static']), [0, 1, 2])
+
+    def test_schema_mismatch(self):
+        self.write_schema('`_time` BIGINT,`host` BIGINT')
+        self.assertIsNone(read_columns(self.path, ['_time']))
+        self.assertIsNone(get_manifest(self.path)['columnar']['file'])
+        # Parts are read instead.
+        self.assertEqual(len(TimelinesLoader(self.conf, {}).load_data('1')), len(self.events))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import gzip
+import os
+import tempfile
+import unittest
+import zlib
+from unittest import mock
+
+from utils.cache_compression import choose_encoding, compress_cache, crc32_combine, frame_raw_cache, \
+    get_encoded_manifest
+from utils.cache_manifest import get_manifest
+
+
+class TestCacheCompression(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name
+        with open(os.path.join(self.path, '_SCHEMA'), 'w') as fw:
+            fw.write('`_time` BIGINT,`_raw` STRING\n')
+        for n in range(3):
+            with open(os.path.join(self.path, f'part-{n:05}.json'), 'w') as fw:
+                for i in range(1000 * n):
+                    fw.write(f'{{"_time": {i}, "_raw": "event {i} of part {n}"}}\n')
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_crc32_combine(self):
+        first, second = b'first blob', b'second blob' * 1000
+        self.assertEqual(crc32_combine(zlib.crc32(first), zlib.crc32(second), len(second)),
+                         zlib.crc32(first + second))
+        self.assertEqual(crc32_combine(zlib.crc32(first), 0, 0), zlib.crc32(first))
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip, deflate, br, zstd', ('zstd', 'gzip')), 'zstd')
+        self.assertEqual(choose_encoding('gzip;q=0.5, zstd;q=0', ('zstd', 'gzip')), 'gzip')
+        self.assertIsNone(choose_encoding('br', ('gzip',)))
+        self.assertIsNone(choose_encoding(None, ('gzip',)))
+
+    def test_gzip_raw_cache(self):
+        self.assertIsNone(get_encoded_manifest(self.path, 'gzip'))
+        compress_cache(self.path, 'gzip')
+        manifest = get_encoded_manifest(self.path, 'gzip')
+        self.assertIsNotNone(manifest)
+        # Manifest stays valid after compressed copies are written next to parts.
+        self.assertIs(get_manifest(self.path), manifest)
+
+        prefix, ranges, suffix = frame_raw_cache('gzip', b'head\n', manifest, self.path)
+        body = prefix
+        for path, start, end in ranges:
+            with open(path, 'rb') as fr:
+                body += fr.read()[start:end]
+        body += suffix
+
+        expected = b'head\n'
+        for part in manifest['parts']:
+            with open(os.path.join(self.path, part['name']), 'rb') as fr:
+                expected += fr.read()
+            with gzip.open(os.path.join(self.path, part['name'] + '.gz')) as fr:
+                self.assertEqual(fr.read(), expected[-part['size']:] if part['size'] else b'')
+        # One gzip member, clients like curl don't read the following ones.
+        decompressor = zlib.decompressobj(wbits=31)
+        self.assertEqual(decompressor.decompress(body), expected)
+        self.assertTrue(decompressor.eof)
+        self.assertEqual(decompressor.unused_data, b'')
+
+    def test_temporary_files_outside_of_cache(self):
+        cache_dir = os.path.join(self.path, 'data')
+        os.mkdir(cache_dir)
+        for file_name in os.listdir(self.path):
+            if file_name != 'data':
+                os.rename(os.path.join(self.path, file_name), os.path.join(cache_dir, file_name))
+        with mock.patch('os.replace', wraps=os.replace) as replace:
+            compress_cache(cache_dir, 'gzip')
+        self.assertEqual({os.path.dirname(args[0]) for args, _ in replace.call_args_list if args[1].endswith('.gz')},
+                         {self.path})
+        self.assertEqual(os.listdir(self.path), ['data'])
+        self.assertIsNotNone(get_encoded_manifest(cache_dir, 'gzip'))
+
+
+if __name__ == '__main__':
+    unittest.main()
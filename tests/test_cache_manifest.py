@@ -0,0 +1,141 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from utils import cache_manifest
+from utils.cache_manifest import get_manifest, read_lines, time_ranges, iter_range_lines, find_times, \
+    MANIFEST_FILE_NAME
+
+
+class TestCacheManifest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name
+        with open(os.path.join(self.path, '_SCHEMA'), 'w') as fw:
+            fw.write('`_time` BIGINT,`_raw` STRING\n')
+        self.write_part('part-00000.json', [{'_time': 20, '_raw': '"_time": 1'}, {'_time': 10, '_raw': 'b'}])
+        # Last line without line break.
+        with open(os.path.join(self.path, 'part-00001.json'), 'w') as fw:
+            fw.write('{"_raw": "c", "_time": 30.5}\n{"_time": 5}')
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def write_part(self, file_name, events):
+        with open(os.path.join(self.path, file_name), 'w') as fw:
+            for event in events:
+                fw.write(json.dumps(event) + '\n')
+
+    def test_manifest(self):
+        # _time of lines isn't looked for till it's needed.
+        self.assertNotIn('min_time', get_manifest(self.path))
+        manifest = get_manifest(self.path, with_times=True)
+        self.assertEqual(manifest['schema'], '`_time` BIGINT,`_raw` STRING')
+        self.assertEqual((manifest['lines'], manifest['min_time'], manifest['max_time']), (4, 5, 30.5))
+        parts = {part['name']: part for part in manifest['parts']}
+        self.assertEqual(set(parts), {'part-00000.json', 'part-00001.json'})
+        self.assertEqual((parts['part-00000.json']['lines'], parts['part-00000.json']['min_time'],
+                          parts['part-00000.json']['max_time']), (2, 10, 20))
+        self.assertEqual(parts['part-00001.json']['size'], os.path.getsize(os.path.join(self.path, 'part-00001.json')))
+        self.assertTrue(os.path.exists(os.path.join(self.path, MANIFEST_FILE_NAME)))
+
+    def test_manifest_is_read_from_file(self):
+        get_manifest(self.path)
+        cache_manifest._manifests.clear()
+        os.remove(os.path.join(self.path, 'part-00000.json'))
+        # Parts are changed, so manifest is rebuilt.
+        self.assertEqual(get_manifest(self.path)['lines'], 2)
+
+        manifest = get_manifest(self.path)
+        cache_manifest._manifests.clear()
+        self.assertEqual(get_manifest(self.path), manifest)
+
+    def test_new_part_rebuilds_manifest(self):
+        self.assertEqual(get_manifest(self.path)['lines'], 4)
+        time.sleep(0.01)
+        self.write_part('part-00002.json', [{'_time': 100}])
+        manifest = get_manifest(self.path, with_times=True)
+        self.assertEqual((manifest['lines'], manifest['max_time'], len(manifest['parts'])), (5, 100, 3))
+
+    def test_other_files_keep_manifest(self):
+        manifest = dict(get_manifest(self.path, with_times=True), encodings={'gzip': True})
+        self.assertTrue(cache_manifest.save_manifest(self.path, manifest))
+        cache_manifest._manifests.clear()
+        # Compressed copies, columns and other files written next to parts don't make manifest rebuilt.
+        time.sleep(0.01)
+        with open(os.path.join(self.path, 'part-00000.json.gz'), 'wb') as fw:
+            fw.write(b'x')
+        with mock.patch.object(cache_manifest, 'build_manifest') as build_manifest:
+            self.assertEqual(get_manifest(self.path, with_times=True), manifest)
+            self.assertEqual(get_manifest(self.path), manifest)
+        build_manifest.assert_not_called()
+
+        # Changed part does.
+        time.sleep(0.01)
+        self.write_part('part-00000.json', [{'_time': 1}])
+        self.assertEqual(get_manifest(self.path)['lines'], 3)
+
+    def test_read_lines(self):
+        self.write_part('part-00002.json', [{'_time': i, '_raw': 'x' * (i % 7)} for i in range(5000)])
+        lines = []
+        for part in get_manifest(self.path)['parts']:
+            with open(os.path.join(self.path, part['name']), 'rb') as fr:
+                lines += fr.read().splitlines()
+
+        # Small reads and index step make index cross chunks.
+        read_size, step = cache_manifest.READ_SIZE, cache_manifest.LINE_INDEX_STEP
+        cache_manifest.READ_SIZE, cache_manifest.LINE_INDEX_STEP = 1000, 100
+        try:
+            manifest = cache_manifest.build_manifest(self.path)
+        finally:
+            cache_manifest.READ_SIZE, cache_manifest.LINE_INDEX_STEP = read_size, step
+        self.assertEqual(manifest['lines'], len(lines))
+        for offset, limit in ((0, 10), (1, 3), (99, 2), (100, 250), (2000, 1), (len(lines) - 5, 100),
+                              (len(lines), 10), (3, 0)):
+            self.assertEqual(read_lines(self.path, manifest, offset, limit), lines[offset:offset + limit])
+
+    def test_nested_time(self):
+        # _time of nested objects isn't taken for _time of event.
+        events = [{'info': {'_time': 1}, '_time': 100}, {'_raw': '{', '_time': 200},
+                  {'_time': 300, 'info': {'_time': 2}}, {'info': [{'_time': 3}]}, {'_time': 'not a number'}]
+        block = ''.join(json.dumps(event) + '\n' for event in events).encode() + b'\n'
+        self.assertEqual(find_times(block)[:3].tolist(), [100, 200, 300])
+        self.assertTrue(all(time != time for time in find_times(block)[3:].tolist()))
+        self.write_part('part-00000.json', events)
+        parts = get_manifest(self.path, with_times=True)['parts']
+        self.assertEqual((parts[0]['min_time'], parts[0]['max_time']), (100, 300))
+
+    def test_time_ranges(self):
+        events = [{'_time': 1000 + i, '_raw': 'x' * (i % 7)} for i in range(5000)]
+        events[2500] = {'_raw': 'no time'}
+        self.write_part('part-00002.json', events)
+        step = cache_manifest.LINE_INDEX_STEP
+        cache_manifest.LINE_INDEX_STEP = 100
+        try:
+            manifest = cache_manifest.build_manifest(self.path, with_times=True)
+        finally:
+            cache_manifest.LINE_INDEX_STEP = step
+        part = [part for part in manifest['parts'] if part['name'] == 'part-00002.json'][0]
+        self.assertEqual(part['time_index'][:2], [[1000, 1099], [1100, 1199]])
+        # Block with line without _time can't be skipped.
+        self.assertIsNone(part['time_index'][25])
+        self.assertEqual(part['time_index'][-1], [5900, 5999])
+
+        ranges = time_ranges(manifest, 1150, 1260)
+        self.assertEqual(set(ranges), {'part-00002.json'})
+        lines = list(iter_range_lines(os.path.join(self.path, 'part-00002.json'), ranges['part-00002.json']))
+        times = [json.loads(line).get('_time') for line in lines]
+        self.assertEqual(times, list(range(1100, 1300)) + [None] + list(range(3501, 3600)))
+
+        self.assertEqual(set(time_ranges(manifest, to_time=20)), {'part-00000.json', 'part-00001.json',
+                                                                 'part-00002.json'})
+        self.assertEqual(set(time_ranges(manifest, from_time=25, to_time=999)), {'part-00001.json',
+                                                                                 'part-00002.json'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import json
+import os
+import tempfile
+import unittest
+
+from utils.cache_stream import iter_cache_chunks, iter_filtered_cache_chunks, get_cache_parts, project_schema
+
+
+class TestCacheStream(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name
+        with open(os.path.join(self.path, '_SCHEMA'), 'w') as fw:
+            fw.write('`_time` BIGINT,`_raw` STRING\n')
+        self.parts = {
+            'part-00000.json': '{"_time":1,"_raw":"a \\"quoted\\" \\\\ line\\ttab"}\n{"_time":2,"_raw":"кириллица 😀"}\n',
+            'part-00001.json': '{"_time":3,"_raw":"' + 'x' * 100 + '"}\r\n',
+        }
+        for file_name, body in self.parts.items():
+            with open(os.path.join(self.path, file_name), 'w', newline='') as fw:
+                fw.write(body)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_chunks_are_the_same_as_whole_response(self):
+        response = b''.join(iter_cache_chunks(self.path, chunk_size=7)).decode()
+        result = json.loads(response)
+        self.assertEqual(result['schema'], '`_time` BIGINT,`_raw` STRING')
+        self.assertEqual(result['events'], {file_name: body.replace('\r\n', '\n')
+                                            for file_name, body in self.parts.items()})
+        self.assertEqual(response, b''.join(iter_cache_chunks(self.path, chunk_size=2 ** 20)).decode())
+
+    def test_cache_parts(self):
+        df_schema, parts = get_cache_parts(self.path)
+        self.assertEqual(df_schema, '`_time` BIGINT,`_raw` STRING')
+        self.assertEqual(sorted(parts), sorted((file_name, len(body.encode()))
+                                               for file_name, body in self.parts.items()))
+
+    def test_empty_cache(self):
+        for file_name in self.parts:
+            os.remove(os.path.join(self.path, file_name))
+        result = json.loads(b''.join(iter_cache_chunks(self.path)))
+        self.assertEqual(result['events'], {})
+
+    def test_filtered_chunks(self):
+        result = json.loads(b''.join(iter_filtered_cache_chunks(self.path, fields=['_raw'], from_time=2,
+                                                                chunk_size=7)))
+        self.assertEqual(result['schema'], '`_raw` STRING')
+        self.assertEqual(result['events'], {'part-00000.json': json.dumps({'_raw': 'кириллица 😀'},
+                                                                          ensure_ascii=False,
+                                                                          separators=(',', ':')) + '\n',
+                                            'part-00001.json': '{"_raw":"' + 'x' * 100 + '"}\n'})
+
+        # The second part is out of range by its manifest.
+        result = json.loads(b''.join(iter_filtered_cache_chunks(self.path, from_time=0, to_time=1.5)))
+        self.assertEqual(result['schema'], '`_time` BIGINT,`_raw` STRING')
+        self.assertEqual(result['events'], {'part-00000.json': self.parts['part-00000.json'].splitlines()[0] + '\n',
+                                            'part-00001.json': ''})
+
+    def test_project_schema(self):
+        df_schema = '`_time` BIGINT,`a,b` DECIMAL(10,2),`m` MAP<STRING,INT>'
+        self.assertEqual(project_schema(df_schema, ['m', 'a,b']), '`a,b` DECIMAL(10,2),`m` MAP<STRING,INT>')
+        self.assertEqual(project_schema(df_schema, None), df_schema)
+        self.assertEqual(project_schema(df_schema, ['x']), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import asyncio
+import unittest
+
+from jobs_manager.sampler import DispatcherSampler
+
+
+class FakeConnector:
+
+    def __init__(self):
+        self.queries = 0
+
+    async def check_dispatcher_status(self):
+        self.queries += 1
+        return 2.0
+
+    async def get_running_jobs_num(self):
+        self.queries += 1
+        return 3
+
+
+class TestDispatcherSampler(unittest.TestCase):
+
+    def test_sample_is_read_from_memory(self):
+        async def run():
+            db = FakeConnector()
+            sampler = DispatcherSampler(None, db, interval=10)
+            await sampler.sample()
+            for _ in range(100):
+                self.assertGreaterEqual(sampler.get_dispatcher_delta(), 2.0)
+                self.assertEqual(sampler.running_jobs_num, 3)
+            self.assertEqual(db.queries, 2)
+
+        asyncio.run(run())
+
+    def test_stale_sample_is_not_used(self):
+        async def run():
+            sampler = DispatcherSampler(None, FakeConnector(), interval=10, max_staleness=0.01)
+            self.assertIsNone(sampler.get_dispatcher_delta())
+            await sampler.sample()
+            await asyncio.sleep(0.02)
+            self.assertIsNone(sampler.get_dispatcher_delta())
+            self.assertIsNone(sampler.running_jobs_num)
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
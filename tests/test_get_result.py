@@ -0,0 +1,31 @@
+import asyncio
+import logging
+import unittest
+from types import SimpleNamespace
+
+from handlers.jobs.getresult import GetResult
+
+
+class TestGetResult(unittest.TestCase):
+
+    def get(self, **params):
+        # Handler without connection, status and response are collected instead of being written.
+        handler = GetResult.__new__(GetResult)
+        handler.logger = logging.getLogger('osr')
+        handler.request = SimpleNamespace(query_arguments={k: [v.encode()] for k, v in params.items()})
+        written = {'status': 200}
+        handler.set_status = lambda status: written.update(status=status)
+        handler.write = lambda response: written.update(response=response)
+        asyncio.run(handler.get())
+        return written
+
+    def test_page_with_time_range(self):
+        for params in ({'offset': '10', 'from': '1650000000'}, {'limit': '10', 'to': '1650000000'}):
+            with self.subTest(params=params):
+                written = self.get(cid='1', **params)
+                self.assertEqual(written['status'], 400)
+                self.assertEqual(written['response']['status'], 'failed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,8 @@ import unittest
 import json
 import pandas as pd
 import os.path
+import tempfile
+from tools.interesting_fields_builder import InterestingFieldsBuilder
 from tools.interesting_fields_loader import InterestingFieldsLoader
 
 
@@ -40,3 +42,43 @@ class TestInterestingFields(unittest.TestCase):
 
 
 
+
+    def test_counts_by_chunks(self):
+        events = [{'_time': 1, 'host': 'a', 'code': 1}, {'_time': 2, 'host': 'b'}, {'_time': 3, 'host': 'a', 'code': 2},
+                  {'_time': 4, 'host': 'c', 'code': 1}, {'_time': 5, 'host': 'a', 'code': 1},
+                  {'_time': 6, 'host': 'b', 'code': 3}, {'_time': 7, 'host': 'a'}]
+        # Interesting fields of the events as one DataFrame made by the builder before counting by chunks.
+        expected = [
+            {'id': 0, 'text': '_time', 'totalCount': 7,
+             'static': [{'value': time, 'count': 1, '%': 14} for time in range(1, 8)]},
+            {'id': 1, 'text': 'host', 'totalCount': 7,
+             'static': [{'value': 'a', 'count': 4, '%': 57}, {'value': 'b', 'count': 2, '%': 29},
+                        {'value': 'c', 'count': 1, '%': 14}]},
+            {'id': 2, 'text': 'code', 'totalCount': 5,
+             'static': [{'value': 1.0, 'count': 3, '%': 43}, {'value': 2.0, 'count': 1, '%': 14},
+                        {'value': 3.0, 'count': 1, '%': 14}]}]
+        expected_range = [
+            {'id': 0, 'text': '_time', 'totalCount': 4,
+             'static': [{'value': time, 'count': 1, '%': 25} for time in range(3, 7)]},
+            {'id': 1, 'text': 'host', 'totalCount': 4,
+             'static': [{'value': 'a', 'count': 2, '%': 50}, {'value': 'c', 'count': 1, '%': 25},
+                        {'value': 'b', 'count': 1, '%': 25}]},
+            {'id': 2, 'text': 'code', 'totalCount': 4,
+             'static': [{'value': 1.0, 'count': 2, '%': 50}, {'value': 2.0, 'count': 1, '%': 25},
+                        {'value': 3.0, 'count': 1, '%': 25}]}]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'search_1.cache', 'data')
+            os.makedirs(path)
+            for n, (start, end) in enumerate(((0, 3), (3, 5), (5, 7))):
+                with open(os.path.join(path, f'part-{n:05}.json'), 'w') as fw:
+                    fw.writelines(json.dumps(event) + '\n' for event in events[start:end])
+            builder = InterestingFieldsBuilder()
+            # Chunks of two lines: counts of host a and code 1 are split across chunks and parts.
+            loader = InterestingFieldsLoader(mem_conf={'path': tmp, 'loader_chunk_size': '2'}, static_conf={})
+            # Data of all parts are loaded.
+            self.assertEqual(len(loader.load_data('1')), len(events))
+            counts = loader.load_counts('1')
+            self.assertEqual((counts.rows, counts.not_empty), (7, {'_time': 7, 'host': 7, 'code': 5}))
+            self.assertEqual(builder.get_interesting_fields_from_counts(counts), expected)
+            counts = loader.load_counts('1', from_time=3, to_time=6)
+            self.assertEqual(builder.get_interesting_fields_from_counts(counts), expected_range)
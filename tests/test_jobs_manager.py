@@ -0,0 +1,152 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from handlers.jobs.db_connector import job_key
+from jobs_manager.manager import JobsManager
+
+
+class FakeJob:
+
+    def __init__(self, counter, duration=0.01, fingerprint=None, registration='new'):
+        self.counter = counter
+        self.duration = duration
+        self.fingerprint = fingerprint or object()
+        self.queued_at = None
+        self.status = {'status': 'created'}
+        self.registration = None
+        self.made_registration = registration
+        self.done = False
+
+    async def start_make(self):
+        self.counter['in_flight'] += 1
+        self.counter['max_in_flight'] = max(self.counter['max_in_flight'], self.counter['in_flight'])
+        await asyncio.sleep(self.duration)
+        self.counter['in_flight'] -= 1
+        self.counter['made'] = self.counter.get('made', 0) + 1
+        self.status = {'status': 'success', 'job_id': self.counter['made']}
+        self.registration = self.made_registration
+        self.done = True
+
+    async def add_sid(self):
+        self.counter['sids'] = self.counter.get('sids', 0) + 1
+
+
+class FakeConnector:
+
+    def __init__(self):
+        self.queries = []
+
+    async def check_dispatcher_status(self):
+        self.queries.append('check_dispatcher_status')
+        return 1
+
+    async def check_jobs_status(self, *, keys):
+        self.queries.append('check_jobs_status')
+        return {job_key('| makeresults count=1', 0, 0, False, False): (1, 'running', None, None),
+                job_key('| makeresults count=2', 0, 0, False, False): (2, 'failed', None, 'error')}
+
+
+class TestJobsManager(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.counter = {'in_flight': 0, 'max_in_flight': 0}
+
+    def get_manager(self, workers, queue_size):
+        return JobsManager(None, {}, {'tracker_max_interval': 60}, {},
+                           manager_conf={'workers': workers, 'queue_size': queue_size,
+                                         'sampler_interval': 0})
+
+    def test_workers_limit_in_flight_jobs(self):
+        async def run():
+            manager = self.get_manager(workers=3, queue_size=100)
+            manager.start()
+            jobs = [FakeJob(self.counter) for _ in range(50)]
+            manager._enqueue(jobs)
+            await manager.jobs_queue.join()
+            manager.stop()
+            return manager, jobs
+
+        manager, jobs = asyncio.run(run())
+        self.assertTrue(all(job.done for job in jobs))
+        self.assertEqual(self.counter['max_in_flight'], 3)
+        stats = manager.get_stats()
+        self.assertEqual(stats['processed'], 50)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['max_queue_depth'], 50)
+        self.assertGreater(stats['max_wait_time'], 0)
+
+    def test_full_queue_rejects_all_jobs_of_request(self):
+        async def run():
+            manager = self.get_manager(workers=1, queue_size=3)
+            manager._enqueue([FakeJob(self.counter), FakeJob(self.counter)])
+            with self.assertRaises(asyncio.QueueFull):
+                manager._enqueue([FakeJob(self.counter), FakeJob(self.counter)])
+            return manager
+
+        manager = asyncio.run(run())
+        self.assertEqual(manager.jobs_queue.qsize(), 2)
+
+    def make_same_jobs(self, registration):
+        fingerprint = ('| makeresults', 0, 0, False, False)
+
+        async def run():
+            manager = self.get_manager(workers=4, queue_size=100)
+            manager.start()
+            jobs = [FakeJob(self.counter, fingerprint=fingerprint, registration=registration) for _ in range(30)]
+            for job in jobs:
+                manager._enqueue([job])
+            await manager.jobs_queue.join()
+            await asyncio.gather(*manager._sid_tasks)
+            manager.stop()
+            return manager, jobs
+
+        return asyncio.run(run())
+
+    def test_same_jobs_share_one_flight(self):
+        manager, jobs = self.make_same_jobs('new')
+        self.assertEqual(self.counter['made'], 1)
+        self.assertEqual({job.status['job_id'] for job in jobs}, {1})
+        # SIDs of jobs which joined the flight are added, the made one adds its SID when it's registered.
+        self.assertEqual(self.counter['sids'], 29)
+        stats = manager.get_stats()
+        self.assertEqual(stats['single_flight_misses'], 1)
+        self.assertEqual(stats['single_flight_hits'], 29)
+        self.assertEqual(stats['in_flight_fingerprints'], 0)
+
+    def test_sids_are_added_only_for_new_job(self):
+        # SID isn't added for cached or already running job, as register_job does.
+        for registration in ('cache', 'running'):
+            manager, jobs = self.make_same_jobs(registration)
+            self.assertEqual({job.registration for job in jobs}, {registration})
+        self.assertNotIn('sids', self.counter)
+
+    def test_batch_takes_one_place_in_queue(self):
+        async def run():
+            manager = self.get_manager(workers=1, queue_size=1)
+            jobs = [FakeJob(self.counter, fingerprint=(n % 3,)) for n in range(6)]
+            manager._enqueue(jobs, batch=True)
+            with self.assertRaises(asyncio.QueueFull):
+                manager._enqueue([FakeJob(self.counter)])
+            return manager, manager.jobs_queue.get_nowait()
+
+        manager, batch = asyncio.run(run())
+        self.assertEqual(len(batch.jobs), 3)
+        self.assertEqual(manager.get_stats()['single_flight_hits'], 3)
+
+    def test_check_jobs_makes_two_queries(self):
+        def request(original_otl):
+            arguments = {'original_otl': [original_otl.encode()], 'tws': [b'0'], 'twf': [b'0'], 'cache_ttl': [b'60']}
+            return SimpleNamespace(arguments=arguments, body_arguments=arguments, remote_ip='127.0.0.1')
+
+        async def run():
+            manager = self.get_manager(workers=1, queue_size=1)
+            manager.async_db_conn = FakeConnector()
+            statuses = await manager.check_jobs(hid='test', requests=[
+                request('| makeresults count=2'), request('| makeresults count=3'), request('| makeresults count=1'),
+                request('| makeresults count=1'), SimpleNamespace(arguments={}, remote_ip='127.0.0.1')])
+            return manager.async_db_conn.queries, statuses
+
+        queries, statuses = asyncio.run(run())
+        self.assertEqual(queries, ['check_dispatcher_status', 'check_jobs_status'])
+        self.assertEqual([status['status'] for status in statuses], ['failed', 'notfound', 'running', 'running', 'error'])
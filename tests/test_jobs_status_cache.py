@@ -0,0 +1,83 @@
+import asyncio
+import json
+import unittest
+
+from jobs_manager.status_cache import JobsStatusCache
+
+
+class TestJobsStatusCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cache = JobsStatusCache(None)
+        self.cache.ready = True
+        self.cache._running_jobs_num = 0
+        self.key = self.cache.make_key('| makeresults', 0, 10, 'false', False)
+
+    def notify(self, channel, **event):
+        hashed_original_otl, tws, twf, field_extraction, preview = self.key
+        event = {'hashed_original_otl': hashed_original_otl, 'tws': tws, 'twf': twf,
+                 'field_extraction': field_extraction, 'preview': preview, **event}
+        self.cache._on_notification(None, 0, channel, json.dumps(event))
+
+    def test_job_status_follows_events(self):
+        self.notify('otlqueries_changes', op='INSERT', id=1, status='new', old_status=None)
+        self.assertEqual(self.cache.get_job_status(self.key), (1, 'new', None, None))
+
+        self.notify('otlqueries_changes', op='UPDATE', id=1, status='running', old_status='new')
+        self.assertEqual(self.cache.running_jobs_num, 1)
+
+        self.notify('cachesdl_changes', op='INSERT', id=1, expiring_date=100.0)
+        self.notify('otlqueries_changes', op='UPDATE', id=1, status='finished', old_status='running')
+        self.assertEqual(self.cache.get_job_status(self.key), (1, 'finished', 100.0, None))
+        self.assertEqual(self.cache.running_jobs_num, 0)
+
+        self.notify('cachesdl_changes', op='DELETE', id=1)
+        self.assertEqual(self.cache.get_job_status(self.key), (1, 'finished', None, None))
+
+    def test_failed_job_is_looked_up_in_db(self):
+        self.notify('otlqueries_changes', op='INSERT', id=1, status='new', old_status=None)
+        self.notify('otlqueries_changes', op='UPDATE', id=1, status='failed', old_status='new')
+        self.assertIsNone(self.cache.get_job_status(self.key))
+
+        generation = self.cache.generation
+        self.cache.put_job_status(self.key, (1, 'failed', None, 'error'), generation)
+        self.assertEqual(self.cache.get_job_status(self.key), (1, 'failed', None, 'error'))
+
+    def test_lookup_older_than_event_is_not_put(self):
+        generation = self.cache.generation
+        self.notify('otlqueries_changes', op='UPDATE', id=1, status='running', old_status='new')
+        self.cache.put_job_status(self.key, (1, 'new', None, None), generation)
+        self.assertIsNone(self.cache.get_job_status(self.key))
+
+    def test_lookup_is_not_dropped_by_ticks(self):
+        generation = self.cache.generation
+        self.notify('ticks_changes', delta=1)
+        self.notify('ticks_changes', delta=0)
+        self.cache.put_job_status(self.key, (1, 'new', None, None), generation)
+        self.assertEqual(self.cache.get_job_status(self.key), (1, 'new', None, None))
+        self.assertLess(self.cache.get_dispatcher_delta(), 1)
+
+    def test_watchers_are_woken_by_job_events(self):
+        async def run():
+            changed = self.cache.watch(self.key)
+            other = self.cache.watch(self.cache.make_key('| makeresults count=2', 0, 10, False, False))
+            self.notify('otlqueries_changes', op='INSERT', id=1, status='new', old_status=None)
+            self.assertTrue(changed.done())
+            self.assertFalse(other.done())
+            other.cancel()
+            await asyncio.sleep(0)
+            self.assertEqual(self.cache.get_stats()['watched_jobs'], 0)
+
+        asyncio.run(run())
+
+    def test_not_ready_cache_misses(self):
+        self.notify('otlqueries_changes', op='INSERT', id=1, status='new', old_status=None)
+        self.notify('ticks_changes', delta=1)
+        self.cache.ready = False
+        self.assertIsNone(self.cache.get_job_status(self.key))
+        self.assertIsNone(self.cache.get_dispatcher_delta())
+        self.assertIsNone(self.cache.running_jobs_num)
+
+
+if __name__ == '__main__':
+    unittest.main()
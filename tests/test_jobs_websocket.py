@@ -0,0 +1,56 @@
+import asyncio
+import logging
+import unittest
+
+from handlers.jobs.jobsws import JobsWebSocket
+
+
+class FakeManager:
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.watches = 0
+
+    async def watch_job(self, *, hid, request, status=None):
+        self.watches += 1
+        return {'status': self.statuses[min(self.watches, len(self.statuses)) - 1]}
+
+
+class FakeChecker:
+
+    @staticmethod
+    def check_notifications(**response):
+        return []
+
+
+class TestJobsWebSocket(unittest.TestCase):
+
+    def watch(self, statuses):
+        # Handler without connection, messages are collected instead of being written.
+        handler = JobsWebSocket.__new__(JobsWebSocket)
+        handler.handler_id = 'test'
+        handler.logger = logging.getLogger('osr_hid')
+        handler.jobs_manager = FakeManager(statuses)
+        handler.notification_checker = FakeChecker()
+        handler.subscriptions = {}
+        messages = []
+
+        async def write_message(message):
+            messages.append(message['status']['status'])
+
+        handler.write_message = write_message
+        asyncio.run(asyncio.wait_for(handler._watch('1', None), 1))
+        return handler.jobs_manager.watches, messages
+
+    def test_final_status_ends_subscription(self):
+        self.assertEqual(self.watch(['new', 'running', 'running', 'success']),
+                         (4, ['new', 'running', 'success']))
+
+    def test_not_found_job_is_watched_once(self):
+        self.assertEqual(self.watch(['notfound']), (2, ['notfound', 'notfound']))
+        # Job registered during the watch is followed.
+        self.assertEqual(self.watch(['notfound', 'running', 'success']), (3, ['notfound', 'running', 'success']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import threading
+import time
+import unittest
+
+from tools.loader_cache import LoaderCache
+
+
+class TestLoaderCache(unittest.TestCase):
+
+    def test_lru_by_size(self):
+        # Two lists of ten strings fit in, three don't.
+        cache = LoaderCache(max_size=1500)
+        for key in ('a', 'b', 'a', 'c'):
+            self.assertEqual(cache.get(key, lambda: [key] * 10), [key] * 10)
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['entries']), (1, 3, 1, 2))
+        self.assertLessEqual(stats['size'], 1500)
+        # b is the least recently used one.
+        self.assertEqual(cache.get('a', list), ['a'] * 10)
+        self.assertEqual(cache.get('b', list), [])
+        self.assertEqual(cache.get_stats()['hits'], 2)
+        # Too big data isn't cached.
+        cache.get('d', lambda: [0] * 1000)
+        cache.get('d', lambda: [0] * 1000)
+        self.assertEqual(cache.get_stats()['misses'], 6)
+
+    def test_single_flight(self):
+        cache = LoaderCache()
+        loads = []
+
+        def load():
+            loads.append(1)
+            time.sleep(0.1)
+            return [1, 2, 3]
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('key', load))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(results, [[1, 2, 3]] * 5)
+        self.assertEqual(cache.get_stats()['shared_loads'], 4)
+
+    def test_failed_load_is_not_cached(self):
+        cache = LoaderCache()
+
+        def fail():
+            raise KeyError('_time')
+
+        self.assertRaises(KeyError, cache.get, 'key', fail)
+        self.assertEqual(cache.get('key', lambda: [1]), [1])
+        self.assertEqual(cache.get_stats()['loading'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import asyncio
+import logging
+import unittest
+from types import SimpleNamespace
+
+from handlers.jobs.makejob import MakeJobs
+
+
+class TestMakeJobs(unittest.TestCase):
+
+    def post(self, body):
+        # Handler without connection, status and response are collected instead of being written.
+        handler = MakeJobs.__new__(MakeJobs)
+        handler.handler_id = 'test'
+        handler.logger = logging.getLogger('osr_hid')
+        handler.request = SimpleNamespace(body=body, remote_ip='127.0.0.1')
+        written = {'status': 200}
+        handler.set_status = lambda status: written.update(status=status)
+        handler.write = lambda response: written.update(response=response)
+        asyncio.run(handler.post())
+        return written
+
+    def test_malformed_body(self):
+        for body in (b'{"searches": [', b'{}', b'[]', b'{"searches": 1}', b'{"searches": ["| makeresults"]}'):
+            with self.subTest(body=body):
+                written = self.post(body)
+                self.assertEqual(written['status'], 400)
+                self.assertEqual(written['response']['status'], 'fail')
+                self.assertIn('Malformed request body', written['response']['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 import os.path
+import numpy as np
 from tools.timelines_builder import TimelinesBuilder, TimeIntervals
 from tools.timelines_loader import TimelinesLoader
 
@@ -89,3 +90,47 @@ class TestTimelines(unittest.TestCase):
           {'time': 1548979200.0, 'value': 1}, {'time': 1580515200.0, 'value': 4}]]
         self.assertListEqual(result, timelines)
 
+    def test_fractional_timestamps(self):
+        # 2020-02-29 23:59:59.5 UTC, a second before and the next minute as float, int and numpy timestamps.
+        data = np.array([1583020799.5, 1583020798, 1583020800.25])
+        timelines = self.builder.get_all_timelines(data)
+        self.assertListEqual(timelines, self.builder.get_all_timelines(data.tolist()))
+        self.assertListEqual(timelines[TimeIntervals.MINUTES], [{'time': 1583020740.0, 'value': 2},
+                                                                {'time': 1583020800.0, 'value': 1}])
+        self.assertListEqual(timelines[TimeIntervals.MONTHS], [{'time': 1580515200.0, 'value': 2},
+                                                               {'time': 1583020800.0, 'value': 1}])
+        self.assertListEqual(self.builder.get_days_timeline([]), [])
+
+    def test_timelines_from_minutes(self):
+        minutes, counts = self.builder.count_minutes(self.data)
+        self.assertListEqual(self.builder.get_all_timelines_from_minutes(minutes, counts), self.timelines)
+        # Monday 2022-02-07 00:00 UTC and the next minutes.
+        data = [1644192000 + 60 * i for i in range(20)] + [1644192000 - 1]
+        minutes, counts = self.builder.count_minutes(data)
+        self.assertListEqual(self.builder.get_timeline_from_minutes(minutes, counts, '5minutes'),
+                             [{'time': 1644191700.0, 'value': 1}] +
+                             [{'time': 1644192000.0 + 300 * i, 'value': 5} for i in range(4)])
+        self.assertListEqual(self.builder.get_timeline_from_minutes(minutes, counts, '15minutes'),
+                             [{'time': 1644191100.0, 'value': 1}, {'time': 1644192000.0, 'value': 15},
+                              {'time': 1644192900.0, 'value': 5}])
+        self.assertListEqual(self.builder.get_timeline_from_minutes(minutes, counts, 'weeks'),
+                             [{'time': 1644192000.0 - 7 * 86400, 'value': 1}, {'time': 1644192000.0, 'value': 20}])
+
+    def test_fitting_timeline(self):
+        minutes, counts = self.builder.count_minutes(self.data)
+        self.assertEqual(self.builder.get_fitting_timeline(minutes, counts, 105),
+                         ('minutes', self.timelines[TimeIntervals.MINUTES]))
+        # 105 minutes and 8 hours don't fit.
+        interval, timeline = self.builder.get_fitting_timeline(minutes, counts, 7)
+        self.assertEqual(interval, 'days')
+        self.assertListEqual(timeline, self.timelines[TimeIntervals.DAYS])
+        interval, timeline = self.builder.get_fitting_timeline(minutes, counts, 100, 'hours')
+        self.assertEqual(interval, 'hours')
+
+        # Months 2021-11, 2021-12, 2022-01 and 2022-02 are merged by 2 months from epoch.
+        self.assertEqual(self.builder.get_fitting_timeline(minutes, counts, 3)[0], 'weeks')
+        interval, timeline = self.builder.get_fitting_timeline(minutes, counts, 2)
+        self.assertEqual(interval, '2months')
+        self.assertListEqual(timeline, [{'time': 1635724800.0, 'value': 3}, {'time': 1640995200.0, 'value': 202}])
+        interval, timeline = self.builder.get_fitting_timeline(minutes, counts, 1)
+        self.assertEqual((interval, timeline), ('9months', [{'time': 1633046400.0, 'value': 205}]))
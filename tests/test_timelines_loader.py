@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from tools import timelines_loader
+from tools.loader_cache import LoaderCache
+from tools.timelines_loader import TimelinesLoader, read_times, MINUTES_FILE_NAME
+
+
+class TestTimelinesLoader(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'search_1.cache', 'data')
+        os.makedirs(path)
+        self.parts = {
+            # Blank line, _time as string and not the first field, the last line without line break.
+            'part-00000.json': '{"_time": 1650000000, "a": 1}\n\n{"a": "\\"_time\\": 5", "_time": "1650000060"}\n'
+                               '{"_time":1650000120.5}',
+            'part-00001.json': ''.join(f'{{"_time": {1650000000 + i}}}\n' for i in range(3000)),
+            'part-00002.json': '',
+        }
+        for file_name, body in self.parts.items():
+            with open(os.path.join(path, file_name), 'w') as fw:
+                fw.write(body)
+        self.path = path
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_read_times(self):
+        times = read_times(os.path.join(self.path, 'part-00000.json'))
+        np.testing.assert_array_equal(times, [1650000000, np.nan, 1650000060, 1650000120.5])
+
+    def test_load_data(self):
+        expected = np.array([1650000000, 1650000060, 1650000120.5] + [1650000000 + i for i in range(3000)])
+        for processes in ('1', '2'):
+            loader = TimelinesLoader({'path': self.tmp.name, 'loader_processes': processes}, {})
+            data = loader.load_data('1')
+            self.assertTrue(data.flags['C_CONTIGUOUS'])
+            np.testing.assert_array_equal(np.sort(data), np.sort(expected))
+
+    def test_read_parts_in_pool(self):
+        for n in range(3, 6):
+            with open(os.path.join(self.path, f'part-{n:05}.json'), 'w') as fw:
+                fw.writelines(f'{{"_time": {1660000000 + 1000 * n + i}, "n": {n}}}\n' for i in range(500))
+        loader = TimelinesLoader({'path': self.tmp.name, 'loader_processes': '2'}, {})
+        with mock.patch.object(timelines_loader, 'get_process_pool', wraps=timelines_loader.get_process_pool) as pool:
+            data = loader.load_data('1')
+        pool.assert_called_once_with(2)
+        # Parts read by workers are put in order of parts.
+        expected = TimelinesLoader({'path': self.tmp.name}, {}).load_data('1')
+        np.testing.assert_array_equal(data, expected)
+        self.assertEqual(len(data), 3003 + 3 * 500)
+
+    def test_missing_time(self):
+        with open(os.path.join(self.path, 'part-00002.json'), 'w') as fw:
+            fw.write('{"a": 1}\n')
+        self.assertRaises(KeyError, TimelinesLoader({'path': self.tmp.name}, {}).load_data, '1')
+
+    def test_load_minutes(self):
+        loader = TimelinesLoader({'path': self.tmp.name}, {})
+        minutes, counts = loader.load_minutes('1')
+        self.assertEqual(counts.sum(), 3003)
+        self.assertEqual(minutes[0], 1650000000)
+        self.assertTrue(os.path.exists(os.path.join(self.path, MINUTES_FILE_NAME)))
+
+        # Saved minutes are read without reading parts.
+        LoaderCache.shared().clear()
+        loader.load_data = None
+        saved_minutes, saved_counts = loader.load_minutes('1')
+        np.testing.assert_array_equal(saved_minutes, minutes)
+        np.testing.assert_array_equal(saved_counts, counts)
+
+
+if __name__ == '__main__':
+    unittest.main()